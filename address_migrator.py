@@ -0,0 +1,148 @@
+# 住所の一括移行
+# 旧形式の「顧客住所」（1つの文字列）しか持たない顧客・見積を一度だけ分割し、
+# 郵便番号・住所1・住所2 を書き戻す。移行後は表示・出力のたびに住所を分割せずに済む。
+# 郵便番号が見つからない・都道府県から始まらない住所は確実に分割できないため、
+# 一覧に表示して書き戻さない（--force 指定時は書き戻す）。
+#
+# 使い方:
+#     python address_migrator.py [--dry-run] [--force] [データフォルダ]
+#
+# 環境変数 SFA_STORAGE_BACKEND=sqlite の場合はアプリと同じくSQLiteのデータを移行する。
+import os
+import sys
+import json
+
+import storage_sqlite
+from data_version import bump_data_version
+from estimate_excel_writer import parse_address_with_confidence
+from list_journal import load_list, save_list
+from project_index import is_estimate_filename
+
+住所項目 = ("郵便番号", "住所1", "住所2")
+
+
+def needs_migration(record):
+    """旧形式の住所だけを持つレコードか（郵便番号・住所1・住所2 がすべて空で顧客住所がある）"""
+    if not isinstance(record, dict):
+        return False
+    if any(record.get(項目) for 項目 in 住所項目):
+        return False
+    return bool(str(record.get("顧客住所", "") or "").strip())
+
+
+def split_record_address(record):
+    """レコードの顧客住所を分割（戻り値: ({"郵便番号", "住所1", "住所2"}, 確実)）"""
+    郵便番号, 住所1, 住所2, 確実 = parse_address_with_confidence(record.get("顧客住所", ""))
+    return {"郵便番号": 郵便番号, "住所1": 住所1, "住所2": 住所2}, 確実
+
+
+def migrate_records(records, label, force=False):
+    """レコード一覧の住所を分割して書き込む（戻り値: (移行件数, [(ラベル, 顧客住所, 分割結果), ...])）"""
+    件数 = 0
+    要確認 = []
+    for record in records:
+        if not needs_migration(record):
+            continue
+        分割結果, 確実 = split_record_address(record)
+        if not 確実:
+            要確認.append((label(record), record.get("顧客住所", ""), 分割結果))
+            if not force:
+                continue
+        record.update(分割結果)
+        件数 += 1
+    return 件数, 要確認
+
+
+def _customer_label(customer):
+    return f"顧客 {customer.get('顧客会社名', '')} / {customer.get('顧客担当者', '')}"
+
+
+def _write_json(path, data):
+    """見積JSONを一時ファイル経由で書き込み"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2, default=str)
+    os.replace(tmp_path, path)
+
+
+def migrate_json(data_folder, dry_run=False, force=False):
+    """data/ の customers.json と見積JSONの住所を移行"""
+    合計件数 = 0
+    要確認一覧 = []
+
+    customers_path = os.path.join(data_folder, "customers.json")
+    customers = load_list(customers_path)
+    件数, 要確認 = migrate_records(customers, _customer_label, force)
+    if 件数 and not dry_run:
+        save_list(customers_path, customers)
+    合計件数 += 件数
+    要確認一覧 += 要確認
+
+    for filename in sorted(os.listdir(data_folder)):
+        if not is_estimate_filename(filename):
+            continue
+        path = os.path.join(data_folder, filename)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            要確認一覧.append((f"見積 {filename}", "", f"読み込みエラー: {e}"))
+            continue
+        件数, 要確認 = migrate_records([data], lambda _: f"見積 {filename}", force)
+        if 件数 and not dry_run:
+            _write_json(path, data)
+        合計件数 += 件数
+        要確認一覧 += 要確認
+
+    return 合計件数, 要確認一覧
+
+
+def migrate_sqlite(db_path, dry_run=False, force=False):
+    """SQLiteの顧客・見積の住所を移行"""
+    合計件数 = 0
+    要確認一覧 = []
+
+    customers = storage_sqlite.load_customers(db_path)
+    件数, 要確認 = migrate_records(customers, _customer_label, force)
+    if 件数 and not dry_run:
+        storage_sqlite.save_customers(db_path, customers)
+    合計件数 += 件数
+    要確認一覧 += 要確認
+
+    サマリー一覧, _ = storage_sqlite.load_project_summaries(db_path)
+    for 見積No in sorted(サマリー一覧):
+        data = storage_sqlite.read_estimate(db_path, 見積No)
+        件数, 要確認 = migrate_records([data], lambda _: f"見積 {見積No}", force)
+        if 件数 and not dry_run:
+            storage_sqlite.write_estimate(db_path, 見積No, data)
+        合計件数 += 件数
+        要確認一覧 += 要確認
+
+    return 合計件数, 要確認一覧
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    options = {arg for arg in sys.argv[1:] if arg.startswith("--")}
+    if options - {"--dry-run", "--force"} or len(args) > 1:
+        print("使い方: python address_migrator.py [--dry-run] [--force] [データフォルダ]")
+        sys.exit(1)
+
+    data_folder = args[0] if args else "data"
+    dry_run = "--dry-run" in options
+    force = "--force" in options
+
+    if os.environ.get("SFA_STORAGE_BACKEND", "json").lower() == "sqlite":
+        db_path = os.environ.get("SFA_SQLITE_PATH", storage_sqlite.get_db_path(data_folder))
+        件数, 要確認一覧 = migrate_sqlite(db_path, dry_run, force)
+    else:
+        件数, 要確認一覧 = migrate_json(data_folder, dry_run, force)
+
+    if 件数 and not dry_run:
+        # 起動中のアプリのキャッシュにも反映
+        bump_data_version(data_folder)
+
+    for ラベル, 顧客住所, 分割結果 in 要確認一覧:
+        print(f"要確認: {ラベル}: {顧客住所!r} → {分割結果}")
+    見出し = "移行対象の住所" if dry_run else "住所を移行しました"
+    print(f"{見出し}: {件数}件（要確認: {len(要確認一覧)}件）")
@@ -7,6 +7,22 @@ import json
 import openpyxl
 import traceback
 from estimate_excel_writer import write_estimate_to_excel
+from project_index import load_project_index, upsert_project_summary, remove_project_summary, calculate_detail_totals, recalculate_detail_list
+from estimate_no_allocator import peek_estimate_no, reserve_estimate_no, get_max_sequence
+import storage_sqlite
+import search_index
+import product_catalog
+import price_history
+from customer_repository import get_customer_repository
+from list_journal import load_list, save_list, get_journal_path
+from data_version import get_data_version, bump_data_version
+from postal_index import lookup_address
+from bulk_export import make_export_filename, build_export_data, export_estimates_zip, uses_coefficient
+from product_classifier import (
+    classify_catalog, is_language_specified, is_translation_product, is_single_language_product,
+    is_management_fee_product, extract_base_product_and_language, extract_base_product_and_percentage,
+    extract_management_fee_percentage,
+)
 
 # ページ設定
 st.set_page_config(page_title="見積書作成アプリ", layout="wide")
@@ -17,6 +33,13 @@ ISSUER_LIST = ["須藤 竜平", "本間 清昭", "片岡 啓明", "青山 泰",
 EXCEL_FILENAME = "見積管理データ.xlsx"
 DATA_FOLDER = "data"
 
+# ストレージ設定（環境変数 SFA_STORAGE_BACKEND=sqlite でSQLiteに保存、既定はJSONファイル）
+STORAGE_BACKEND = os.environ.get("SFA_STORAGE_BACKEND", "json").lower()
+SQLITE_DB_PATH = os.environ.get("SFA_SQLITE_PATH", storage_sqlite.get_db_path(DATA_FOLDER))
+
+# 出力した見積書の控えを保存するフォルダ（未設定の場合はディスクに保存せずダウンロードのみ）
+EXPORT_ARCHIVE_FOLDER = os.environ.get("SFA_EXPORT_ARCHIVE_FOLDER", "")
+
 # セッション状態の初期化
 def init_session_state():
     """セッション状態を初期化"""
@@ -49,20 +72,23 @@ def init_session_state():
             st.session_state[key] = default
 
 # データ読み込み関数
-@st.cache_resource
-def load_data():
-    """JSONファイルからデータを読み込む"""
+@st.cache_data(max_entries=4, show_spinner=False)
+def load_data(データバージョン):
+    """JSONファイルからデータを読み込む（データバージョンが変わるまで再読み込みしない）"""
     try:
         # 顧客データの読み込み
-        顧客一覧 = load_customers_json()
+        顧客一覧 = get_customer_repo().all()
         顧客一覧_df = pd.DataFrame(顧客一覧) if 顧客一覧 else pd.DataFrame(columns=["顧客No", "顧客会社名", "顧客部署名", "顧客担当者", "顧客住所"])
         
         # 案件データの読み込み
-        案件一覧 = load_all_projects()
+        案件一覧, _ = load_all_projects()
         案件一覧_df = pd.DataFrame(案件一覧) if 案件一覧 else pd.DataFrame(columns=["見積No", "案件名", "顧客会社名", "顧客部署名", "顧客担当者", "発行日", "受注日", "納品日", "売上額", "仕入額", "粗利", "粗利率", "状況", "発行者名", "メモ"])
         
         # 商品データの読み込み
         品名一覧 = load_products_json()
+        
+        # 商品一覧の品名を先に分類しておく（明細入力では判定結果を引くだけにする）
+        classify_catalog(str(item.get("品名", "")) for item in 品名一覧)
         品名一覧_df = pd.DataFrame(品名一覧) if 品名一覧 else pd.DataFrame(columns=["品名", "単位", "単価", "備考"])
         
         return 顧客一覧_df, 案件一覧_df, 品名一覧_df
@@ -78,32 +104,139 @@ def create_empty_dataframes():
     品名一覧 = pd.DataFrame(columns=["品名", "単位", "単価", "備考"])
     return 顧客一覧, 案件一覧, 品名一覧
 
+def current_data_version():
+    """共有のデータバージョンを取得（いずれかのセッションが保存するたびに増える）"""
+    return get_data_version(DATA_FOLDER)
+
+def notify_data_changed():
+    """データの保存を他のセッションのキャッシュに通知"""
+    bump_data_version(DATA_FOLDER)
+
+# 見積データの読み書き（ストレージ切り替え対応）
+def read_estimate_data(見積No):
+    """見積データを読み込む（存在しない場合はNone）"""
+    if STORAGE_BACKEND == "sqlite":
+        return storage_sqlite.read_estimate(SQLITE_DB_PATH, 見積No)
+    
+    ファイルパス = os.path.join(DATA_FOLDER, f"{見積No}.json")
+    if not os.path.exists(ファイルパス):
+        return None
+    with open(ファイルパス, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def write_estimate_data(見積No, 保存データ):
+    """見積データを保存（案件サマリー・検索インデックスも更新）"""
+    if STORAGE_BACKEND == "sqlite":
+        シグネチャ = storage_sqlite.write_estimate(SQLITE_DB_PATH, 見積No, 保存データ)
+    else:
+        os.makedirs(DATA_FOLDER, exist_ok=True)
+        ファイルパス = os.path.join(DATA_FOLDER, f"{見積No}.json")
+        with open(ファイルパス, "w", encoding="utf-8") as f:
+            json.dump(保存データ, f, ensure_ascii=False, indent=2, default=str)  # default=strを追加
+        
+        # 案件サマリーインデックスを更新
+        シグネチャ = upsert_project_summary(DATA_FOLDER, 保存データ, f"{見積No}.json")["シグネチャ"]
+    
+    # 全文検索インデックス・品名の使用回数を更新
+    search_index.upsert_document(DATA_FOLDER, 見積No, 保存データ, シグネチャ)
+    product_catalog.update_usage(DATA_FOLDER, 見積No, 保存データ, シグネチャ)
+    price_history.update_estimate(DATA_FOLDER, 見積No, 保存データ, シグネチャ)
+    notify_data_changed()
+
+def delete_estimate_data(見積No):
+    """見積データを削除（削除した場合True、存在しない場合False）"""
+    if STORAGE_BACKEND == "sqlite":
+        削除 = storage_sqlite.delete_estimate(SQLITE_DB_PATH, 見積No)
+    else:
+        ファイルパス = os.path.join(DATA_FOLDER, f"{見積No}.json")
+        削除 = os.path.exists(ファイルパス)
+        if 削除:
+            os.remove(ファイルパス)
+            remove_project_summary(DATA_FOLDER, 見積No)
+    
+    if 削除:
+        search_index.remove_document(DATA_FOLDER, 見積No)
+        product_catalog.remove_usage(DATA_FOLDER, 見積No)
+        price_history.remove_estimate(DATA_FOLDER, 見積No)
+        notify_data_changed()
+    return 削除
+
+def estimate_data_exists(見積No):
+    """見積データが存在するかチェック"""
+    if STORAGE_BACKEND == "sqlite":
+        return storage_sqlite.estimate_exists(SQLITE_DB_PATH, 見積No)
+    return os.path.exists(os.path.join(DATA_FOLDER, f"{見積No}.json"))
+
+def load_project_summaries():
+    """案件サマリーを取得（戻り値: (見積No → サマリー, [(ファイル名, エラー), ...])）
+
+    変更されたファイルだけを読み込み直すため、アプリ外での変更も毎回反映される
+    """
+    if STORAGE_BACKEND == "sqlite":
+        return storage_sqlite.load_project_summaries(SQLITE_DB_PATH)
+    # JSON形式でデータフォルダがまだない場合は案件なし（SQLiteのDBファイルは別の場所にもできる）
+    if not os.path.exists(DATA_FOLDER):
+        return {}, []
+    return load_project_index(DATA_FOLDER)
+
+def search_estimates(検索キーワード):
+    """キーワードで見積を全文検索（戻り値: 見積キー → スコア）"""
+    サマリー一覧, _ = load_project_summaries()
+    シグネチャ一覧 = {キー: サマリー.get("シグネチャ") for キー, サマリー in サマリー一覧.items()}
+    return search_index.search(DATA_FOLDER, 検索キーワード, シグネチャ一覧, read_estimate_data)
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def get_product_catalog(データバージョン):
+    """共有の商品カタログを取得（品名の索引と使用回数・データバージョンが変わるまで作り直さない）"""
+    サマリー一覧, _ = load_project_summaries()
+    シグネチャ一覧 = {キー: サマリー.get("シグネチャ") for キー, サマリー in サマリー一覧.items()}
+    使用回数 = product_catalog.load_usage_counts(DATA_FOLDER, シグネチャ一覧, read_estimate_data)
+    return product_catalog.ProductCatalog(load_products_json(), 使用回数)
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def get_price_table(データバージョン):
+    """共有の過去単価表を取得（データバージョンが変わるまで作り直さない）"""
+    サマリー一覧, _ = load_project_summaries()
+    シグネチャ一覧 = {キー: サマリー.get("シグネチャ") for キー, サマリー in サマリー一覧.items()}
+    return price_history.load_price_table(DATA_FOLDER, シグネチャ一覧, read_estimate_data)
+
+def peek_new_estimate_no(発行日):
+    """次の見積番号を取得（採番はしない・表示や提案用・発行日がNoneの場合は空文字列）"""
+    if STORAGE_BACKEND == "sqlite":
+        return storage_sqlite.peek_estimate_no(SQLITE_DB_PATH, 発行日)
+    return peek_estimate_no(DATA_FOLDER, 発行日)
+
+def reserve_new_estimate_no(見積No):
+    """見積番号を確定（他のセッションが先に使った場合は次の番号・戻り値: 確定した見積番号）"""
+    if STORAGE_BACKEND == "sqlite":
+        return storage_sqlite.reserve_estimate_no(SQLITE_DB_PATH, 見積No)
+    return reserve_estimate_no(DATA_FOLDER, 見積No)
+
 # JSON関連の関数
 def save_meisai_as_json(見積No, data):
     """明細データをJSONファイルに保存（数値フィールド修正版）"""
     try:
-        os.makedirs(DATA_FOLDER, exist_ok=True)
-        ファイルパス = os.path.join(DATA_FOLDER, f"{見積No}.json")
+        # このセッションで読み込み・保存していない見積はここで見積番号を確定
+        # （表示中の番号が他のセッションで使われた場合は次の番号・他のセッションの見積を上書きしない）
+        if 見積No and st.session_state.get("保存済み見積No") != 見積No:
+            確定見積No = reserve_new_estimate_no(見積No)
+            if 確定見積No != 見積No:
+                st.info(f"見積No. {見積No} は他の案件で使用されたため、{確定見積No} で保存します")
+                見積No = 確定見積No
+            st.session_state["見積No"] = 見積No
         
         # 顧客担当者名のスペースを正規化（半角スペースに統一）
         顧客担当者 = st.session_state.get("選択された顧客担当者", "")
         正規化顧客担当者 = 顧客担当者.replace("　", " ").strip()
         
-        # 顧客住所を取得（顧客一覧から検索）
-        顧客住所 = ""
-        try:
-            顧客一覧, _, _ = load_excel_data(EXCEL_FILENAME)
-            顧客会社名 = st.session_state.get("選択された顧客会社名", "")
-            if 顧客会社名 and not 顧客一覧.empty:
-                該当顧客 = 顧客一覧[顧客一覧["顧客会社名"] == 顧客会社名]
-                if not 該当顧客.empty:
-                    顧客住所 = 該当顧客.iloc[0].get("顧客住所", "")
-        except:
-            pass
+        # 顧客住所は分割済みの形式（郵便番号・住所1・住所2）で保存（出力時に住所を分割し直さない）
+        郵便番号 = str(st.session_state.get("選択された郵便番号", "") or "")
+        住所1 = str(st.session_state.get("選択された住所1", "") or "")
+        住所2 = str(st.session_state.get("選択された住所2", "") or "")
+        顧客住所 = st.session_state.get("選択された顧客住所", "") or f"{郵便番号} {住所1} {住所2}".strip()
         
-        # 明細から合計金額を計算（分類項目除外・数値チェック強化）
+        # 明細リストを取得（合計金額は正規化後にまとめて計算）
         明細リスト = data.get("明細リスト", st.session_state.get("明細リスト", []))
-        明細合計 = 0
         
         # 明細リストの数値フィールドを正規化
         正規化明細リスト = []
@@ -131,9 +264,6 @@ def save_meisai_as_json(見積No, data):
                     正規化item["金額"] = float(item.get("金額", 0)) if item.get("金額") not in ["", None] else 0
                 except (ValueError, TypeError):
                     正規化item["金額"] = 0
-                
-                # 明細合計に加算（分類項目は除外）
-                明細合計 += 正規化item["金額"]
             
             # その他のフィールドも文字列として確実に保存
             正規化item["品名"] = str(item.get("品名", ""))
@@ -144,6 +274,11 @@ def save_meisai_as_json(見積No, data):
             
             正規化明細リスト.append(正規化item)
         
+        # 管理費を再計算し、明細合計・部署別集計・明細件数も保存時に計算しておく（一覧表示で明細を集計し直さない）
+        明細合計, 部署別集計, 明細件数 = recalculate_detail_list(
+            正規化明細リスト, str(st.session_state.get("担当部署", "")), 係数機能使用=bool(st.session_state.get("係数機能使用", False))
+        )
+        
         # 売上額自動更新が有効な場合は明細合計を使用
         if st.session_state.get("売上額自動更新", True):
             売上額 = 明細合計
@@ -169,10 +304,16 @@ def save_meisai_as_json(見積No, data):
             "顧客部署名": str(st.session_state.get("選択された顧客部署名", "")),
             "顧客担当者": 正規化顧客担当者,
             "顧客住所": str(顧客住所),
+            "郵便番号": 郵便番号,
+            "住所1": 住所1,
+            "住所2": 住所2,
             "発行者名": str(st.session_state.get("発行者名", "")),
             "担当部署": str(st.session_state.get("担当部署", "")),
             "備考": str(data.get("備考", st.session_state.get("備考", ""))),
             "明細リスト": 正規化明細リスト,  # 正規化済みの明細リスト
+            "明細合計": 明細合計,
+            "部署別集計": 部署別集計,
+            "明細件数": 明細件数,
             "状況": str(st.session_state.get("状況", "見積中")),
             "受注日": str(st.session_state.get("受注日", "") or ""),
             "納品日": str(st.session_state.get("納品日", "") or ""),
@@ -180,7 +321,8 @@ def save_meisai_as_json(見積No, data):
             "仕入額": int(仕入額),
             "粗利": int(粗利),
             "粗利率": float(粗利率),
-            "メモ": str(st.session_state.get("メモ", ""))
+            "メモ": str(st.session_state.get("メモ", "")),
+            "係数機能使用": bool(st.session_state.get("係数機能使用", False))
         }
         
         # 上書き処理があれば先に実行
@@ -190,11 +332,9 @@ def save_meisai_as_json(見積No, data):
             新見積No = 上書き処理["新見積No"]
             
             if 旧見積No != 新見積No:
-                # 旧ファイルを削除
-                旧ファイルパス = os.path.join(DATA_FOLDER, f"{旧見積No}.json")
+                # 旧データを削除
                 try:
-                    if os.path.exists(旧ファイルパス):
-                        os.remove(旧ファイルパス)
+                    if delete_estimate_data(旧見積No):
                         st.success(f"旧データ（{旧見積No}）を削除しました")
                     
                     # 上書き処理をクリア
@@ -203,9 +343,9 @@ def save_meisai_as_json(見積No, data):
                 except Exception as e:
                     st.error(f"旧ファイル削除エラー: {e}")
         
-        # 新しいファイルを保存
-        with open(ファイルパス, "w", encoding="utf-8") as f:
-            json.dump(保存データ, f, ensure_ascii=False, indent=2, default=str)  # default=strを追加
+        # 新しいデータを保存
+        write_estimate_data(見積No, 保存データ)
+        st.session_state["保存済み見積No"] = 見積No
         
         return True
         
@@ -223,14 +363,11 @@ def safe_date(data, key):
 def auto_load_json_by_estimate_no(見積No, auto_rerun=True): 
     """見積番号に対応するJSONファイルを自動読み込み（数値変換強化版）"""
     try:
-        ファイルパス = os.path.join(DATA_FOLDER, f"{見積No}.json")
+        data = read_estimate_data(見積No)
         
-        if not os.path.exists(ファイルパス):
-            st.error(f"JSONファイルが見つかりません: {ファイルパス}")
+        if data is None:
+            st.error(f"見積データが見つかりません: {見積No}")
             return False
-
-        with open(ファイルパス, "r", encoding="utf-8") as f:
-            data = json.load(f)
         
         if not isinstance(data, dict):
             st.error("JSONファイルのデータ形式が正しくありません")
@@ -302,12 +439,16 @@ def auto_load_json_by_estimate_no(見積No, auto_rerun=True):
 
         # 必須情報のセッション登録
         st.session_state["見積No"] = data.get("見積No", "")
+        st.session_state["保存済み見積No"] = st.session_state["見積No"]  # 読み込んだ見積は採番せずに上書き保存
         st.session_state["案件名"] = data.get("案件名", "")
         st.session_state["発行日"] = safe_date(data, "発行日") or datetime.date.today()
         st.session_state["選択された顧客会社名"] = data.get("顧客会社名", "")
         st.session_state["選択された顧客部署名"] = data.get("顧客部署名", "")
         st.session_state["選択された顧客担当者"] = data.get("顧客担当者", "")
         st.session_state["選択された顧客住所"] = data.get("顧客住所", "")
+        st.session_state["選択された郵便番号"] = data.get("郵便番号", "")
+        st.session_state["選択された住所1"] = data.get("住所1", "")
+        st.session_state["選択された住所2"] = data.get("住所2", "")
         st.session_state["発行者名"] = issuer
         st.session_state["担当部署"] = data.get("担当部署", "")
         st.session_state["明細リスト"] = 修正済み明細リスト  # 修正済みの明細リストを使用
@@ -320,6 +461,7 @@ def auto_load_json_by_estimate_no(見積No, auto_rerun=True):
         st.session_state["受注日"] = safe_date(data, "受注日")
         st.session_state["納品日"] = safe_date(data, "納品日")
         st.session_state["メモ"] = data.get("メモ", "")
+        st.session_state["係数機能使用"] = uses_coefficient(data)
         
         # auto_rerunパラメータで再実行を制御
         if auto_rerun:
@@ -367,100 +509,33 @@ def save_to_excel(data, sheet_name, filename=EXCEL_FILENAME):
 
 # ユーティリティ関数
 def count_same_date_projects_from_json(発行日_str):
-    """JSONファイルから同日案件数をカウント（修正版）"""
+    """JSONファイルから同日案件数をカウント（サマリーキャッシュ対応版）"""
     count = 0
-    if os.path.exists(DATA_FOLDER):
-        try:
-            json_files = [f for f in os.listdir(DATA_FOLDER) if f.endswith('.json')]
-            for file in json_files:
-                try:
-                    ファイルパス = os.path.join(DATA_FOLDER, file)
-                    with open(ファイルパス, "r", encoding="utf-8") as f:
-                        data = json.load(f)
-                    
-                    if isinstance(data, dict):
-                        # ファイル内の発行日を取得
-                        file_発行日 = data.get("発行日", "")
-                        
-                        # 日付の正規化（異なる形式に対応）
-                        if isinstance(file_発行日, str):
-                            # "2025-03-15" 形式の場合
-                            if len(file_発行日) == 10 and "-" in file_発行日:
-                                try:
-                                    file_date = datetime.datetime.strptime(file_発行日, "%Y-%m-%d").date()
-                                    file_発行日_str = file_date.strftime('%Y%m%d')
-                                except:
-                                    continue
-                            # "20250315" 形式の場合
-                            elif len(file_発行日) == 8 and file_発行日.isdigit():
-                                file_発行日_str = file_発行日
-                            else:
-                                continue
-                        else:
-                            continue
-                        
-                        # 同じ発行日かチェック
-                        if file_発行日_str == 発行日_str:
-                            count += 1
-                            
-                except Exception as e:
-                    # 個別ファイルのエラーは無視して継続
-                    continue
-        except Exception as e:
-            # ディレクトリアクセスエラーも無視
-            pass
+    try:
+        サマリー一覧, _ = load_project_summaries()
+        for サマリー in サマリー一覧.values():
+            # 発行日はサマリー作成時に YYYY-MM-DD 形式へ正規化済み
+            if サマリー.get("発行日", "").replace("-", "") == 発行日_str:
+                count += 1
+    except Exception:
+        # ディレクトリアクセスエラーは無視
+        pass
     
     return count
 
 def generate_estimate_no(発行日):
-    """見積番号を生成（None対応版）"""
+    """見積番号を生成（連番テーブル参照版・確定は初回保存時）"""
     # 発行日がNoneの場合は空文字列を返す
-    if 発行日 is None:
-        return ""
-    
-    発行日_str = 発行日.strftime('%Y%m%d')
-    
-    # 同日の既存案件数を正確にカウント
-    同日案件数 = count_same_date_projects_from_json(発行日_str)
-    
-    # 連番を生成（既存案件数 + 1）
-    連番 = 同日案件数 + 1
-    
-    # 見積番号を生成
-    見積No = f"{発行日_str}{str(連番).zfill(3)}"
-    
-    return 見積No
+    return peek_new_estimate_no(発行日)
 
 def check_estimate_no_exists(見積No):
     """見積番号が既に存在するかチェック"""
-    ファイルパス = os.path.join(DATA_FOLDER, f"{見積No}.json")
-    return os.path.exists(ファイルパス)
+    return estimate_data_exists(見積No)
 
 def generate_unique_estimate_no(発行日):
-    """重複しない見積番号を生成（None対応版）"""
-    # 発行日がNoneの場合は空文字列を返す
-    if 発行日 is None:
-        return ""
-    
-    発行日_str = 発行日.strftime('%Y%m%d')
-    
-    # 連番を1から開始して、重複しない番号を見つける
-    連番 = 1
-    while True:
-        見積No = f"{発行日_str}{str(連番).zfill(3)}"
-        
-        # この番号が既に存在するかチェック
-        if not check_estimate_no_exists(見積No):
-            return 見積No
-        
-        連番 += 1
-        
-        # 安全装置（無限ループ防止）
-        if 連番 > 999:
-            # 999を超えた場合はタイムスタンプを追加
-            import time
-            timestamp = str(int(time.time()))[-3:]  # 末尾3桁
-            return f"{発行日_str}{timestamp}"
+    """重複しない見積番号を生成（連番テーブル参照版・確定は初回保存時）"""
+    # 既存ファイルとの重複は回避済み（保存までに他のセッションが使った場合は保存時に振り直す）
+    return peek_new_estimate_no(発行日)
 
 def set_customer_selection(顧客会社名, 顧客部署名, 顧客担当者, 郵便番号, 住所1, 住所2):
     """顧客選択を設定（住所細分化対応・修正版）"""
@@ -488,7 +563,7 @@ def clear_customer_session():
         "入力中_顧客担当者", "入力中_顧客部署名", 
         "入力中_郵便番号", "入力中_住所1", "入力中_住所2", "入力中_顧客住所",
         # 補完・編集関連
-        "住所補完済み", "編集中顧客"
+        "住所補完済み", "郵便番号補完_郵便番号", "郵便番号補完_住所1", "編集中顧客"
     ]
     
     for key in keys_to_clear:
@@ -503,20 +578,30 @@ def clear_customer_input_session():
         "入力中_顧客担当者", "入力中_顧客部署名", 
         "入力中_郵便番号", "入力中_住所1", "入力中_住所2", "入力中_顧客住所",
         # 補完フラグ
-        "住所補完済み"
+        "住所補完済み", "郵便番号補完_郵便番号", "郵便番号補完_住所1"
     ]
     
     for key in input_keys_to_clear:
         if key in st.session_state:
             del st.session_state[key]
 
+def lookup_postal_address(郵便番号):
+    """郵便番号辞書から住所（都道府県＋市区町村＋町域）を取得（見つからない・辞書がない場合は空文字列）"""
+    try:
+        住所 = lookup_address(DATA_FOLDER, 郵便番号)
+    except Exception:
+        return ""
+    if not 住所:
+        return ""
+    return f"{住所['都道府県']}{住所['市区町村']}{住所['町域']}"
+
 # タブ1: 顧客情報入力
 def render_customer_tab(顧客一覧_df):
     """顧客情報入力タブを表示（JSONデータ対応修正版）"""
     st.header("② 顧客情報を入力")
     
-    # JSONから最新の顧客データを読み込み
-    最新顧客データ = load_customers_json()
+    # 最新の顧客データを取得（変更がなければ読み込み済みのデータを共有）
+    最新顧客データ = get_customer_repo().all()
     
     # DataFrameに変換（既存コードとの互換性のため）
     if 最新顧客データ:
@@ -765,6 +850,21 @@ def render_customer_tab(顧客一覧_df):
             key="郵便番号入力"
         )
         st.session_state["入力中_郵便番号"] = 郵便番号
+        
+        # 7桁の郵便番号が入力されたら郵便番号辞書から住所1を補完
+        郵便番号補完住所 = lookup_postal_address(郵便番号)
+        if 郵便番号補完住所:
+            st.caption(f"〒 {郵便番号補完住所}")
+    
+    if 郵便番号補完住所 and st.session_state.get("郵便番号補完_郵便番号") != 郵便番号:
+        現在の住所1 = st.session_state.get("入力中_住所1", 初期_住所1)
+        # 手入力した住所1は上書きしない（空欄または前回の補完結果のままの場合のみ補完）
+        if not 現在の住所1 or 現在の住所1 == st.session_state.get("郵便番号補完_住所1"):
+            st.session_state["入力中_住所1"] = 郵便番号補完住所
+            st.session_state["郵便番号補完_住所1"] = 郵便番号補完住所
+            # 入力欄を補完後の値で作り直す
+            st.session_state.pop("住所1入力", None)
+        st.session_state["郵便番号補完_郵便番号"] = 郵便番号
     
     with col2:
         住所1 = st.text_input(
@@ -914,51 +1014,42 @@ def register_customer(顧客一覧_df, 顧客会社名, 顧客部署名, 顧客
 def update_customer_in_json(元顧客データ, 顧客会社名, 顧客部署名, 顧客担当者, 郵便番号, 住所1, 住所2, 同一会社住所更新=False):
     """顧客情報をJSONで更新（同一会社住所一括更新対応）"""
     try:
-        customers = load_customers_json()
+        顧客リポジトリ = get_customer_repo()
+        customers = 顧客リポジトリ.all()
         
-        # 元の顧客データを検索
+        # 元の顧客データを検索（インデックスで位置を取得）
         updated_count = 0
-        for i, customer in enumerate(customers):
-            if (customer.get("顧客会社名") == 元顧客データ["顧客会社名"] and 
-                customer.get("顧客部署名") == 元顧客データ.get("顧客部署名", "") and 
-                customer.get("顧客担当者") == 元顧客データ["顧客担当者"]):
-                
-                # 重複チェック（自分以外）
-                if 顧客会社名 != 元顧客データ["顧客会社名"] or 顧客担当者 != 元顧客データ["顧客担当者"]:
-                    for j, other_customer in enumerate(customers):
-                        if (i != j and 
-                            other_customer.get("顧客会社名") == 顧客会社名 and 
-                            other_customer.get("顧客部署名") == 顧客部署名 and 
-                            other_customer.get("顧客担当者") == 顧客担当者):
-                            return False, "同じ顧客情報が既に存在します"
-                
-                # 会社名が変更された場合の顧客No再計算
-                if 顧客会社名 != 元顧客データ["顧客会社名"]:
-                    同一会社の顧客 = [c for c in customers if c.get("顧客会社名") == 顧客会社名 and customers.index(c) != i]
-                    if 同一会社の顧客:
-                        顧客No = 同一会社の顧客[0].get("顧客No", 1)
-                    else:
-                        existing_companies = list(set([c.get("顧客会社名") for c in customers if customers.index(c) != i]))
-                        顧客No = len(existing_companies) + 1
-                else:
-                    顧客No = customer.get("顧客No", 1)
-                
-                # 顧客情報を更新（住所細分化対応）
-                customers[i]["顧客No"] = 顧客No
-                customers[i]["顧客会社名"] = 顧客会社名
-                customers[i]["顧客部署名"] = 顧客部署名
-                customers[i]["顧客担当者"] = 顧客担当者
-                customers[i]["郵便番号"] = 郵便番号
-                customers[i]["住所1"] = 住所1
-                customers[i]["住所2"] = 住所2
-                customers[i]["更新日"] = datetime.date.today().strftime("%Y-%m-%d")
-                
-                # 旧住所フィールドも新住所で更新（互換性のため）
-                統合住所 = f"{郵便番号} {住所1} {住所2}".strip()
-                customers[i]["顧客住所"] = 統合住所
-                
-                updated_count += 1
-                break
+        i = 顧客リポジトリ.position(元顧客データ["顧客会社名"], 元顧客データ.get("顧客部署名", ""), 元顧客データ["顧客担当者"])
+        if i is not None:
+            customer = customers[i]
+            # 重複チェック（自分以外）
+            if 顧客会社名 != 元顧客データ["顧客会社名"] or 顧客担当者 != 元顧客データ["顧客担当者"]:
+                if 顧客リポジトリ.position(顧客会社名, 顧客部署名, 顧客担当者) not in (None, i):
+                    return False, "同じ顧客情報が既に存在します"
+            
+            # 会社名が変更された場合の顧客No再計算
+            if 顧客会社名 != 元顧客データ["顧客会社名"]:
+                顧客No = 顧客リポジトリ.customer_no_for_company(顧客会社名)
+                if 顧客No is None:
+                    顧客No = 顧客リポジトリ.next_customer_no(移動元会社名=元顧客データ["顧客会社名"])
+            else:
+                顧客No = customer.get("顧客No", 1)
+            
+            # 顧客情報を更新（住所細分化対応）
+            customers[i]["顧客No"] = 顧客No
+            customers[i]["顧客会社名"] = 顧客会社名
+            customers[i]["顧客部署名"] = 顧客部署名
+            customers[i]["顧客担当者"] = 顧客担当者
+            customers[i]["郵便番号"] = 郵便番号
+            customers[i]["住所1"] = 住所1
+            customers[i]["住所2"] = 住所2
+            customers[i]["更新日"] = datetime.date.today().strftime("%Y-%m-%d")
+            
+            # 旧住所フィールドも新住所で更新（互換性のため）
+            統合住所 = f"{郵便番号} {住所1} {住所2}".strip()
+            customers[i]["顧客住所"] = 統合住所
+            
+            updated_count += 1
         
         # 同一会社住所一括更新の処理
         if 同一会社住所更新 and updated_count > 0:
@@ -1003,52 +1094,45 @@ def search_json_projects(顧客会社名, 顧客部署名, 顧客担当者):
         return
     
     try:
-        json_files = [f for f in os.listdir(DATA_FOLDER) if f.endswith('.json')]
+        if STORAGE_BACKEND == "sqlite":
+            # 顧客会社名・担当者のインデックスで絞り込んだサマリーを使用
+            サマリー一覧 = {
+                サマリー["見積No"]: サマリー
+                for サマリー in storage_sqlite.search_estimates_by_customer(SQLITE_DB_PATH, 顧客会社名, 顧客担当者)
+            }
+        else:
+            # 変更のあったファイルだけ再読み込みされたサマリーを使用
+            サマリー一覧, _ = load_project_index(DATA_FOLDER)
     except Exception:
         st.info("データフォルダの読み込みに失敗しました。新規入力を選択してください。")
         return
     
-    if not json_files:
+    if not サマリー一覧:
         st.info("該当する案件がありません。新規入力を選択してください。")
         return
     
-    # JSON検索処理
-    for file in json_files:
-        try:
-            ファイルパス = os.path.join(DATA_FOLDER, file)
-            with open(ファイルパス, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            
-            if isinstance(data, dict):
-                # 顧客情報の取得と正規化
-                file_顧客会社名 = data.get("顧客会社名", "").strip()
-                file_顧客担当者 = data.get("顧客担当者", "").strip()
-                
-                # スペースを除去して比較
-                入力_顧客会社名_clean = 顧客会社名.replace(" ", "").replace("　", "")
-                入力_顧客担当者_clean = 顧客担当者.replace(" ", "").replace("　", "")
-                file_顧客会社名_clean = file_顧客会社名.replace(" ", "").replace("　", "")
-                file_顧客担当者_clean = file_顧客担当者.replace(" ", "").replace("　", "")
-                
-                # 一致判定
-                会社一致 = file_顧客会社名_clean == 入力_顧客会社名_clean
-                担当者一致 = file_顧客担当者_clean == 入力_顧客担当者_clean
-                
-                if 会社一致 and 担当者一致:
-                    # 明細から合計金額を計算
-                    明細合計 = sum(item.get("金額", 0) for item in data.get("明細リスト", []))
-                    売上額 = data.get("売上額", 0) if data.get("売上額", 0) > 0 else 明細合計
-                    
-                    該当案件リスト.append({
-                        "見積No": data.get("見積No", ""),
-                        "案件名": data.get("案件名", "案件名未設定"),
-                        "発行日": data.get("発行日", ""),
-                        "状況": data.get("状況", "見積中"),
-                        "売上額": 売上額
-                    })
-                    
-        except Exception as e:
-            continue
+    # スペースを除去して比較
+    入力_顧客会社名_clean = 顧客会社名.replace(" ", "").replace("　", "")
+    入力_顧客担当者_clean = 顧客担当者.replace(" ", "").replace("　", "")
+    
+    # サマリー検索処理
+    for サマリー in サマリー一覧.values():
+        # 顧客情報の取得と正規化
+        file_顧客会社名_clean = サマリー.get("顧客会社名", "").strip().replace(" ", "").replace("　", "")
+        file_顧客担当者_clean = サマリー.get("顧客担当者", "").strip().replace(" ", "").replace("　", "")
+        
+        # 一致判定
+        会社一致 = file_顧客会社名_clean == 入力_顧客会社名_clean
+        担当者一致 = file_顧客担当者_clean == 入力_顧客担当者_clean
+        
+        if 会社一致 and 担当者一致:
+            該当案件リスト.append({
+                "見積No": サマリー.get("見積No", ""),
+                "案件名": サマリー.get("案件名", "案件名未設定"),
+                "発行日": サマリー.get("発行日", ""),
+                "状況": サマリー.get("状況", "見積中"),
+                "売上額": サマリー.get("売上額", 0)
+            })
     
     # 結果の表示
     if not 該当案件リスト:
@@ -1148,94 +1232,24 @@ def render_project_tab():
     render_common_project_inputs()
 
 def get_max_sequence_for_date(発行日_str):
-    """指定日付の既存見積番号から最大連番を取得"""
-    max_sequence = 0
-    
-    if not os.path.exists(DATA_FOLDER):
-        return max_sequence
-    
+    """指定日付の最終連番を取得（連番テーブル参照版）"""
     try:
-        json_files = [f for f in os.listdir(DATA_FOLDER) if f.endswith('.json')]
-        
-        for file in json_files:
-            try:
-                # ファイル名から見積番号を抽出（拡張子を除く）
-                見積No = file.replace('.json', '')
-                
-                # 見積番号が期待する形式かチェック（YYYYMMDDXXX）
-                if len(見積No) == 11 and 見積No[:8] == 発行日_str and 見積No[8:].isdigit():
-                    sequence = int(見積No[8:])  # 末尾3桁を取得
-                    max_sequence = max(max_sequence, sequence)
-                
-                # JSONファイル内の発行日もチェック（ファイル名と不一致の場合に備えて）
-                ファイルパス = os.path.join(DATA_FOLDER, file)
-                with open(ファイルパス, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                
-                if isinstance(data, dict):
-                    file_発行日 = data.get("発行日", "")
-                    file_見積No = data.get("見積No", "")
-                    
-                    # 発行日の正規化
-                    if isinstance(file_発行日, str):
-                        if len(file_発行日) == 10 and "-" in file_発行日:
-                            try:
-                                file_date = datetime.datetime.strptime(file_発行日, "%Y-%m-%d").date()
-                                file_発行日_str = file_date.strftime('%Y%m%d')
-                            except:
-                                continue
-                        elif len(file_発行日) == 8 and file_発行日.isdigit():
-                            file_発行日_str = file_発行日
-                        else:
-                            continue
-                        
-                        # 同じ発行日で見積番号が正しい形式の場合
-                        if (file_発行日_str == 発行日_str and 
-                            len(file_見積No) == 11 and 
-                            file_見積No[:8] == 発行日_str and 
-                            file_見積No[8:].isdigit()):
-                            sequence = int(file_見積No[8:])
-                            max_sequence = max(max_sequence, sequence)
-                            
-            except Exception:
-                continue
-                
+        if STORAGE_BACKEND == "sqlite":
+            return storage_sqlite.get_max_sequence(SQLITE_DB_PATH, 発行日_str)
+        return get_max_sequence(DATA_FOLDER, 発行日_str)
     except Exception:
-        pass
-    
-    return max_sequence
+        return 0
 
 def generate_next_estimate_no(発行日):
-    """指定日付の次の見積番号を生成（None対応版）"""
-    # 発行日がNoneの場合は空文字列を返す
-    if 発行日 is None:
-        return ""
-    
-    発行日_str = 発行日.strftime('%Y%m%d')
-    
-    # 既存の最大連番を取得
-    max_sequence = get_max_sequence_for_date(発行日_str)
-    
-    # 次の連番を生成
-    next_sequence = max_sequence + 1
-    
-    # 見積番号を生成
-    見積No = f"{発行日_str}{str(next_sequence).zfill(3)}"
-    
-    return 見積No
+    """指定日付の次の見積番号を生成（連番テーブル参照版・確定は初回保存時）"""
+    # 提案・表示のたびに採番すると取り消しや再生成で欠番になるため、ここでは採番しない
+    return peek_new_estimate_no(発行日)
 
 def update_estimate_number_and_overwrite(旧見積No, 新見積No):
     """見積番号を更新して旧ファイルを削除"""
     try:
-        旧ファイルパス = os.path.join(DATA_FOLDER, f"{旧見積No}.json")
-        新ファイルパス = os.path.join(DATA_FOLDER, f"{新見積No}.json")
-        
-        # 旧ファイルが存在する場合のみ処理
-        if os.path.exists(旧ファイルパス):
-            # 旧ファイルを削除
-            os.remove(旧ファイルパス)
-            return True
-        return False
+        # 旧データが存在する場合のみ削除
+        return delete_estimate_data(旧見積No)
         
     except Exception as e:
         st.error(f"ファイル更新エラー: {e}")
@@ -1693,55 +1707,6 @@ def render_common_project_inputs():
                 st.session_state["アクティブタブ"] = "④ 明細情報を入力"
                 st.rerun()
 
-def is_language_specified(product_name):
-    """商品名に言語が既に指定されているかを判定"""
-    import re
-    
-    # 括弧内の内容を抽出
-    pattern = r'（(.+?)）'
-    matches = re.findall(pattern, product_name)
-    
-    if not matches:
-        return False
-    
-    # 言語指定として有効な内容かチェック
-    language_patterns = [
-        # 翻訳言語パターン（○○→○○）
-        r'.+→.+',
-        # 単一言語パターン
-        r'^(英語|中国語|韓国語|タイ語|ベトナム語|フランス語|ドイツ語|スペイン語|ポルトガル語|イタリア語|ロシア語|アラビア語|ヒンディー語|インドネシア語|マレー語|日本語).*$'
-    ]
-    
-    for match in matches:
-        for pattern in language_patterns:
-            if re.match(pattern, match):
-                return True
-    
-    return False
-
-def is_translation_product(product_name):
-    """翻訳関連商品かどうかを判定（既に言語指定済みは除外）"""
-    # 既に言語が指定されている場合は対象外
-    if is_language_specified(product_name):
-        return False
-    
-    translation_keywords = [
-        "字幕翻訳", "文書翻訳", "通訳", "同時通訳", "逐次通訳"
-    ]
-    return any(keyword in product_name for keyword in translation_keywords)
-
-def is_single_language_product(product_name):
-    """単一言語指定商品かどうかを判定（既に言語指定済みは除外）"""
-    # 既に言語が指定されている場合は対象外
-    if is_language_specified(product_name):
-        return False
-    
-    single_language_keywords = [
-        "翻訳準備費", "言語監修", "編集者", "文字起こし", "SRT作成", 
-        "ナレーター派遣", "編集者派遣"
-    ]
-    return any(keyword in product_name for keyword in single_language_keywords)
-
 def get_language_options():
     """言語選択肢を取得（翻訳用：○○→○○形式）"""
     return {
@@ -1896,43 +1861,6 @@ def render_language_selection(base_product_name, current_language="", key_suffix
     else:
         return base_product_name, current_language
 
-def extract_base_product_and_language(product_name):
-    """商品名から基本商品名と言語情報を分離（翻訳・単一言語両対応）"""
-    import re
-    
-    # 言語パターンにマッチする場合
-    pattern = r'^(.+?)（(.+?)）$'
-    match = re.match(pattern, product_name)
-    
-    if match:
-        base_name = match.group(1)
-        language = match.group(2)
-        
-        # 翻訳言語として有効かチェック（○○→○○形式）
-        translation_language_options = get_language_options()
-        if language in translation_language_options or "→" in language:
-            return base_name, language
-        
-        # 単一言語として有効かチェック
-        single_language_options = get_single_language_options()
-        if language in single_language_options:
-            return base_name, language
-        
-        # その他のカスタム言語
-        return base_name, language
-    
-    # マッチしない場合は全体を基本商品名として扱う
-    return product_name, ""
-
-# この位置に追加（extract_base_product_and_language関数の直後）
-
-def is_management_fee_product(product_name):
-    """管理費関連商品かどうかを判定"""
-    management_fee_keywords = [
-        "管理費", "手数料", "事務手数料", "システム利用料", "処理手数料"
-    ]
-    return any(keyword in product_name for keyword in management_fee_keywords)
-
 def get_percentage_options():
     """％選択肢を取得"""
     return {
@@ -1999,21 +1927,15 @@ def render_percentage_selection(base_product_name, current_percentage="", key_su
     else:
         return base_product_name, current_percentage
 
-def extract_base_product_and_percentage(product_name):
-    """商品名から基本商品名と％情報を分離"""
-    import re
-    
-    # ％パターンにマッチする場合
-    pattern = r'^(.+?)（(.+?)%）$'
-    match = re.match(pattern, product_name)
-    
-    if match:
-        base_name = match.group(1)
-        percentage = match.group(2)
-        return base_name, percentage
-    
-    # マッチしない場合は全体を基本商品名として扱う
-    return product_name, ""
+def update_management_fee_percentage(明細):
+    """品名の％から管理費パーセンテージを設定し直す（品名が管理費（％指定）でなくなった場合は削除）"""
+    パーセンテージ = "" if 明細.get("分類", False) else extract_management_fee_percentage(明細.get("品名", ""))
+    if パーセンテージ:
+        明細["管理費パーセンテージ"] = パーセンテージ
+    else:
+        明細.pop("管理費パーセンテージ", None)
+        明細.pop("管理費ベース金額", None)
+    return パーセンテージ
 
 def calculate_management_fee_amount(明細リスト, current_index, percentage_str):
     """管理費商品の金額を計算（上位商品の合計×％・分類項目除外版）"""
@@ -2021,16 +1943,8 @@ def calculate_management_fee_amount(明細リスト, current_index, percentage_s
         # ％を数値に変換
         percentage = float(percentage_str)
         
-        # 現在の商品より上にある商品の合計を計算（分類項目は除外）
-        上位商品合計 = 0
-        for i in range(current_index):
-            if i < len(明細リスト):
-                item = 明細リスト[i]
-                # 分類項目でない場合のみ合計に含める
-                if not item.get("分類", False):
-                    金額 = item.get("金額", 0)
-                    if isinstance(金額, (int, float)):
-                        上位商品合計 += 金額
+        # 現在の商品より上にある商品の合計を計算（分類項目は除外・明細合計と同じ集計）
+        上位商品合計, _, _ = calculate_detail_totals(明細リスト[:current_index])
         
         # ％計算
         管理費金額 = int(上位商品合計 * percentage / 100)
@@ -2181,16 +2095,16 @@ def render_new_detail_form(品名一覧_df):
         
         st.divider()
     
-    # 商品選択と反映
-    最新商品データ = load_products_json()
-    品名候補 = ["（新規入力）"]
-    
-    if 最新商品データ:
-        try:
-            品名リスト = [商品.get("品名", "") for 商品 in 最新商品データ if 商品.get("品名")]
-            品名候補.extend(品名リスト)
-        except:
-            pass
+    # 商品選択と反映（商品カタログから使用回数の多い順に候補を表示）
+    商品カタログ = get_product_catalog(current_data_version())
+    品名検索 = st.text_input(
+        "🔍 品名で絞り込み",
+        key="新規品名検索",
+        placeholder="品名の一部を入力（よく使う商品から表示）"
+    )
+    品名候補 = ["（新規入力）"] + 商品カタログ.search(品名検索)
+    if 品名検索 and len(品名候補) == 1:
+        st.caption("該当する商品がありません")
 
     col1, col2 = st.columns([3, 1])
     
@@ -2199,14 +2113,10 @@ def render_new_detail_form(品名一覧_df):
     
     with col2:
         # 反映ボタン
-        反映可能 = 品名選択 != "（新規入力）" and 最新商品データ
+        反映可能 = 品名選択 != "（新規入力）" and len(商品カタログ) > 0
         if st.button("🔄 反映", disabled=not 反映可能, help="品名一覧の情報を下記フィールドに反映します", key="新規反映ボタン"):
             try:
-                該当商品 = None
-                for 商品 in 最新商品データ:
-                    if 商品.get("品名") == 品名選択:
-                        該当商品 = 商品
-                        break
+                該当商品 = 商品カタログ.get(品名選択)
                 
                 if 該当商品:
                     補完情報 = {}
@@ -2224,6 +2134,9 @@ def render_new_detail_form(品名一覧_df):
                     if 補完情報:
                         補完内容 = " | ".join([f"{k}: {v}" for k, v in 補完情報.items()])
                         st.success(f"🔄 品名一覧から情報を反映しました: {補完内容}")
+                        # 入力欄を反映後の値で作り直す
+                        for key in ["新規単位", "新規単価", "新規備考"]:
+                            st.session_state.pop(key, None)
                         st.rerun()
                     else:
                         st.warning("この品名には追加情報が登録されていません")
@@ -2232,6 +2145,10 @@ def render_new_detail_form(品名一覧_df):
             except Exception as e:
                 st.error(f"情報の反映中にエラーが発生しました: {e}")
 
+    # 過去の見積の単価から単価を提案（品名を選び直した時だけ単価欄に反映）
+    if 品名選択 != "（新規入力）":
+        render_price_suggestion(品名選択, 商品カタログ.get(品名選択) or {})
+
     # 基本品名の決定
     if 品名選択 == "（新規入力）":
         基本品名 = st.text_input("新しい品名を入力", key="新規品名入力")
@@ -2374,39 +2291,55 @@ def render_new_detail_form(品名一覧_df):
                 except Exception as e:
                     st.error(f"明細の追加中にエラーが発生しました: {e}")
 
-def render_detail_summary():
-    """明細合計と部署別集計の表示（分類項目除外版）"""
-    明細リスト = st.session_state["明細リスト"]
+def render_price_suggestion(品名, 商品):
+    """過去単価（この顧客への前回単価・全顧客の中央値と範囲）を表示し、単価欄に提案単価を反映"""
+    顧客会社名 = st.session_state.get("選択された顧客会社名", "")
+    単位 = 商品.get("単位") or st.session_state.get("新規反映_単位") or "式"
+    提案単価, 顧客別, 全体 = get_price_table(current_data_version()).suggest(品名, 単位, 顧客会社名)
     
-    if not 明細リスト:
+    if 提案単価 is None:
         return
     
-    # 分類項目を除外してから集計
-    通常明細リスト = [row for row in 明細リスト if not row.get("分類", False)]
+    表示 = []
+    if 顧客別:
+        表示.append(f"{顧客会社名}への前回単価 ¥{int(顧客別['前回単価']):,}（{顧客別['前回発行日']}）")
+    if 全体:
+        表示.append(f"中央値 ¥{int(全体['中央値']):,}・範囲 ¥{int(全体['最小']):,}〜¥{int(全体['最大']):,}（{全体['件数']}件）")
+    st.caption(f"💡 過去の単価（{単位}）: " + " / ".join(表示))
+    
+    # 同じ品名・顧客で提案済みの場合は手入力した単価を上書きしない
+    提案キー = (品名, 単位, 顧客会社名)
+    if st.session_state.get("単価提案済み") != 提案キー:
+        st.session_state["単価提案済み"] = 提案キー
+        st.session_state["新規反映_単価"] = int(提案単価)
+        # 単価欄を提案単価で作り直す
+        st.session_state.pop("新規単価", None)
+
+def recalculate_session_details():
+    """セッションの明細リストの管理費を再計算し、明細合計・部署別集計・明細件数を保持（再実行ごとに1回）"""
+    明細集計 = recalculate_detail_list(
+        st.session_state.get("明細リスト", []),
+        str(st.session_state.get("担当部署", "") or ""),
+        係数機能使用=bool(st.session_state.get("係数機能使用", False))
+    )
+    st.session_state["明細集計"] = 明細集計
+    return 明細集計
+
+def get_detail_totals():
+    """明細合計・部署別集計・明細件数を取得（再計算済みの集計を使用）"""
+    明細集計 = st.session_state.get("明細集計")
+    if 明細集計 is None:
+        明細集計 = recalculate_session_details()
+    return 明細集計
+
+def render_detail_summary():
+    """明細合計と部署別集計の表示（分類項目除外版）"""
+    # 管理費の再計算と同じ走査で求めた集計を使用（売上先部署が未設定の場合は担当部署で集計済み）
+    合計金額, 部署別集計, 明細件数 = get_detail_totals()
     
-    if not 通常明細リスト:
+    if not 明細件数:
         return
     
-    # 合計金額の計算
-    合計金額 = sum(row["金額"] for row in 通常明細リスト if isinstance(row["金額"], (int, float)))
-    
-    # 案件の担当部署を取得
-    案件担当部署 = st.session_state.get("担当部署", "")
-    
-    # 部署別集計の計算（売上先部署が未設定の場合は担当部署を使用）
-    部署別集計 = {}
-    for row in 通常明細リスト:
-        売上先部署 = row.get("売上先部署", "")
-        # 売上先部署が未設定の場合は案件の担当部署を使用
-        使用部署 = 売上先部署 if 売上先部署 else 案件担当部署
-        
-        if 使用部署:  # 部署が設定されている場合のみ
-            金額 = row["金額"] if isinstance(row["金額"], (int, float)) else 0
-            if 使用部署 in 部署別集計:
-                部署別集計[使用部署] += 金額
-            else:
-                部署別集計[使用部署] = 金額
-    
     # 合計金額の表示
     合計表示 = f"**合計金額: ¥{合計金額:,}**"
 
@@ -2498,21 +2431,8 @@ def export_estimate():
         # 係数機能使用状況をチェック
         係数機能使用 = st.session_state.get("係数機能使用", False)
         
-        # ファイル名に使用できない文字を置換（括弧はそのまま保持）
-        import re
-        安全な案件名 = 案件名
-        
-        # 危険な文字のみをアンダースコアに置換（括弧は問題ないのでそのまま）
-        安全な案件名 = re.sub(r'[<>:"/\\|?*]', '_', 安全な案件名)
-        
-        # 前後の空白を除去
-        安全な案件名 = 安全な案件名.strip()
-        
-        # ファイル名が長すぎる場合は短縮
-        if len(安全な案件名) > 50:
-            安全な案件名 = 安全な案件名[:50] + "..."
-        
-        ファイル名 = f"{見積No}見積書_{安全な案件名}.xlsx"
+        # ファイル名に使用できない文字を置換（括弧はそのまま保持・長い案件名は短縮）
+        ファイル名 = make_export_filename(見積No, 案件名)
         
         # 住所情報の取得（細分化対応・優先順位修正版）
         郵便番号 = ""
@@ -2529,37 +2449,33 @@ def export_estimate():
         # 2. セッション状態に細分化住所がない場合は顧客JSONから取得
         else:
             try:
-                顧客一覧 = load_customers_json()
                 顧客会社名 = st.session_state.get("選択された顧客会社名", "")
                 顧客担当者 = st.session_state.get("選択された顧客担当者", "")
                 
-                if 顧客会社名 and 顧客担当者 and 顧客一覧:
-                    for customer in 顧客一覧:
-                        if (customer.get("顧客会社名") == 顧客会社名 and 
-                            customer.get("顧客担当者") == 顧客担当者):
-                            
-                            # 新形式の住所を優先
-                            if customer.get("郵便番号") or customer.get("住所1") or customer.get("住所2"):
-                                郵便番号 = customer.get("郵便番号", "")
-                                住所1 = customer.get("住所1", "")
-                                住所2 = customer.get("住所2", "")
-                                st.info(f"顧客JSONの細分化住所を使用: {郵便番号} {住所1} {住所2}")
-                            
-                            # 新形式がない場合は旧住所を分割
-                            elif customer.get("顧客住所"):
-                                旧住所 = customer.get("顧客住所", "")
-                                try:
-                                    from estimate_excel_writer import parse_address
-                                    郵便番号, 住所1, 住所2 = parse_address(旧住所)
-                                    st.info(f"旧住所を分割して使用: {旧住所} → {郵便番号} {住所1} {住所2}")
-                                except ImportError:
-                                    st.warning("estimate_excel_writer モジュールが見つかりません")
-                                    住所1 = 旧住所  # フォールバック
-                                except Exception as e:
-                                    st.warning(f"住所分割でエラー: {e}")
-                                    住所1 = 旧住所  # フォールバック
-                            
-                            break
+                if 顧客会社名 and 顧客担当者:
+                    # 会社名・担当者のインデックスで検索
+                    customer = get_customer_repo().find_by_contact(顧客会社名, 顧客担当者)
+                    if customer:
+                        # 新形式の住所を優先
+                        if customer.get("郵便番号") or customer.get("住所1") or customer.get("住所2"):
+                            郵便番号 = customer.get("郵便番号", "")
+                            住所1 = customer.get("住所1", "")
+                            住所2 = customer.get("住所2", "")
+                            st.info(f"顧客JSONの細分化住所を使用: {郵便番号} {住所1} {住所2}")
+                        
+                        # 新形式がない場合は旧住所を分割
+                        elif customer.get("顧客住所"):
+                            旧住所 = customer.get("顧客住所", "")
+                            try:
+                                from estimate_excel_writer import parse_address
+                                郵便番号, 住所1, 住所2 = parse_address(旧住所)
+                                st.info(f"旧住所を分割して使用: {旧住所} → {郵便番号} {住所1} {住所2}")
+                            except ImportError:
+                                st.warning("estimate_excel_writer モジュールが見つかりません")
+                                住所1 = 旧住所  # フォールバック
+                            except Exception as e:
+                                st.warning(f"住所分割でエラー: {e}")
+                                住所1 = 旧住所  # フォールバック
                 
                 if not (郵便番号 or 住所1 or 住所2):
                     st.warning("顧客JSONに住所データがありません")
@@ -2628,10 +2544,11 @@ def export_estimate():
             "係数機能使用": 係数機能使用  # 係数機能フラグを追加
         }
         
-        # 見積書を生成
+        # 見積書をメモリ上で生成（控えの保存先が設定されている場合のみディスクにも保存）
+        アーカイブ先 = os.path.join(EXPORT_ARCHIVE_FOLDER, ファイル名) if EXPORT_ARCHIVE_FOLDER else None
         try:
             from estimate_excel_writer import write_estimate_to_excel
-            success = write_estimate_to_excel(見積データ, ファイル名)
+            file_data = write_estimate_to_excel(見積データ, ファイル名, as_bytes=True, archive_path=アーカイブ先)
         except ImportError:
             st.error("❌ estimate_excel_writer モジュールが見つかりません。")
             st.info("見積書出力機能を使用するには、estimate_excel_writer.py ファイルが必要です。")
@@ -2640,19 +2557,17 @@ def export_estimate():
             st.error(f"❌ 見積書生成でエラーが発生しました: {e}")
             return
         
-        if success and os.path.exists(ファイル名):
+        if file_data:
             st.success(f"✅ 見積書を出力しました!")
             if 係数機能使用:
                 st.info(f"📋 **係数対応テンプレートを使用しました**")
             else:
                 st.info(f"📋 **通常テンプレートを使用しました**")
-            st.info(f"📁 **保存先:** `{os.path.abspath(ファイル名)}`")
+            if アーカイブ先:
+                st.info(f"📁 **保存先:** `{os.path.abspath(アーカイブ先)}`")
             
-            # ファイルデータを読み込み
+            # 生成したデータをそのままダウンロードボタンに渡す
             try:
-                with open(ファイル名, "rb") as file:
-                    file_data = file.read()
-                
                 # 自動ダウンロード用のHTML
                 st.markdown("📥 **見積書のダウンロードを開始します**")
                 
@@ -2691,6 +2606,17 @@ def render_editable_detail_list_with_coefficient(品名一覧_df):
         st.info("明細が登録されていません。下記フォームから追加してください。")
         return
     
+    # 一括編集モード（表形式でまとめて編集し、1回で反映）
+    一括編集 = st.checkbox(
+        "一括編集モード",
+        key="明細一括編集モード",
+        help="明細を表形式でまとめて編集し、「変更をまとめて反映」で一度に反映します"
+    )
+    if 一括編集:
+        render_batch_detail_editor()
+        render_detail_summary()
+        return
+    
     # ヘッダー（係数機能に応じて変更）
     if 係数機能使用:
         header_col1, header_col2, header_col3, header_col4, header_col5, header_col6, header_col7, header_col8, header_col9, header_col10 = st.columns([0.5, 2, 1, 1, 1, 1.2, 1.2, 1.5, 1.5, 2])
@@ -2868,6 +2794,124 @@ def render_editable_detail_list_with_coefficient(品名一覧_df):
     # 合計金額と部署別集計の表示（分類項目除外版）
     render_detail_summary()
 
+def build_detail_frame(明細リスト):
+    """明細リストを一括編集用のDataFrameに変換（行IDは元の明細の位置）"""
+    明細_df = pd.DataFrame(
+        [{
+            "行ID": 位置,
+            "分類": bool(明細.get("分類", False)),
+            "品名": str(明細.get("品名", "") or ""),
+            "数量": 明細.get("数量", 0),
+            "単位": str(明細.get("単位", "") or ""),
+            "管理費": f"{明細['管理費パーセンテージ']}%" if 明細.get("管理費パーセンテージ") else "",
+            "係数": 明細.get("係数", 1),
+            "単価": 明細.get("単価", 0),
+            "金額": 明細.get("金額", 0),
+            "売上先部署": str(明細.get("売上先部署", "") or ""),
+            "備考": str(明細.get("備考", "") or ""),
+        } for 位置, 明細 in enumerate(明細リスト)],
+        columns=["行ID", "分類", "品名", "数量", "単位", "管理費", "係数", "単価", "金額", "売上先部署", "備考"]
+    )
+    明細_df["数量"] = pd.to_numeric(明細_df["数量"], errors="coerce").fillna(0).astype(int)
+    明細_df["係数"] = pd.to_numeric(明細_df["係数"], errors="coerce").fillna(1).astype(float)
+    for 列 in ["単価", "金額"]:
+        明細_df[列] = pd.to_numeric(明細_df[列], errors="coerce").fillna(0).astype(float)
+    return 明細_df
+
+def apply_detail_frame(明細リスト, 明細_df, 係数機能使用=False):
+    """一括編集したDataFrameから明細リストを作り直す（金額は 数量×係数×単価 を列単位で再計算）
+
+    係数機能が無効の場合、係数は保持するだけで金額は 数量×単価 で計算する（明細の編集と同じ）。
+    管理費（％指定）の行は品名の％から判定し直し、単価・金額は表の入力ではなく上位明細の合計から再計算する
+    """
+    明細_df = 明細_df.reset_index(drop=True)
+    分類 = 明細_df["分類"].fillna(False).astype(bool)
+    数量 = pd.to_numeric(明細_df["数量"], errors="coerce").fillna(0).astype(int)
+    # 係数は係数機能が無効で列を表示していない場合も既存の値を引き継ぐ（追加した行は1）
+    係数 = pd.to_numeric(明細_df["係数"], errors="coerce").fillna(1)
+    単価 = pd.to_numeric(明細_df["単価"], errors="coerce").fillna(0).astype(float)
+    
+    # 分類行は数値を0に統一
+    数量 = 数量.where(~分類, 0)
+    単価 = 単価.where(~分類, 0.0)
+    金額 = 数量 * (係数 if 係数機能使用 else 1) * 単価
+    
+    新明細リスト = []
+    for 位置, 行ID in enumerate(明細_df["行ID"]):
+        # 既存の明細は表にない項目（管理費の％など）を引き継ぐ
+        元明細 = 明細リスト[int(行ID)] if pd.notna(行ID) and 0 <= int(行ID) < len(明細リスト) else {}
+        明細 = dict(元明細)
+        品名 = 明細_df.at[位置, "品名"]
+        明細.update({
+            "品名": "" if pd.isna(品名) else str(品名),
+            "数量": int(数量.iat[位置]),
+            "単位": "" if pd.isna(明細_df.at[位置, "単位"]) else str(明細_df.at[位置, "単位"]),
+            "係数": float(係数.iat[位置]),
+            "単価": float(単価.iat[位置]),
+            "金額": float(金額.iat[位置]),
+            "売上先部署": "" if pd.isna(明細_df.at[位置, "売上先部署"]) else str(明細_df.at[位置, "売上先部署"]),
+            "備考": "" if pd.isna(明細_df.at[位置, "備考"]) else str(明細_df.at[位置, "備考"]),
+            "分類": bool(分類.iat[位置]),
+        })
+        # 管理費（％指定）の行は表で入力された単価を使わない（反映後の再計算で上位明細の合計から求める）
+        if update_management_fee_percentage(明細):
+            明細["単価"] = 元明細.get("単価", 0)
+            明細["金額"] = 元明細.get("金額", 0)
+        
+        # 品名が空の行（追加したまま未入力の行）は除外
+        if 明細["品名"]:
+            新明細リスト.append(明細)
+    return 新明細リスト
+
+def render_batch_detail_editor():
+    """明細の一括編集（表で編集し、まとめて1回で反映）"""
+    明細リスト = st.session_state["明細リスト"]
+    係数機能使用 = st.session_state.get("係数機能使用", False)
+    
+    単位選択肢 = ["式", "分", "文字", "半日", "日", "時間", "名", "本", "件", "回", "枚", "個"]
+    売上先部署選択肢 = ["", "映像制作部", "翻訳制作部", "完プロ制作部", "生字幕制作部", "字幕展開部"]
+    明細_df = build_detail_frame(明細リスト)
+    
+    # 選択肢にない既存の値も表示できるようにする
+    単位選択肢 += sorted(set(明細_df["単位"]) - set(単位選択肢) - {""})
+    売上先部署選択肢 += sorted(set(明細_df["売上先部署"]) - set(売上先部署選択肢))
+    
+    表示列 = ["分類", "品名", "数量", "単位"] + (["係数"] if 係数機能使用 else []) + ["単価", "管理費", "金額", "売上先部署", "備考"]
+    
+    if 明細_df["管理費"].any():
+        st.caption("💡 管理費（％指定）の行の単価は上位明細の合計から自動計算されるため、表で入力しても反映されません")
+    
+    with st.form("明細一括編集フォーム"):
+        編集後_df = st.data_editor(
+            明細_df,
+            key="明細一括編集",
+            num_rows="dynamic",
+            hide_index=True,
+            use_container_width=True,
+            column_order=表示列,
+            column_config={
+                "分類": st.column_config.CheckboxColumn("分類", help="チェックすると分類行（見出し）になります", default=False),
+                "品名": st.column_config.TextColumn("品名", required=True),
+                "数量": st.column_config.NumberColumn("数量", min_value=0, step=1, default=1),
+                "単位": st.column_config.SelectboxColumn("単位", options=単位選択肢, default="式"),
+                "係数": st.column_config.NumberColumn("係数", min_value=0.5, step=0.5, default=1.0),
+                "単価": st.column_config.NumberColumn("単価", step=100, default=0, help="割引の場合はマイナス値を入力してください"),
+                "管理費": st.column_config.TextColumn("管理費", disabled=True, help="管理費（％指定）の行は単価を上位明細の合計から自動計算します（品名の％から判定）"),
+                "金額": st.column_config.NumberColumn("金額", disabled=True, format="¥%d", help="反映時に 数量×係数×単価（係数機能が無効の場合は 数量×単価）で再計算します"),
+                "売上先部署": st.column_config.SelectboxColumn("売上先部署", options=売上先部署選択肢, default=""),
+                "備考": st.column_config.TextColumn("備考"),
+            },
+        )
+        
+        反映 = st.form_submit_button("✅ 変更をまとめて反映", type="primary")
+    
+    if 反映:
+        st.session_state["明細リスト"] = apply_detail_frame(明細リスト, 編集後_df, 係数機能使用)
+        # 表の編集内容を破棄して反映後の明細から作り直す
+        st.session_state.pop("明細一括編集", None)
+        st.success(f"✅ {len(st.session_state['明細リスト'])}件の明細を反映しました")
+        st.rerun()
+
 def render_detail_edit_mode_with_coefficient(i, row, is_category, 商品番号):
     """明細編集モード（係数対応版）"""
     係数機能使用 = st.session_state.get("係数機能使用", False)
@@ -2905,6 +2949,9 @@ def render_detail_edit_mode_with_coefficient(i, row, is_category, 商品番号):
         # 品名の編集
         品名 = st.text_input("品名", value=row["品名"], key=f"edit_name_{i}")
         
+        # 管理費（％指定）の明細は単価を上位明細の合計から自動計算するため、単価は編集不可（％は品名から判定）
+        管理費パーセンテージ = extract_management_fee_percentage(品名)
+        
         # 数量の安全な編集
         try:
             現在の数量 = row.get("数量", 0)
@@ -2949,7 +2996,13 @@ def render_detail_edit_mode_with_coefficient(i, row, is_category, 商品番号):
         except (ValueError, TypeError):
             現在の単価 = 0.0
         
-        単価 = st.number_input("単価", value=現在の単価, step=100.0, help="割引の場合はマイナス値を入力してください", key=f"edit_price_{i}")
+        if 管理費パーセンテージ:
+            単価 = st.number_input(
+                "単価", value=現在の単価, step=100.0, disabled=True, key=f"edit_price_{i}",
+                help=f"管理費（{管理費パーセンテージ}%）の単価は上位明細の合計から自動計算されます"
+            )
+        else:
+            単価 = st.number_input("単価", value=現在の単価, step=100.0, help="割引の場合はマイナス値を入力してください", key=f"edit_price_{i}")
         
         # 金額計算
         if 係数機能使用:
@@ -2986,6 +3039,8 @@ def render_detail_edit_mode_with_coefficient(i, row, is_category, 商品番号):
                 明細リスト[i]["金額"] = 金額
                 明細リスト[i]["売上先部署"] = 売上先部署
                 明細リスト[i]["備考"] = 備考
+                # 品名の変更に合わせて管理費の％を設定し直す（単価・金額は再計算で更新）
+                update_management_fee_percentage(明細リスト[i])
                 
                 st.session_state[f"編集中_{i}"] = False
                 st.success("明細を更新しました")
@@ -3008,6 +3063,8 @@ def render_detail_edit_mode_with_coefficient(i, row, is_category, 商品番号):
             明細リスト[i]["金額"] = 金額
             明細リスト[i]["売上先部署"] = 売上先部署
             明細リスト[i]["備考"] = 備考
+            # 品名の変更に合わせて管理費の％を設定し直す（単価・金額は再計算で更新）
+            update_management_fee_percentage(明細リスト[i])
             
             st.session_state[f"編集中_{i}"] = False
             st.success("明細を更新しました")
@@ -3017,144 +3074,202 @@ def render_detail_edit_mode_with_coefficient(i, row, is_category, 商品番号):
             st.session_state[f"編集中_{i}"] = False
             st.rerun()
 
+@st.cache_data(max_entries=32, show_spinner=False)
+def load_line_items(見積No, シグネチャ):
+    """案件の明細リストを読み込む（シグネチャが同じ間は再読み込みしない・最近の32件まで保持）"""
+    try:
+        data = read_estimate_data(見積No)
+    except Exception:
+        return []
+    return data.get("明細リスト", []) if isinstance(data, dict) else []
+
 def load_all_projects():
-    """すべてのJSONファイルから案件データを読み込む（数値変換強化版）"""
+    """案件サマリーインデックスから案件データを読み込む（戻り値: (案件リスト, [(ファイル名, エラー), ...])）"""
     案件リスト = []
-    
-    if not os.path.exists(DATA_FOLDER):
-        return []
+    読み込みエラー = []
     
     try:
-        json_files = [f for f in os.listdir(DATA_FOLDER) if f.endswith('.json')]
+        サマリー一覧, 読み込みエラー = load_project_summaries()
         
-        for file in json_files:
-            try:
-                ファイルパス = os.path.join(DATA_FOLDER, file)
-                with open(ファイルパス, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                
-                if isinstance(data, dict):
-                    # 明細から合計金額を計算（分類項目除外・数値変換強化）
-                    明細リスト = data.get("明細リスト", [])
-                    明細合計 = 0
-                    
-                    for item in 明細リスト:
-                        # 分類項目でない場合のみ合計に含める
-                        if not item.get("分類", False):
-                            try:
-                                金額 = item.get("金額", 0)
-                                # 空文字列や None の場合は 0 として扱う
-                                if 金額 == "" or 金額 is None:
-                                    金額 = 0
-                                else:
-                                    金額 = float(金額)
-                                明細合計 += 金額
-                            except (ValueError, TypeError):
-                                # 変換できない場合は 0 として扱う
-                                continue
-                    
-                    # 売上額の優先順位：明細合計 > 保存された売上額
-                    try:
-                        保存売上額 = data.get("売上額", 0)
-                        if 保存売上額 == "" or 保存売上額 is None:
-                            保存売上額 = 0
-                        else:
-                            保存売上額 = float(保存売上額)
-                    except (ValueError, TypeError):
-                        保存売上額 = 0
-                    
-                    # 明細がある場合は明細合計を優先、ない場合は保存された売上額を使用
-                    if 明細合計 > 0:
-                        売上額 = 明細合計
-                    else:
-                        売上額 = 保存売上額
-                    
-                    # 日付の処理
-                    try:
-                        発行日 = pd.to_datetime(data.get("発行日", "")).date() if data.get("発行日") else None
-                    except:
-                        発行日 = None
-                    
-                    try:
-                        受注日 = pd.to_datetime(data.get("受注日", "")).date() if data.get("受注日") else None
-                    except:
-                        受注日 = None
-                    
-                    try:
-                        納品日 = pd.to_datetime(data.get("納品日", "")).date() if data.get("納品日") else None
-                    except:
-                        納品日 = None
-                    
-                    # 数値フィールドの安全な変換
-                    try:
-                        仕入額 = data.get("仕入額", 0)
-                        if 仕入額 == "" or 仕入額 is None:
-                            仕入額 = 0
-                        else:
-                            仕入額 = int(float(仕入額))
-                    except (ValueError, TypeError):
-                        仕入額 = 0
-                    
-                    try:
-                        粗利 = data.get("粗利", 0)
-                        if 粗利 == "" or 粗利 is None:
-                            粗利 = 0
-                        else:
-                            粗利 = int(float(粗利))
-                    except (ValueError, TypeError):
-                        粗利 = 0
-                    
-                    try:
-                        粗利率 = data.get("粗利率", 0)
-                        if 粗利率 == "" or 粗利率 is None:
-                            粗利率 = 0
-                        else:
-                            粗利率 = float(粗利率)
-                    except (ValueError, TypeError):
-                        粗利率 = 0
-                    
-                    # 明細件数の計算（分類項目除外）
-                    明細件数 = len([item for item in 明細リスト if not item.get("分類", False)])
-                    
-                    案件データ = {
-                        "見積No": data.get("見積No", ""),
-                        "案件名": data.get("案件名", "案件名未設定"),
-                        "顧客会社名": data.get("顧客会社名", ""),
-                        "顧客部署名": data.get("顧客部署名", ""),
-                        "顧客担当者": data.get("顧客担当者", ""),
-                        "発行日": 発行日,
-                        "受注日": 受注日,
-                        "納品日": 納品日,
-                        "売上額": int(売上額),
-                        "仕入額": 仕入額,
-                        "粗利": 粗利,
-                        "粗利率": 粗利率,
-                        "状況": data.get("状況", "見積中"),
-                        "発行者名": data.get("発行者名", ""),
-                        "メモ": data.get("メモ", ""),
-                        "明細件数": 明細件数,
-                        "JSONファイル": file,
-                        "担当部署": data.get("担当部署", ""),
-                        "明細リスト": 明細リスト
-                    }
-                    
-                    案件リスト.append(案件データ)
-                    
-            except Exception as e:
-                st.warning(f"ファイル {file} の読み込みでエラー: {e}")
-                continue
+        for サマリー in サマリー一覧.values():
+            案件データ = dict(サマリー)
+            
+            # 日付は文字列で保持しているため日付型に変換
+            for 日付項目 in ["発行日", "受注日", "納品日"]:
+                try:
+                    案件データ[日付項目] = datetime.date.fromisoformat(サマリー[日付項目]) if サマリー.get(日付項目) else None
+                except ValueError:
+                    案件データ[日付項目] = None
+            
+            案件リスト.append(案件データ)
                 
     except Exception as e:
         st.error(f"案件データの読み込みでエラー: {e}")
     
-    return 案件リスト
+    return 案件リスト, 読み込みエラー
+
+# 案件一覧のフィルタ（サマリーをDataFrame化して列単位で判定）
+状況選択肢一覧 = ["見積中", "受注", "納品済", "請求済", "不採用", "失注"]
+
+def build_project_frame(案件リスト):
+    """案件サマリーからフィルタ用のDataFrameを作成（売上年度・売上月は納品日から事前計算）"""
+    案件一覧_df = pd.DataFrame(
+        [{
+            "位置": 位置,
+            "見積キー": str(案件.get("JSONファイル", ""))[:-len(".json")],
+            "案件名": str(案件.get("案件名", "") or ""),
+            "顧客会社名": 案件.get("顧客会社名", "") or "",
+            "発行者名": 案件.get("発行者名", "") or "",
+            "担当部署": 案件.get("担当部署", "") or "",
+            "状況": 案件.get("状況", "") or "",
+            "納品日": 案件.get("納品日"),
+            "売上額": 案件.get("売上額", 0) or 0,
+        } for 位置, 案件 in enumerate(案件リスト)],
+        columns=["位置", "見積キー", "案件名", "顧客会社名", "発行者名", "担当部署", "状況", "納品日", "売上額"]
+    )
+    
+    # 年度計算（4月-3月ベース）
+    納品日 = pd.to_datetime(案件一覧_df["納品日"], errors="coerce")
+    案件一覧_df["売上年度"] = (納品日.dt.year - (納品日.dt.month < 4)).astype("Int64")
+    案件一覧_df["売上月"] = 納品日.dt.month.astype("Int64")
+    
+    # 状況はカテゴリ型（想定外の状況も保持）
+    その他状況 = sorted(set(案件一覧_df["状況"]) - set(状況選択肢一覧))
+    案件一覧_df["状況"] = pd.Categorical(案件一覧_df["状況"], categories=状況選択肢一覧 + その他状況)
+    案件一覧_df["売上額"] = pd.to_numeric(案件一覧_df["売上額"], errors="coerce").fillna(0).astype("int64")
+    
+    return 案件一覧_df
+
+def filter_project_frame(案件一覧_df, 売上年度="すべて", 売上月="すべて", 顧客="すべて", 発行者="すべて",
+                         担当部署="すべて", 状況含む=None, 状況除く=None, 検索スコア=None):
+    """フィルタ条件を列ごとの真偽マスクにして組み合わせる（年度・月は納品日がない案件を除外）
+
+    検索スコア（見積キー → スコア）を指定した場合は該当案件に絞り込み、スコア順に並べる
+    """
+    マスク = pd.Series(True, index=案件一覧_df.index)
+    
+    if 売上年度 != "すべて":
+        マスク &= 案件一覧_df["売上年度"].eq(int(売上年度.replace("年度", ""))).fillna(False).astype(bool)
+    if 売上月 != "すべて":
+        マスク &= 案件一覧_df["売上月"].eq(int(売上月.replace("月", ""))).fillna(False).astype(bool)
+    if 発行者 != "すべて":
+        マスク &= 案件一覧_df["発行者名"] == 発行者
+    if 顧客 != "すべて":
+        マスク &= 案件一覧_df["顧客会社名"] == 顧客
+    if 担当部署 != "すべて":
+        マスク &= 案件一覧_df["担当部署"] == 担当部署
+    if 状況含む:
+        マスク &= 案件一覧_df["状況"].isin(状況含む)
+    if 状況除く:
+        マスク &= ~案件一覧_df["状況"].isin(状況除く)
+    if 検索スコア is not None:
+        マスク &= 案件一覧_df["見積キー"].isin(検索スコア.keys())
+        結果_df = 案件一覧_df[マスク].copy()
+        結果_df["スコア"] = 結果_df["見積キー"].map(検索スコア)
+        return 結果_df.sort_values("スコア", ascending=False, kind="stable")
+    
+    return 案件一覧_df[マスク]
+
+def summarize_project_frame(フィルタ結果_df):
+    """状況別の件数・売上額を1回の集計で求め、統計情報を作成"""
+    状況別 = フィルタ結果_df.groupby("状況", observed=False)["売上額"].agg(["size", "sum"])
+    
+    def 件数(状況):
+        return int(状況別.at[状況, "size"]) if 状況 in 状況別.index else 0
+    
+    def 売上(状況):
+        return int(状況別.at[状況, "sum"]) if 状況 in 状況別.index else 0
+    
+    return {
+        "案件数": len(フィルタ結果_df),
+        "見積中件数": 件数("見積中"),
+        "請求済み件数": 件数("請求済"),
+        # 売上見込み（受注～請求済み）
+        "売上見込み": sum(売上(状況) for 状況 in ["受注", "納品済", "請求済"]),
+        # 売上合計（請求済みのみ）
+        "売上合計": 売上("請求済"),
+    }
+
+def clear_bulk_export_result():
+    """一括出力の結果を破棄（ZIPの一時ファイルも閉じる）"""
+    結果 = st.session_state.pop("一括出力結果", None)
+    if 結果:
+        結果["ファイル"].close()
+
+def read_bulk_export_file(ファイル):
+    """一括出力したZIPの内容を読み込む（ダウンロードボタンが押されたときだけ呼ぶ）"""
+    ファイル.seek(0)
+    return ファイル.read()
+
+def render_bulk_export(案件リスト):
+    """絞り込み結果の見積書を一括出力（プロセスプールで並行して作成し、ZIPでダウンロード）"""
+    # 絞り込み条件が変わった場合は前回の結果を破棄（別の条件の結果をダウンロードさせない）
+    適用中フィルタ = st.session_state.get("適用中フィルタ", {})
+    結果 = st.session_state.get("一括出力結果")
+    if 結果 and 結果["フィルタ"] != 適用中フィルタ:
+        clear_bulk_export_result()
+    
+    with st.expander(f"📦 見積書を一括出力（{len(案件リスト)}件）"):
+        st.caption("現在の絞り込み結果の見積書をまとめて作成し、1つのZIPファイルでダウンロードします")
+        
+        if st.button("📦 ZIPを作成", key="bulk_export_start"):
+            見積データ一覧 = []
+            読み込みエラー = []
+            for 案件 in 案件リスト:
+                try:
+                    data = read_estimate_data(案件["見積No"])
+                except Exception as e:
+                    読み込みエラー.append((案件["見積No"], str(e)))
+                    continue
+                if data:
+                    見積データ一覧.append(build_export_data(data))
+            
+            進捗バー = st.progress(0.0, text=f"見積書を作成中... 0/{len(見積データ一覧)}件")
+            
+            def 進捗を更新(完了件数, 全件数):
+                進捗バー.progress(完了件数 / 全件数, text=f"見積書を作成中... {完了件数}/{全件数}件")
+            
+            zip_file, 出力件数, エラー一覧 = export_estimates_zip(見積データ一覧, progress=進捗を更新)
+            進捗バー.empty()
+            
+            # ダウンロードボタンの押下で再実行されても残るようにセッションに保持
+            clear_bulk_export_result()
+            st.session_state["一括出力結果"] = {
+                "ファイル": zip_file,
+                "フィルタ": 適用中フィルタ,
+                "ファイル名": f"見積書一括_{datetime.date.today():%Y%m%d}.zip",
+                "件数": 出力件数,
+                "エラー": 読み込みエラー + [(見積No, str(e)) for 見積No, e in エラー一覧],
+            }
+        
+        結果 = st.session_state.get("一括出力結果")
+        if 結果:
+            st.success(f"✅ {結果['件数']}件の見積書を作成しました")
+            for 見積No, エラー in 結果["エラー"]:
+                st.warning(f"見積No {見積No} の出力に失敗しました: {エラー}")
+            if 結果["件数"]:
+                # ZIPは押されたときに読み込む（再実行のたびにメモリ上へ展開しない）
+                zip_file = 結果["ファイル"]
+                st.download_button(
+                    label="📥 ZIPをダウンロード",
+                    data=lambda: read_bulk_export_file(zip_file),
+                    file_name=結果["ファイル名"],
+                    mime="application/zip",
+                    key="bulk_export_download"
+                )
 
 def render_project_list_tab():
     """案件一覧タブを表示（年度・月連動フィルタ対応版）"""
     st.header("① 案件一覧")
     
     # 案件データの読み込み
-    案件リスト = load_all_projects()
+    案件リスト, 読み込みエラー = load_all_projects()
+    案件一覧_df = build_project_frame(案件リスト)
+    
+    # 読み込めなかったファイルはまとめて1回だけ通知
+    if 読み込みエラー:
+        エラー一覧 = "\n".join(f"- {file}: {e}" for file, e in 読み込みエラー)
+        st.warning(f"{len(読み込みエラー)}件のファイルの読み込みでエラーが発生しました\n{エラー一覧}")
     
     if not 案件リスト:
         st.info("案件データがありません。")
@@ -3193,12 +3308,16 @@ def render_project_list_tab():
             st.session_state["filter_担当部署"] = "すべて"
             st.session_state["filter_検索キーワード"] = ""
             
+            # 適用中のフィルタとページ位置も解除
+            st.session_state.pop("適用中フィルタ", None)
+            st.session_state["案件一覧_ページ"] = 1
+            
             st.rerun()
 
-    # 1行目：案件名で検索
+    # 1行目：キーワードで検索（案件名・顧客名・メモ・備考・明細の品名/備考）
     検索キーワード = st.text_input(
-        "🔍 案件名で検索", 
-        placeholder="案件名を入力してください",
+        "🔍 キーワードで検索", 
+        placeholder="案件名・顧客名・メモ・品名など（スペース区切りで複数指定）",
         value=st.session_state.get("filter_検索キーワード", ""),
         key="search_input"
     )
@@ -3210,24 +3329,9 @@ def render_project_list_tab():
     with col1:
         # 売上年度でフィルタ（年度計算修正版）
         売上年度リスト = ["すべて"]
-        年度セット = set()
         
-        # 案件データを読み込んで年度を抽出
-        案件リスト = load_all_projects()
-        
-        # 納品日から年度を抽出（4月-3月ベース）
-        for 案件 in 案件リスト:
-            if 案件["納品日"]:
-                try:
-                    納品日 = 案件["納品日"]
-                    # 年度計算（4月-3月）
-                    if 納品日.month >= 4:
-                        年度 = 納品日.year
-                    else:
-                        年度 = 納品日.year - 1
-                    年度セット.add(年度)
-                except:
-                    pass
+        # 納品日から計算済みの年度（4月-3月ベース）を抽出
+        年度セット = set(int(年度) for 年度 in 案件一覧_df["売上年度"].dropna().unique())
         
         # 年度を降順でソートしてリストに追加
         if 年度セット:
@@ -3270,7 +3374,7 @@ def render_project_list_tab():
         # 顧客でフィルタ（顧客No順で並び替え）
         try:
             # 顧客JSONから顧客No順で会社名を取得
-            顧客一覧 = load_customers_json()
+            顧客一覧 = get_customer_repo().all()
             if 顧客一覧:
                 # 顧客Noでソートしてから会社名を取得
                 顧客一覧.sort(key=lambda x: (x.get("顧客No", 999), x.get("顧客会社名", "")))
@@ -3303,7 +3407,7 @@ def render_project_list_tab():
     
     with col4:
         # 発行者でフィルタ（既存コード）
-        発行者リスト = ["すべて"] + sorted(list(set([案件["発行者名"] for 案件 in 案件リスト if 案件["発行者名"]])))
+        発行者リスト = ["すべて"] + sorted(set(案件一覧_df["発行者名"]) - {""})
         
         # 初期値を設定
         初期発行者index = 0
@@ -3320,7 +3424,7 @@ def render_project_list_tab():
     
     with col5:
         # 担当部署でフィルタ（新規追加）
-        担当部署リスト = ["すべて"] + sorted(list(set([案件["担当部署"] for 案件 in 案件リスト if 案件.get("担当部署")])))
+        担当部署リスト = ["すべて"] + sorted(set(案件一覧_df["担当部署"]) - {""})
         
         # 初期値を設定
         初期担当部署index = 0
@@ -3420,15 +3524,9 @@ def render_project_list_tab():
             失注_excluded = st.checkbox("失注", key="exclude_失注_ui", value=st.session_state.get("exclude_失注", False))
             st.session_state["exclude_失注"] = 失注_excluded
 
-    # 絞り込みボタンが押された場合のみフィルタを適用
+    # 絞り込みボタンが押された場合のみフィルタ条件を確定し、適用中フィルタとして保持
+    # （ページ送り等の再実行でも同じ条件で表示する）
     if 絞り込み実行:
-        選択された売上年度 = st.session_state.get("filter_売上年度", "すべて")
-        選択された売上月 = st.session_state.get("filter_売上月", "すべて")
-        選択された顧客 = st.session_state.get("filter_顧客", "すべて")
-        選択された発行者 = st.session_state.get("filter_発行者", "すべて")
-        選択された担当部署 = st.session_state.get("filter_担当部署", "すべて")
-        検索キーワード = st.session_state.get("filter_検索キーワード", "")
-        
         # 状況フィルタを取得（修正された状況リストを使用）
         選択された状況含む = []
         選択された状況除く = []
@@ -3437,96 +3535,55 @@ def render_project_list_tab():
                 選択された状況含む.append(状況)
             if st.session_state.get(f"exclude_{状況}", False):
                 選択された状況除く.append(状況)
-    else:
-        # 絞り込みボタンが押されていない場合は全件表示
-        選択された売上年度 = "すべて"
-        選択された売上月 = "すべて"
-        選択された顧客 = "すべて"
-        選択された発行者 = "すべて"
-        選択された担当部署 = "すべて"
-        検索キーワード = ""
-        選択された状況含む = []
-        選択された状況除く = []
-
-    # フィルタ適用処理（年度・月連動対応版）
-    フィルタ済み案件 = 案件リスト.copy()
-    
-    # 年度・月の連動フィルタ
-    if 選択された売上年度 != "すべて" or 選択された売上月 != "すべて":
-        フィルタ済み案件 = []
-        for 案件 in 案件リスト:
-            if not 案件["納品日"]:
-                continue
-            
-            納品日 = 案件["納品日"]
-            
-            # 年度の計算（4月-3月ベース）
-            if 納品日.month >= 4:
-                案件年度 = 納品日.year
-            else:
-                案件年度 = 納品日.year - 1
-            
-            # 年度フィルタのチェック
-            年度一致 = True
-            if 選択された売上年度 != "すべて":
-                指定年度 = int(選択された売上年度.replace("年度", ""))
-                年度一致 = (案件年度 == 指定年度)
-            
-            # 月フィルタのチェック
-            月一致 = True
-            if 選択された売上月 != "すべて":
-                指定月 = int(選択された売上月.replace("月", ""))
-                月一致 = (納品日.month == 指定月)
-            
-            # 両方の条件を満たす場合のみ追加
-            if 年度一致 and 月一致:
-                フィルタ済み案件.append(案件)
-    
-    if 選択された発行者 != "すべて":
-        フィルタ済み案件 = [案件 for 案件 in フィルタ済み案件 if 案件["発行者名"] == 選択された発行者]
-    
-    if 選択された顧客 != "すべて":
-        フィルタ済み案件 = [案件 for 案件 in フィルタ済み案件 if 案件["顧客会社名"] == 選択された顧客]
-    
-    # 担当部署でのフィルタ（新規追加）
-    if 選択された担当部署 != "すべて":
-        フィルタ済み案件 = [案件 for 案件 in フィルタ済み案件 if 案件.get("担当部署") == 選択された担当部署]
-    
-    # 状況（含む）フィルタ - 複数選択対応
-    if 選択された状況含む:  # リストが空でない場合のみ適用
-        フィルタ済み案件 = [案件 for 案件 in フィルタ済み案件 if 案件["状況"] in 選択された状況含む]
-    
-    # 状況（除く）フィルタ - 複数選択対応
-    if 選択された状況除く:  # リストが空でない場合のみ適用
-        フィルタ済み案件 = [案件 for 案件 in フィルタ済み案件 if 案件["状況"] not in 選択された状況除く]
-    
-    if 検索キーワード:
-        フィルタ済み案件 = [案件 for 案件 in フィルタ済み案件 if 検索キーワード in 案件["案件名"]]
+        
+        st.session_state["適用中フィルタ"] = {
+            "売上年度": st.session_state.get("filter_売上年度", "すべて"),
+            "売上月": st.session_state.get("filter_売上月", "すべて"),
+            "顧客": st.session_state.get("filter_顧客", "すべて"),
+            "発行者": st.session_state.get("filter_発行者", "すべて"),
+            "担当部署": st.session_state.get("filter_担当部署", "すべて"),
+            "検索キーワード": st.session_state.get("filter_検索キーワード", ""),
+            "状況含む": 選択された状況含む,
+            "状況除く": 選択された状況除く,
+        }
+        # 条件が変わったので先頭ページに戻す
+        st.session_state["案件一覧_ページ"] = 1
+    
+    # 絞り込みが実行されていない場合は全件表示
+    適用中フィルタ = st.session_state.get("適用中フィルタ", {})
+    選択された売上年度 = 適用中フィルタ.get("売上年度", "すべて")
+    選択された売上月 = 適用中フィルタ.get("売上月", "すべて")
+    選択された顧客 = 適用中フィルタ.get("顧客", "すべて")
+    選択された発行者 = 適用中フィルタ.get("発行者", "すべて")
+    選択された担当部署 = 適用中フィルタ.get("担当部署", "すべて")
+    検索キーワード = 適用中フィルタ.get("検索キーワード", "")
+    選択された状況含む = 適用中フィルタ.get("状況含む", [])
+    選択された状況除く = 適用中フィルタ.get("状況除く", [])
+
+    # フィルタ適用処理（DataFrameで一括判定）
+    フィルタ結果_df = filter_project_frame(
+        案件一覧_df,
+        売上年度=選択された売上年度,
+        売上月=選択された売上月,
+        顧客=選択された顧客,
+        発行者=選択された発行者,
+        担当部署=選択された担当部署,
+        状況含む=選択された状況含む,
+        状況除く=選択された状況除く,
+        検索スコア=search_estimates(検索キーワード) if 検索キーワード.strip() else None
+    )
+    フィルタ済み案件 = [案件リスト[位置] for 位置 in フィルタ結果_df["位置"]]
     
     # 統計情報
     st.subheader("📊 統計情報")
     
-    # フィルタ済み案件での統計計算
-    フィルタ済み件数 = len(フィルタ済み案件)
-    
-    # 売上見込み（受注～請求済み）
-    売上見込み状況 = ["受注", "納品済", "請求済"]
-    売上見込み = sum([
-        案件["売上額"] for 案件 in フィルタ済み案件 
-        if 案件["状況"] in 売上見込み状況
-    ])
-    
-    # 売上合計（請求済みのみ）
-    売上合計 = sum([
-        案件["売上額"] for 案件 in フィルタ済み案件 
-        if 案件["状況"] == "請求済"
-    ])
-    
-    # 見積中件数
-    見積中件数 = len([案件 for 案件 in フィルタ済み案件 if 案件["状況"] == "見積中"])
-    
-    # 請求済み件数（新規追加）
-    請求済み件数 = len([案件 for 案件 in フィルタ済み案件 if 案件["状況"] == "請求済"])
+    # フィルタ済み案件での統計計算（状況別の件数・売上額を1回の集計で取得）
+    統計 = summarize_project_frame(フィルタ結果_df)
+    フィルタ済み件数 = 統計["案件数"]
+    見積中件数 = 統計["見積中件数"]
+    請求済み件数 = 統計["請求済み件数"]
+    売上見込み = 統計["売上見込み"]
+    売上合計 = 統計["売上合計"]
     
     col1, col2, col3, col4, col5 = st.columns(5)
     
@@ -3582,46 +3639,64 @@ def render_project_list_tab():
         st.info("条件に合致する案件がありません。")
         return
 
+    # 絞り込み結果の見積書をまとめてZIPで出力
+    render_bulk_export(フィルタ済み案件)
+
+    # ページ分割（表示中のページの案件だけを描画する）
+    page_col1, page_col2, page_col3, page_col4 = st.columns([1, 1, 2, 1])
+    
+    with page_col1:
+        表示件数 = st.selectbox("表示件数", [10, 20, 50, 100], index=1, key="案件一覧_表示件数")
+    
+    # 表示件数が変わった場合は先頭ページに戻す
+    if st.session_state.get("案件一覧_前回表示件数") != 表示件数:
+        st.session_state["案件一覧_前回表示件数"] = 表示件数
+        st.session_state["案件一覧_ページ"] = 1
+    
+    総ページ数 = (len(フィルタ済み案件) + 表示件数 - 1) // 表示件数
+    現在ページ = min(max(st.session_state.get("案件一覧_ページ", 1), 1), 総ページ数)
+    st.session_state["案件一覧_ページ"] = 現在ページ
+    開始位置 = (現在ページ - 1) * 表示件数
+    終了位置 = min(開始位置 + 表示件数, len(フィルタ済み案件))
+    
+    with page_col2:
+        st.write("　")  # 高さ調整
+        if st.button("◀ 前へ", key="project_page_prev", disabled=現在ページ <= 1):
+            st.session_state["案件一覧_ページ"] = 現在ページ - 1
+            st.rerun()
+    
+    with page_col3:
+        st.write("　")  # 高さ調整
+        st.write(f"{現在ページ} / {総ページ数} ページ（{開始位置 + 1}〜{終了位置}件目を表示）")
+    
+    with page_col4:
+        st.write("　")  # 高さ調整
+        if st.button("次へ ▶", key="project_page_next", disabled=現在ページ >= 総ページ数):
+            st.session_state["案件一覧_ページ"] = 現在ページ + 1
+            st.rerun()
+
     # 案件一覧を表示（文字サイズ拡大・部署別集計改善）
-    for i, 案件 in enumerate(フィルタ済み案件):
-        # 部署別集計を計算（改善版）
+    for i, 案件 in enumerate(フィルタ済み案件[開始位置:終了位置], start=開始位置):
+        # 部署別集計の表示（集計はサマリーインデックス作成時に計算済み）
         部署別集計表示 = ""
         総額 = 案件.get("売上額", 0)
         
         try:
-            明細リスト = 案件.get("明細リスト", [])
-            案件担当部署 = 案件.get("担当部署", "")
+            部署別集計 = 案件.get("部署別集計", {})
             
-            if 明細リスト:
-                部署別集計 = {}
-                明細合計 = 0
-                
-                for row in 明細リスト:
-                    金額 = row.get("金額", 0)
-                    明細合計 += 金額
-                    
-                    売上先部署 = row.get("売上先部署", "")
-                    使用部署 = 売上先部署 if 売上先部署 else 案件担当部署
-                    
-                    if 使用部署:
-                        if 使用部署 in 部署別集計:
-                            部署別集計[使用部署] += 金額
-                        else:
-                            部署別集計[使用部署] = 金額
-                
-                # 部署別集計の表示形式を改善
-                if 部署別集計:
-                    部署数 = len(部署別集計)
-                    if 部署数 > 1:
-                        # 複数部署の場合：総額を先頭に表示
-                        部署別表示リスト = [f"総額:¥{総額:,}"]
-                        for 部署, 金額 in sorted(部署別集計.items()):
-                            部署別表示リスト.append(f"{部署}:¥{金額:,}")
-                        部署別集計表示 = f" ({' | '.join(部署別表示リスト)})"
-                    else:
-                        # 単一部署の場合：従来通り
-                        部署, 金額 = list(部署別集計.items())[0]
-                        部署別集計表示 = f" ({部署}:¥{金額:,})"
+            # 部署別集計の表示形式を改善
+            if 部署別集計:
+                部署数 = len(部署別集計)
+                if 部署数 > 1:
+                    # 複数部署の場合：総額を先頭に表示
+                    部署別表示リスト = [f"総額:¥{総額:,}"]
+                    for 部署, 金額 in sorted(部署別集計.items()):
+                        部署別表示リスト.append(f"{部署}:¥{金額:,}")
+                    部署別集計表示 = f" ({' | '.join(部署別表示リスト)})"
+                else:
+                    # 単一部署の場合：従来通り
+                    部署, 金額 = list(部署別集計.items())[0]
+                    部署別集計表示 = f" ({部署}:¥{金額:,})"
         except:
             pass
 
@@ -3675,50 +3750,34 @@ def render_project_list_tab():
             if 案件['メモ']:
                 st.write(f"**メモ:** {案件['メモ']}")
             
-            # 明細の部署別集計を表示
-            try:
-                ファイルパス = os.path.join(DATA_FOLDER, 案件['JSONファイル'])
-                with open(ファイルパス, "r", encoding="utf-8") as f:
-                    詳細データ = json.load(f)
+            # 明細の部署別集計を表示（サマリー作成時に計算済みのため明細は読み込まない）
+            if 案件.get("明細件数", 0) > 0:
+                st.write(f"**明細合計:** ¥{int(案件.get('明細合計', 0)):,}")
                 
-                if isinstance(詳細データ, dict):
-                    明細リスト = 詳細データ.get("明細リスト", [])
-                    案件担当部署 = 詳細データ.get("担当部署", "")
-                    
+                部署別集計 = 案件.get("部署別集計", {})
+                if 部署別集計:
+                    部署別表示リスト = []
+                    for 部署, 金額 in sorted(部署別集計.items()):
+                        部署別表示リスト.append(f"{部署}: ¥{int(金額):,}")
+                    st.write(f"**部署別内訳:** {' | '.join(部署別表示リスト)}")
+                
+                st.write(f"**明細件数:** {案件['明細件数']}件")
+                
+                # 明細はチェックされたときだけ読み込む
+                if st.checkbox("明細を表示", key=f"明細表示_{案件['見積No']}"):
+                    明細リスト = load_line_items(案件['JSONファイル'][:-len(".json")], 案件.get("シグネチャ"))
                     if 明細リスト:
-                        # 部署別集計の計算
-                        部署別集計 = {}
-                        明細合計 = 0
-                        
-                        for row in 明細リスト:
-                            金額 = row.get("金額", 0)
-                            明細合計 += 金額
-                            
-                            売上先部署 = row.get("売上先部署", "")
-                            # 売上先部署が未設定の場合は案件の担当部署を使用
-                            使用部署 = 売上先部署 if 売上先部署 else 案件担当部署
-                            
-                            if 使用部署:
-                                if 使用部署 in 部署別集計:
-                                    部署別集計[使用部署] += 金額
-                                else:
-                                    部署別集計[使用部署] = 金額
-                        
-                        # 明細合計の表示
-                        st.write(f"**明細合計:** ¥{明細合計:,}")
-                        
-                        # 部署別集計の表示
-                        if 部署別集計:
-                            部署別表示リスト = []
-                            for 部署, 金額 in sorted(部署別集計.items()):
-                                部署別表示リスト.append(f"{部署}: ¥{金額:,}")
-                            
-                            if 部署別表示リスト:
-                                st.write(f"**部署別内訳:** {' | '.join(部署別表示リスト)}")
-                        
-                        st.write(f"**明細件数:** {len(明細リスト)}件")
-            except Exception as e:
-                pass  # エラーが発生しても案件表示は継続
+                        st.dataframe(
+                            pd.DataFrame(明細リスト).reindex(columns=["品名", "数量", "単位", "単価", "金額", "売上先部署", "備考"]),
+                            hide_index=True,
+                            use_container_width=True,
+                            column_config={
+                                "単価": st.column_config.NumberColumn("単価", format="¥%d"),
+                                "金額": st.column_config.NumberColumn("金額", format="¥%d"),
+                            }
+                        )
+                    else:
+                        st.info("明細データを読み込めませんでした")
             
             # 操作ボタン
             col1, col2, col3, col4 = st.columns(4)
@@ -3774,9 +3833,7 @@ def render_project_list_tab():
                     if st.button("✅ はい、削除します", key=f"confirm_delete_{案件['見積No']}", type="primary"):
                         # JSONファイルを削除
                         try:
-                            ファイルパス = os.path.join(DATA_FOLDER, 案件['JSONファイル'])
-                            if os.path.exists(ファイルパス):
-                                os.remove(ファイルパス)
+                            if delete_estimate_data(案件['JSONファイル'][:-len(".json")]):
                                 st.success(f"案件 {案件['見積No']} を削除しました")
                                 # 削除確認フラグをクリア
                                 del st.session_state[f"削除確認_{案件['見積No']}"]
@@ -3809,13 +3866,7 @@ def render_project_list_tab():
 def copy_project_data(元見積No):
     """案件データをコピーして新規案件として設定（住所引き継ぎ強化版・エラー修正）"""
     try:
-        ファイルパス = os.path.join(DATA_FOLDER, f"{元見積No}.json")
-        
-        if not os.path.exists(ファイルパス):
-            return False
-
-        with open(ファイルパス, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        data = read_estimate_data(元見積No)
         
         if not isinstance(data, dict):
             return False
@@ -3847,30 +3898,28 @@ def copy_project_data(元見積No):
         else:
             # JSONに住所がない場合は顧客一覧から取得を試行
             try:
-                顧客一覧 = load_customers_json()
                 元顧客会社名 = data.get("顧客会社名", "")
                 元顧客担当者 = data.get("顧客担当者", "")
                 
-                if 元顧客会社名 and 元顧客担当者 and 顧客一覧:
-                    for customer in 顧客一覧:
-                        if (customer.get("顧客会社名") == 元顧客会社名 and 
-                            customer.get("顧客担当者") == 元顧客担当者):
-                            # 新形式優先
-                            if customer.get("郵便番号") or customer.get("住所1") or customer.get("住所2"):
-                                元郵便番号 = customer.get("郵便番号", "")
-                                元住所1 = customer.get("住所1", "")
-                                元住所2 = customer.get("住所2", "")
-                            else:
-                                元顧客住所 = customer.get("顧客住所", "")
-                                if 元顧客住所:
-                                    try:
-                                        from estimate_excel_writer import parse_address
-                                        元郵便番号, 元住所1, 元住所2 = parse_address(元顧客住所)
-                                    except ImportError:
-                                        元住所1 = 元顧客住所
-                                    except Exception:
-                                        元住所1 = 元顧客住所
-                            break
+                if 元顧客会社名 and 元顧客担当者:
+                    # 会社名・担当者のインデックスで検索
+                    customer = get_customer_repo().find_by_contact(元顧客会社名, 元顧客担当者)
+                    if customer:
+                        # 新形式優先
+                        if customer.get("郵便番号") or customer.get("住所1") or customer.get("住所2"):
+                            元郵便番号 = customer.get("郵便番号", "")
+                            元住所1 = customer.get("住所1", "")
+                            元住所2 = customer.get("住所2", "")
+                        else:
+                            元顧客住所 = customer.get("顧客住所", "")
+                            if 元顧客住所:
+                                try:
+                                    from estimate_excel_writer import parse_address
+                                    元郵便番号, 元住所1, 元住所2 = parse_address(元顧客住所)
+                                except ImportError:
+                                    元住所1 = 元顧客住所
+                                except Exception:
+                                    元住所1 = 元顧客住所
             except Exception:
                 pass
         
@@ -3901,6 +3950,7 @@ def copy_project_data(元見積No):
         st.session_state["受注日"] = None    # 日付は空に設定
         st.session_state["納品日"] = None    # 日付は空に設定
         st.session_state["メモ"] = data.get("メモ", "")
+        st.session_state["係数機能使用"] = uses_coefficient(data)
         
         # デバッグ情報
         if 統合住所 or 元顧客住所:
@@ -4324,16 +4374,29 @@ def render_product_list_tab():
                         st.session_state[f"del_confirm_{i}"] = False
                         st.rerun()
 
+def get_customer_repo():
+    """共有の顧客リポジトリを取得（顧客データが変更された場合のみ読み込み直す）"""
+    if STORAGE_BACKEND == "sqlite":
+        元データ = [SQLITE_DB_PATH, f"{SQLITE_DB_PATH}-wal"]
+    else:
+        customers_json_file = os.path.join(DATA_FOLDER, "customers.json")
+        元データ = [customers_json_file, get_journal_path(customers_json_file)]
+    return get_customer_repository(元データ, load_customers_json)
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def load_customers_from_db(データバージョン):
+    """SQLiteから顧客データを読み込む（データバージョンが変わるまで再読み込みしない）"""
+    return storage_sqlite.load_customers(SQLITE_DB_PATH)
+
 def load_customers_json():
     """顧客JSONファイルを読み込む"""
     try:
+        if STORAGE_BACKEND == "sqlite":
+            return load_customers_from_db(current_data_version())
+        
+        # 本体ファイルに追記ジャーナルを適用した内容を取得
         customers_json_file = os.path.join(DATA_FOLDER, "customers.json")
-        if os.path.exists(customers_json_file):
-            with open(customers_json_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            return data if isinstance(data, list) else []
-        else:
-            return []
+        return load_list(customers_json_file)
     except Exception as e:
         st.error(f"顧客データの読み込みエラー: {e}")
         return []
@@ -4341,10 +4404,15 @@ def load_customers_json():
 def save_customers_json(customers_list):
     """顧客データをJSONファイルに保存"""
     try:
-        os.makedirs(DATA_FOLDER, exist_ok=True)
+        if STORAGE_BACKEND == "sqlite":
+            storage_sqlite.save_customers(SQLITE_DB_PATH, customers_list)
+            notify_data_changed()
+            return True
+        
+        # 変更箇所だけをジャーナルに追記（一定サイズを超えると本体に畳み込み）
         customers_json_file = os.path.join(DATA_FOLDER, "customers.json")
-        with open(customers_json_file, "w", encoding="utf-8") as f:
-            json.dump(customers_list, f, ensure_ascii=False, indent=2)
+        save_list(customers_json_file, customers_list)
+        notify_data_changed()
         return True
     except Exception as e:
         st.error(f"顧客データの保存エラー: {e}")
@@ -4352,27 +4420,18 @@ def save_customers_json(customers_list):
 
 def add_customer_to_json(顧客会社名, 顧客部署名, 顧客担当者, 郵便番号, 住所1, 住所2):
     """新規顧客をJSONに追加（住所細分化対応・修正版）"""
-    customers = load_customers_json()
+    顧客リポジトリ = get_customer_repo()
+    customers = 顧客リポジトリ.all()
 
     # 重複チェック（会社名、部署名、担当者の組み合わせ）
-    for customer in customers:
-        if (customer.get("顧客会社名") == 顧客会社名 and 
-            customer.get("顧客部署名") == 顧客部署名 and 
-            customer.get("顧客担当者") == 顧客担当者):
-            return False, "同じ顧客情報が既に登録されています"
+    if 顧客リポジトリ.exists(顧客会社名, 顧客部署名, 顧客担当者):
+        return False, "同じ顧客情報が既に登録されています"
 
     # 顧客Noの生成（会社名ベース）
-    顧客No = 1
-    if customers:
-        # 同じ会社名の顧客を検索
-        同一会社の顧客 = [c for c in customers if c.get("顧客会社名") == 顧客会社名]
-        if 同一会社の顧客:
-            # 同一会社の場合は既存の顧客Noを使用
-            顧客No = 同一会社の顧客[0].get("顧客No", 1)
-        else:
-            # 新しい会社の場合は最大顧客No + 1
-            existing_companies = list(set([c.get("顧客会社名") for c in customers]))
-            顧客No = len(existing_companies) + 1
+    # 同一会社の場合は既存の顧客No、新しい会社の場合は会社数 + 1
+    顧客No = 顧客リポジトリ.customer_no_for_company(顧客会社名)
+    if 顧客No is None:
+        顧客No = 顧客リポジトリ.next_customer_no()
 
     # 統合住所の生成（互換性のため）
     統合住所 = f"{郵便番号} {住所1} {住所2}".strip()
@@ -4405,7 +4464,7 @@ def render_customer_list_tab():
     st.header("⑤ 顧客一覧")
 
     # 顧客データの読み込み
-    customers = load_customers_json()
+    customers = get_customer_repo().all()
 
     if not customers:
         st.info("顧客データがありません。")
@@ -4602,17 +4661,12 @@ def render_customer_list_tab():
                         with confirm_col1:
                             if st.button("はい、削除します", key=f"confirm_delete_customer_{全体カウンタ}"):
                                 # 顧客を削除
-                                customers_updated = load_customers_json()  # 最新データを再読み込み
-                                削除対象 = None
-                                for customer in customers_updated:
-                                    if (customer.get("顧客会社名") == 顧客["顧客会社名"] and 
-                                        customer.get("顧客部署名") == 顧客.get("顧客部署名", "") and 
-                                        customer.get("顧客担当者") == 顧客["顧客担当者"]):
-                                        削除対象 = customer
-                                        break
+                                顧客リポジトリ = get_customer_repo()  # 最新データを取得
+                                customers_updated = 顧客リポジトリ.all()
+                                削除位置 = 顧客リポジトリ.position(顧客["顧客会社名"], 顧客.get("顧客部署名", ""), 顧客["顧客担当者"])
                                 
-                                if 削除対象:
-                                    customers_updated.remove(削除対象)
+                                if 削除位置 is not None:
+                                    del customers_updated[削除位置]
                                     if save_customers_json(customers_updated):
                                         st.success(f"顧客「{顧客['顧客会社名']} - {顧客['顧客担当者']}」を削除しました")
                                         # セッション状態のクリーンアップ
@@ -4643,16 +4697,20 @@ def render_customer_list_tab():
         st.rerun()
 
 # 商品データのJSON管理関数
+@st.cache_data(max_entries=4, show_spinner=False)
+def load_products_from_db(データバージョン):
+    """SQLiteから商品データを読み込む（データバージョンが変わるまで再読み込みしない）"""
+    return storage_sqlite.load_products(SQLITE_DB_PATH)
+
 def load_products_json():
     """商品JSONファイルを読み込む"""
     try:
+        if STORAGE_BACKEND == "sqlite":
+            return load_products_from_db(current_data_version())
+        
+        # 本体ファイルに追記ジャーナルを適用した内容を取得
         products_json_file = os.path.join(DATA_FOLDER, "products.json")
-        if os.path.exists(products_json_file):
-            with open(products_json_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            return data if isinstance(data, list) else []
-        else:
-            return []
+        return load_list(products_json_file)
     except Exception as e:
         st.error(f"商品データの読み込みエラー: {e}")
         return []
@@ -4660,10 +4718,15 @@ def load_products_json():
 def save_products_json(products_list):
     """商品データをJSONファイルに保存"""
     try:
-        os.makedirs(DATA_FOLDER, exist_ok=True)
+        if STORAGE_BACKEND == "sqlite":
+            storage_sqlite.save_products(SQLITE_DB_PATH, products_list)
+            notify_data_changed()
+            return True
+        
+        # 変更箇所だけをジャーナルに追記（一定サイズを超えると本体に畳み込み）
         products_json_file = os.path.join(DATA_FOLDER, "products.json")
-        with open(products_json_file, "w", encoding="utf-8") as f:
-            json.dump(products_list, f, ensure_ascii=False, indent=2)
+        save_list(products_json_file, products_list)
+        notify_data_changed()
         return True
     except Exception as e:
         st.error(f"商品データの保存エラー: {e}")
@@ -4671,13 +4734,12 @@ def save_products_json(products_list):
 
 def add_product_to_json(品名, 単位, 単価, 備考):
     """新規商品をJSONに追加（移行元フィールド削除版）"""
+    # 重複チェック（商品カタログの品名インデックスで判定）
+    if get_product_catalog(current_data_version()).exists(品名):
+        return False, "同じ商品名が既に登録されています"
+    
     products = load_products_json()
 
-    # 重複チェック
-    for product in products:
-        if product.get("品名") == 品名:
-            return False, "同じ商品名が既に登録されています"
-
     # 新規商品データ（移行元フィールドを削除）
     new_product = {
         "品名": 品名,
@@ -4699,29 +4761,28 @@ def update_product_in_json(元商品データ, 品名, 単位, 単価, 備考):
     try:
         products = load_products_json()
         
-        # 元の商品データを検索
-        for i, product in enumerate(products):
-            if product.get("品名") == 元商品データ["品名"]:
-                
-                # 重複チェック（自分以外で同じ商品名）
-                if 品名 != 元商品データ["品名"]:  # 商品名が変更された場合のみチェック
-                    for j, other_product in enumerate(products):
-                        if i != j and other_product.get("品名") == 品名:
-                            return False, "同じ商品名が既に存在します"
-                
-                # 商品情報を更新
-                products[i]["品名"] = 品名
-                products[i]["単位"] = 単位
-                products[i]["単価"] = float(単価)
-                products[i]["備考"] = 備考
-                products[i]["更新日"] = datetime.date.today().strftime("%Y-%m-%d")
-                
-                if save_products_json(products):
-                    return True, f"商品「{品名}」を更新しました"
-                else:
-                    return False, "商品データの保存に失敗しました"
+        # 元の商品データを品名インデックスで検索
+        商品カタログ = get_product_catalog(current_data_version())
+        i = 商品カタログ.position(元商品データ["品名"])
+        
+        if i is None or i >= len(products) or products[i].get("品名") != 元商品データ["品名"]:
+            return False, "更新対象の商品が見つかりませんでした"
         
-        return False, "更新対象の商品が見つかりませんでした"
+        # 重複チェック（自分以外で同じ商品名・商品名が変更された場合のみ）
+        if 品名 != 元商品データ["品名"] and 商品カタログ.exists(品名):
+            return False, "同じ商品名が既に存在します"
+        
+        # 商品情報を更新
+        products[i]["品名"] = 品名
+        products[i]["単位"] = 単位
+        products[i]["単価"] = float(単価)
+        products[i]["備考"] = 備考
+        products[i]["更新日"] = datetime.date.today().strftime("%Y-%m-%d")
+        
+        if save_products_json(products):
+            return True, f"商品「{品名}」を更新しました"
+        else:
+            return False, "商品データの保存に失敗しました"
         
     except Exception as e:
         return False, f"更新処理でエラーが発生しました: {e}"
@@ -4754,15 +4815,7 @@ def render_sidebar_status():
         
         # 明細情報（分類項目を除外して計算）
         st.subheader("明細情報")
-        全明細リスト = st.session_state.get("明細リスト", [])
-        通常明細リスト = [item for item in 全明細リスト if not item.get("分類", False)]
-        
-        明細数 = len(通常明細リスト)
-        合計金額 = 0
-        for item in 通常明細リスト:
-            金額 = item.get("金額", 0)
-            if isinstance(金額, (int, float)):
-                合計金額 += 金額
+        合計金額, _, 明細数 = get_detail_totals()
         
         st.write(f"**明細数:** {明細数}件")
         st.write(f"**合計金額:** ¥{合計金額:,}")
@@ -4803,7 +4856,7 @@ def reset_all_data():
         "選択された顧客会社名", "選択された顧客部署名", "選択された顧客担当者", "選択された顧客住所",
         "選択された郵便番号", "選択された住所1", "選択された住所2",
         "発行者名", "備考", "メモ", "状況", "受注日", "納品日",
-        "売上額", "仕入額", "粗利", "粗利率", "売上額自動更新", "担当部署"
+        "売上額", "仕入額", "粗利", "粗利率", "売上額自動更新", "担当部署", "保存済み見積No"
     ]
 
     # 入力中データもクリア（住所関連も追加）
@@ -4974,8 +5027,11 @@ def main():
     # セッション状態の初期化
     init_session_state()
 
+    # 明細の管理費と合計を再計算（明細の追加・編集・削除・並べ替えの後は必ず再実行される）
+    recalculate_session_details()
+
     # データの読み込み（JSONから）
-    顧客一覧, _, 品名一覧 = load_data()
+    顧客一覧, _, 品名一覧 = load_data(current_data_version())
         
     # タブの選択
     タブ選択肢 = ["① 案件一覧", "② 顧客情報を入力", "③ 案件情報を入力", "④ 明細情報を入力", "⑤ 顧客一覧", "⑥ 商品一覧"]
@@ -0,0 +1,205 @@
+# 見積書の一括出力
+# 案件一覧で絞り込んだ複数の見積を、プロセスプールで並行して見積書（xlsx）に変換し、
+# 出来上がった順に1つのZIPファイルへ書き込む。ZIPは一定サイズまではメモリ上、
+# 超えた分は一時ファイルに書き出す（件数が多くてもメモリ上に全件を持たない）。
+# 見積書の作成（openpyxl）はCPU処理のため、スレッドではなくプロセスで分散して
+# サーバーの全コアを使う。プロセスプールは最初の一括出力で作成して以降も使い回し、
+# 各プロセスはテンプレートを一度だけ解析して使い回す。
+import os
+import re
+import math
+import zipfile
+import tempfile
+import datetime
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from estimate_excel_writer import write_estimate_to_excel
+
+# 一括出力のプロセス数の上限（環境変数 SFA_EXPORT_WORKERS で変更可・既定はCPUコア数）
+BULK_EXPORT_MAX_WORKERS = int(os.environ.get("SFA_EXPORT_WORKERS", "0") or 0) or os.cpu_count() or 1
+
+# 1プロセスあたりの見積の件数の目安（件数が少ない場合にプロセスを使いすぎない）
+ESTIMATES_PER_WORKER = 4
+
+# ZIPをメモリ上に保持するサイズの上限（超えたら一時ファイルに書き出す）
+BULK_EXPORT_SPOOL_BYTES = 16 * 1024 * 1024
+
+# 全セッションで共有するプロセスプール（最初の一括出力で作成）
+_executor = None
+_executor_lock = threading.Lock()
+
+# ファイル名に使用できない文字
+_ファイル名禁止文字 = re.compile(r'[<>:"/\\|?*]')
+
+
+def make_export_filename(見積No, 案件名):
+    """見積書のファイル名を作成（ファイル名に使用できない文字を置換・長い案件名は短縮）"""
+    安全な案件名 = _ファイル名禁止文字.sub("_", str(案件名 or "")).strip()
+    if len(安全な案件名) > 50:
+        安全な案件名 = 安全な案件名[:50] + "..."
+    return f"{見積No}見積書_{安全な案件名}.xlsx"
+
+
+def _to_date(value):
+    """保存された発行日を日付に変換（変換できない場合はそのまま）"""
+    try:
+        return datetime.date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return value
+
+
+def uses_coefficient(data):
+    """見積で係数機能を使用しているか（保存していない旧形式のファイルは1以外の係数があるかで判定）"""
+    if "係数機能使用" in data:
+        return bool(data["係数機能使用"])
+    return any(
+        not item.get("分類", False) and item.get("係数", 1) not in (1, 1.0, "", None)
+        for item in data.get("明細リスト", []) or []
+    )
+
+
+def build_export_data(data):
+    """保存された見積データから見積書の出力用データを作成（商品番号付き）"""
+    明細リスト = []
+    商品番号 = 0
+    for item in data.get("明細リスト", []) or []:
+        処理済みitem = dict(item)
+        if item.get("分類", False):
+            処理済みitem["商品番号"] = None  # 分類は番号なし
+        else:
+            商品番号 += 1
+            処理済みitem["商品番号"] = 商品番号
+        明細リスト.append(処理済みitem)
+
+    郵便番号 = data.get("郵便番号", "")
+    住所1 = data.get("住所1", "")
+    住所2 = data.get("住所2", "")
+    return {
+        "見積No": data.get("見積No", ""),
+        "案件名": data.get("案件名", "案件名未設定"),
+        "発行日": _to_date(data.get("発行日", "")) if data.get("発行日") else datetime.date.today(),
+        "顧客会社名": data.get("顧客会社名", ""),
+        "顧客部署名": data.get("顧客部署名", ""),
+        "顧客担当者": data.get("顧客担当者", ""),
+        "郵便番号": 郵便番号,
+        "住所1": 住所1,
+        "住所2": 住所2,
+        "顧客住所": data.get("顧客住所", "") or f"{郵便番号} {住所1} {住所2}".strip(),
+        "発行者名": data.get("発行者名", ""),
+        "備考": data.get("備考", ""),
+        "明細リスト": 明細リスト,
+        "係数機能使用": uses_coefficient(data),
+    }
+
+
+def render_estimate(見積データ):
+    """見積書を1件作成（戻り値: (ファイル名, xlsxのバイト列)・プロセスプールから呼ぶためモジュール直下に定義）"""
+    ファイル名 = make_export_filename(見積データ.get("見積No", ""), 見積データ.get("案件名", ""))
+    return ファイル名, write_estimate_to_excel(見積データ, ファイル名, as_bytes=True)
+
+
+def _get_executor():
+    """共有のプロセスプールを取得（初回のみ作成・プロセスは必要になった分だけ起動される）"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Streamlit はスレッドを使うため、fork ではなく spawn でプロセスを起動する
+            _executor = ProcessPoolExecutor(
+                max_workers=BULK_EXPORT_MAX_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+
+def _discard_executor(executor):
+    """使えなくなったプロセスプールを破棄（次回の一括出力で作り直す）"""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _unique_name(ファイル名, 使用済み):
+    """ZIP内で重複しないファイル名（重複する場合は連番を付ける）"""
+    名前, 拡張子 = os.path.splitext(ファイル名)
+    候補 = ファイル名
+    番号 = 2
+    while 候補 in 使用済み:
+        候補 = f"{名前}_{番号}{拡張子}"
+        番号 += 1
+    使用済み.add(候補)
+    return 候補
+
+
+def export_estimates_zip(見積データ一覧, progress=None, max_workers=None):
+    """複数の見積書を並行して作成し、1つのZIPファイルにまとめる
+
+    見積データ一覧は build_export_data で作成した出力用データのリスト、
+    progress は (完了件数, 全件数) を受け取る関数（省略可）。
+    戻り値: (ZIPの一時ファイル（先頭に戻したもの・使い終わったら閉じる）, 出力件数, [(見積No, エラー), ...])
+    """
+    全件数 = len(見積データ一覧)
+    output = tempfile.SpooledTemporaryFile(max_size=BULK_EXPORT_SPOOL_BYTES)
+    try:
+        出力件数, エラー一覧 = _write_zip(output, 見積データ一覧, 全件数, progress, max_workers)
+    except BaseException:
+        output.close()
+        raise
+    output.seek(0)
+    return output, 出力件数, エラー一覧
+
+
+def _write_zip(output, 見積データ一覧, 全件数, progress, max_workers):
+    """見積書を作成してZIPに書き込む（戻り値: (出力件数, [(見積No, エラー), ...])）"""
+    使用済み = set()
+    出力件数 = 0
+    エラー一覧 = []
+
+    # xlsx は圧縮済みのため、ZIPでは圧縮せずに格納する
+    with zipfile.ZipFile(output, "w", zipfile.ZIP_STORED) as archive:
+        def add_result(見積No, future_or_result):
+            nonlocal 出力件数
+            try:
+                ファイル名, file_data = future_or_result()
+            except BrokenProcessPool:
+                raise
+            except Exception as e:
+                エラー一覧.append((見積No, e))
+            else:
+                archive.writestr(_unique_name(ファイル名, 使用済み), file_data)
+                出力件数 += 1
+            if progress:
+                progress(出力件数 + len(エラー一覧), 全件数)
+
+        workers = min(max_workers or BULK_EXPORT_MAX_WORKERS, math.ceil(全件数 / ESTIMATES_PER_WORKER))
+        if workers <= 1:
+            # 件数が少ない・1コアの場合はプロセスを使わずにこのプロセスで作成
+            for 見積データ in 見積データ一覧:
+                add_result(見積データ.get("見積No", ""), lambda: render_estimate(見積データ))
+        else:
+            executor = _get_executor()
+            未投入 = iter(見積データ一覧)
+            実行中 = {}
+
+            def submit(件数):
+                for 見積データ in itertools.islice(未投入, 件数):
+                    実行中[executor.submit(render_estimate, 見積データ)] = 見積データ.get("見積No", "")
+
+            try:
+                # 同時に実行するのは workers 件まで（共有のプールを1回の出力で占有しない）
+                submit(workers)
+                # 出来上がった順にZIPへ書き込み、空いた分だけ次の見積を投入する
+                while 実行中:
+                    完了, _ = wait(実行中, return_when=FIRST_COMPLETED)
+                    for future in 完了:
+                        add_result(実行中.pop(future), future.result)
+                    submit(len(完了))
+            except BrokenProcessPool:
+                _discard_executor(executor)
+                raise
+
+    return 出力件数, エラー一覧
@@ -0,0 +1,98 @@
+# 顧客リポジトリ
+# 顧客一覧を一度だけ読み込み、重複チェック・顧客No採番・住所検索で使う
+# ハッシュインデックスと一緒にプロセス内で共有する。
+# 元データ（customers.json 等）のシグネチャが変わった場合のみ読み込み直す。
+import os
+import threading
+
+# 元データのパスごとのプロセス内キャッシュ（全セッションで共有）
+_repositories = {}
+_lock = threading.Lock()
+
+
+def _customer_key(会社名, 部署名, 担当者):
+    """重複判定用のキー（会社名・部署名・担当者）"""
+    return (会社名 or "", 部署名 or "", 担当者 or "")
+
+
+class CustomerRepository:
+    """顧客一覧と検索用インデックス"""
+
+    def __init__(self, customers):
+        self._customers = [dict(customer) for customer in customers or []]
+
+        # (会社名, 部署名, 担当者) → 一覧内の位置（重複がある場合は先頭）
+        self._position_by_key = {}
+        # (会社名, 担当者) → 一覧内の位置（部署名を問わない検索用）
+        self._position_by_contact = {}
+        # 会社名 → 顧客No（同一会社の先頭の顧客No）
+        self._customer_no_by_company = {}
+        # 会社名 → 登録人数
+        self._company_counts = {}
+
+        for position, customer in enumerate(self._customers):
+            会社名 = customer.get("顧客会社名", "")
+            担当者 = customer.get("顧客担当者", "")
+            self._position_by_key.setdefault(_customer_key(会社名, customer.get("顧客部署名", ""), 担当者), position)
+            self._position_by_contact.setdefault((会社名 or "", 担当者 or ""), position)
+            self._customer_no_by_company.setdefault(会社名, customer.get("顧客No", 1))
+            self._company_counts[会社名] = self._company_counts.get(会社名, 0) + 1
+
+    def all(self):
+        """顧客一覧のコピーを取得（呼び出し側で変更してもキャッシュに影響しない）"""
+        return [dict(customer) for customer in self._customers]
+
+    def __len__(self):
+        return len(self._customers)
+
+    def position(self, 会社名, 部署名, 担当者):
+        """会社名・部署名・担当者が一致する顧客の一覧内の位置（存在しない場合はNone）"""
+        return self._position_by_key.get(_customer_key(会社名, 部署名, 担当者))
+
+    def exists(self, 会社名, 部署名, 担当者):
+        """会社名・部署名・担当者が一致する顧客が登録済みか"""
+        return _customer_key(会社名, 部署名, 担当者) in self._position_by_key
+
+    def find_by_contact(self, 会社名, 担当者):
+        """会社名・担当者が一致する顧客（部署名は問わない・存在しない場合はNone）"""
+        position = self._position_by_contact.get((会社名 or "", 担当者 or ""))
+        return dict(self._customers[position]) if position is not None else None
+
+    def customer_no_for_company(self, 会社名):
+        """登録済みの会社の顧客No（未登録の会社はNone）"""
+        return self._customer_no_by_company.get(会社名)
+
+    def next_customer_no(self, 移動元会社名=None):
+        """新しい会社に割り当てる顧客No（登録済みの会社数 + 1）
+
+        移動元会社名を指定した場合、その会社の唯一の顧客が別会社へ移る前提で数える
+        """
+        会社数 = len(self._company_counts)
+        if 移動元会社名 is not None and self._company_counts.get(移動元会社名) == 1:
+            会社数 -= 1
+        return 会社数 + 1
+
+
+def _source_signature(paths):
+    """元データのシグネチャ（存在しないファイルはNone）"""
+    signature = []
+    for path in paths:
+        try:
+            stat_result = os.stat(path)
+            signature.append((stat_result.st_mtime_ns, stat_result.st_size, stat_result.st_ino))
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
+
+
+def get_customer_repository(source_paths, load_customers):
+    """共有の顧客リポジトリを取得（元データが変更された場合のみ load_customers で読み込み直す）"""
+    key = tuple(os.path.abspath(path) for path in source_paths)
+    signature = _source_signature(source_paths)
+    with _lock:
+        cached = _repositories.get(key)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        repository = CustomerRepository(load_customers())
+        _repositories[key] = (signature, repository)
+        return repository
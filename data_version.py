@@ -0,0 +1,40 @@
+# データバージョン
+# いずれかのセッションが見積・顧客・商品データを保存するたびに data/_data_version の
+# 値を1つ増やす。各キャッシュはこの値をキーに含めることで、他のユーザーの保存も
+# 次の再実行で反映しつつ、変更がない間はディスクを読み直さずに済む。
+import os
+
+from file_lock import file_lock
+
+DATA_VERSION_FILENAME = "_data_version"
+DATA_VERSION_LOCK_FILENAME = "_data_version.lock"
+
+
+def _version_path(data_folder):
+    return os.path.join(data_folder, DATA_VERSION_FILENAME)
+
+
+def _lock_path(data_folder):
+    return os.path.join(data_folder, DATA_VERSION_LOCK_FILENAME)
+
+
+def get_data_version(data_folder):
+    """現在のデータバージョンを取得（存在しない・壊れている場合は0）"""
+    try:
+        with open(_version_path(data_folder), "r", encoding="utf-8") as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def bump_data_version(data_folder):
+    """データバージョンを1つ増やす（戻り値: 新しいバージョン）"""
+    os.makedirs(data_folder, exist_ok=True)
+    with file_lock(_lock_path(data_folder)):
+        version = get_data_version(data_folder) + 1
+        path = _version_path(data_folder)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(str(version))
+        os.replace(tmp_path, path)
+    return version
@@ -1,7 +1,26 @@
 from openpyxl import load_workbook
+import io
 import os
 from datetime import datetime
 import re
+import json
+import pickle
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+# テンプレートのプロセス内キャッシュ（テンプレートのパス → (シグネチャ, 読み込み直後のブックの原本, 結合セルの対応表)）
+# 原本は pickle したバイト列で保持し、出力のたびに復元して複製する（原本は書き換えない）
+_template_cache = {}
+_template_lock = threading.Lock()
+
+# 出力結果のプロセス内キャッシュ（見積データとテンプレートの版のハッシュ → xlsxのバイト列・古い順）
+# 合計サイズが上限を超えた場合は最も長く使われていないものから破棄する
+EXPORT_CACHE_MAX_BYTES = 32 * 1024 * 1024
+_export_cache = OrderedDict()
+_export_cache_size = 0
+_export_lock = threading.Lock()
 
 def get_customer_address_from_session():
     """セッション状態から顧客住所を取得する（細分化対応）"""
@@ -16,20 +35,64 @@ def get_customer_address_from_session():
     except:
         return "", "", ""
 
-def parse_address(address):
-    """住所を郵便番号、住所1（番地まで）、住所2（建物名など）に分割（修正版）"""
-    if not address:
-        return "", "", ""
-    
-    # 郵便番号パターン（〒123-4567 または 123-4567）
-    postal_pattern = r'〒?(\d{3}-\d{4})'
-    postal_match = re.search(postal_pattern, address)
+# 住所分割用のパターン（呼び出しのたびにコンパイルしないよう事前にコンパイル）
+# 郵便番号パターン（〒123-4567 または 123-4567・全角数字やハイフンの表記ゆれも許容）
+_郵便番号パターン = re.compile(r'〒?\s*([0-9０-９]{3})\s*[-－‐−―ー]\s*([0-9０-９]{4})')
+
+# 建物名パターン（明確な建物名キーワードがある場合のみ）
+_建物名パターン一覧 = [re.compile(pattern) for pattern in [
+    # 明確な建物名キーワード + その他
+    r'(.+?)([^0-9\s]+(?:ビル|マンション|アパート|ハイツ|コーポ|館|棟|タワー|プラザ|センター|会館|ホール|ヴィラ|レジデンス|パレス|コート|テラス|ガーデン|ハウス).*)',
+    # 階数表記（明確に○階、○F等）
+    r'(.+?)(\s*\d+[階F].*)',
+    # 号室表記（明確に○号室、○号等で終わる）
+    r'(.+?)(\s*[0-9A-Za-z]+号室?\s*$)',
+    # 括弧内の建物情報
+    r'(.+?)(\s*[（(].+[)）]\s*$)',
+]]
+
+# より厳格な建物名判定
+_厳格建物名パターン一覧 = [re.compile(pattern) for pattern in [
+    # アルファベット+数字の組み合わせで明確に部屋番号と分かるもの
+    r'(.+?)(\s*[A-Za-z]\d+\s*$)',  # A101、B205等
+    # 区画・ブロック名（カタカナ）+ 番号
+    r'(.+?)(\s*[ア-ヴ]+[0-9]+\s*$)',  # アルファ101等
+]]
+
+# 住所2が番地情報のみの場合の危険パターン
+_番地のみパターン一覧 = [re.compile(pattern) for pattern in [
+    r'^\d+$',                    # 数字のみ
+    r'^\d+号$',                  # ○号のみ
+    r'^\d+-\d+$',               # ○-○のみ
+    r'^\d+-\d+-\d+$',           # ○-○-○のみ
+    r'^\d+番地?$',              # ○番地のみ
+    r'^\d+丁目$',               # ○丁目のみ
+    r'^\d+番\d+号?$',           # ○番○号のみ
+]]
+
+# 住所1が都道府県から始まっているかの判定
+_都道府県パターン = re.compile(r'^(?:北海道|東京都|京都府|大阪府|.{2,3}県)')
+
+
+def parse_address_with_confidence(address):
+    """住所を郵便番号、住所1（番地まで）、住所2（建物名など）に分割し、分割結果が確実かも返す
+
+    戻り値: (郵便番号, 住所1, 住所2, 確実)
+    郵便番号が見つからない・住所1が都道府県から始まらない場合は確実=False。
+    空の住所は分割するものがないため確実=True、欠損値の文字列（"nan"・"none"）は確実=False
+    """
+    if address is None or not str(address).strip():
+        return "", "", "", True
+    if str(address).strip().lower() in ("nan", "none"):
+        return "", "", "", False
+    address = str(address)
     
     郵便番号 = ""
     残り住所 = address
     
+    postal_match = _郵便番号パターン.search(address)
     if postal_match:
-        郵便番号 = postal_match.group(1)
+        郵便番号 = unicodedata.normalize("NFKC", f"{postal_match.group(1)}-{postal_match.group(2)}")
         残り住所 = address.replace(postal_match.group(0), "").strip()
     
     # 住所1（番地まで）と住所2（建物名など）を分割
@@ -37,21 +100,9 @@ def parse_address(address):
     住所2 = ""
     
     # **重要：建物名が明確にある場合のみ分割する**
-    # 建物名パターン（明確な建物名キーワードがある場合のみ）
-    building_patterns = [
-        # 明確な建物名キーワード + その他
-        r'(.+?)([^0-9\s]+(?:ビル|マンション|アパート|ハイツ|コーポ|館|棟|タワー|プラザ|センター|会館|ホール|ヴィラ|レジデンス|パレス|コート|テラス|ガーデン|ハウス).*)',
-        # 階数表記（明確に○階、○F等）
-        r'(.+?)(\s*\d+[階F].*)',
-        # 号室表記（明確に○号室、○号等で終わる）
-        r'(.+?)(\s*[0-9A-Za-z]+号室?\s*$)',
-        # 括弧内の建物情報
-        r'(.+?)(\s*[（(].+[)）]\s*$)',
-    ]
-    
     建物名分割済み = False
-    for pattern in building_patterns:
-        match = re.search(pattern, 残り住所)
+    for pattern in _建物名パターン一覧:
+        match = pattern.search(残り住所)
         if match:
             住所1 = match.group(1).strip()
             住所2 = match.group(2).strip()
@@ -59,24 +110,10 @@ def parse_address(address):
             break
     
     # 建物名パターンに一致しない場合は、番地のみで分割しない
+    # （単純な番地や番地のみの組み合わせは住所1にまとめる）
     if not 建物名分割済み:
-        # **修正：番地情報は住所1に含める**
-        # 以下のパターンは住所1にまとめる
-        
-        # 危険なパターン（分割しない）：
-        # - 単純な番地（1-2-3、1丁目2番3号など）
-        # - 番地のみの組み合わせ
-        
-        # より厳格な建物名判定
-        strict_building_patterns = [
-            # アルファベット+数字の組み合わせで明確に部屋番号と分かるもの
-            r'(.+?)(\s*[A-Za-z]\d+\s*$)',  # A101、B205等
-            # 区画・ブロック名（カタカナ）+ 番号
-            r'(.+?)(\s*[ア-ヴ]+[0-9]+\s*$)',  # アルファ101等
-        ]
-        
-        for pattern in strict_building_patterns:
-            match = re.search(pattern, 残り住所)
+        for pattern in _厳格建物名パターン一覧:
+            match = pattern.search(残り住所)
             if match:
                 住所1 = match.group(1).strip()
                 住所2 = match.group(2).strip()
@@ -89,30 +126,107 @@ def parse_address(address):
         住所2 = ""
     
     # **追加の安全チェック**：住所2が番地情報のみの場合は住所1に統合
+    # （元の表記のまま戻し、「9番2号」が「9番 2号」にならないようにする）
     if 住所2:
-        # 危険パターン：数字のみ、番地のみ、号のみなど
-        危険パターン = [
-            r'^\d+$',                    # 数字のみ
-            r'^\d+号$',                  # ○号のみ
-            r'^\d+-\d+$',               # ○-○のみ
-            r'^\d+-\d+-\d+$',           # ○-○-○のみ
-            r'^\d+番地?$',              # ○番地のみ
-            r'^\d+丁目$',               # ○丁目のみ
-            r'^\d+番\d+号?$',           # ○番○号のみ
-        ]
-        
-        for pattern in 危険パターン:
-            if re.match(pattern, 住所2.strip()):
-                # 住所2を住所1に統合
-                住所1 = f"{住所1} {住所2}".strip()
+        for pattern in _番地のみパターン一覧:
+            if pattern.match(住所2.strip()):
+                住所1 = 残り住所.strip()
                 住所2 = ""
                 break
     
+    確実 = bool(郵便番号) and bool(_都道府県パターン.match(住所1))
+    return 郵便番号, 住所1, 住所2, 確実
+
+
+def _template_signature(template_path):
+    """テンプレートの変更検知用シグネチャ（更新時刻・サイズ）"""
+    stat_result = os.stat(template_path)
+    return stat_result.st_mtime_ns, stat_result.st_size
+
+
+def build_merged_cell_map(ws):
+    """結合セル内の各セル (行, 列) → 結合範囲の左上セル (行, 列) の対応表を作成"""
+    merged_map = {}
+    for merged in ws.merged_cells.ranges:
+        anchor = (merged.min_row, merged.min_col)
+        for row in range(merged.min_row, merged.max_row + 1):
+            for col in range(merged.min_col, merged.max_col + 1):
+                merged_map[(row, col)] = anchor
+    return merged_map
+
+
+def load_template(template_path):
+    """テンプレートのブックと作業シートの結合セルの対応表を取得
+
+    解析は初回とテンプレートの更新時のみ行い、以降は原本の複製を返す（対応表は共有のため書き換えない）
+    """
+    key = os.path.abspath(template_path)
+    with _template_lock:
+        signature = _template_signature(template_path)
+        cached = _template_cache.get(key)
+        if cached is None or cached[0] != signature:
+            wb = load_workbook(template_path)
+            # openpyxl のブックは deepcopy するとスタイルの参照が壊れるため、pickle で原本を保持
+            cached = (signature, pickle.dumps(wb, pickle.HIGHEST_PROTOCOL), build_merged_cell_map(wb.active))
+            _template_cache[key] = cached
+    return pickle.loads(cached[1]), cached[2]
+
+
+def export_cache_key(見積データ, template_path):
+    """出力結果のキャッシュキー（見積データの内容とテンプレートの版から求めたSHA-256）"""
+    payload = json.dumps(
+        [見積データ, os.path.abspath(template_path), _template_signature(template_path)],
+        ensure_ascii=False, sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _get_cached_export(key):
+    """キャッシュ済みの出力結果を取得（ない場合はNone）"""
+    with _export_lock:
+        file_data = _export_cache.get(key)
+        if file_data is not None:
+            _export_cache.move_to_end(key)
+        return file_data
+
+
+def _put_cached_export(key, file_data):
+    """出力結果をキャッシュ（上限を超えた分は使われていない順に破棄・上限より大きいものは保持しない）"""
+    global _export_cache_size
+    if len(file_data) > EXPORT_CACHE_MAX_BYTES:
+        return
+    with _export_lock:
+        previous = _export_cache.pop(key, None)
+        if previous is not None:
+            _export_cache_size -= len(previous)
+        _export_cache[key] = file_data
+        _export_cache_size += len(file_data)
+        while _export_cache_size > EXPORT_CACHE_MAX_BYTES:
+            _, evicted = _export_cache.popitem(last=False)
+            _export_cache_size -= len(evicted)
+
+
+def _archive_export(file_data, archive_path):
+    """出力結果の控えをディスクに保存（archive_path が未指定の場合は何もしない）"""
+    if archive_path:
+        os.makedirs(os.path.dirname(archive_path) or ".", exist_ok=True)
+        with open(archive_path, "wb") as f:
+            f.write(file_data)
+
+
+def parse_address(address):
+    """住所を郵便番号、住所1（番地まで）、住所2（建物名など）に分割（事前コンパイル版）"""
+    郵便番号, 住所1, 住所2, _ = parse_address_with_confidence(address)
     return 郵便番号, 住所1, 住所2
 
 
-def write_estimate_to_excel(data_or_template=None, output_filename=None):
-    """見積書をExcelに出力する（係数対応版）"""
+def write_estimate_to_excel(data_or_template=None, output_filename=None, as_bytes=False, archive_path=None):
+    """見積書をExcelに出力する（係数対応版）
+
+    as_bytes=True の場合はファイルに保存せずメモリ上で作成し、Excelファイルのバイト列を返す
+    （archive_path を指定した場合のみ、同じ内容を控えとしてそのパスにも書き込む）。
+    見積データとテンプレートが前回と同じ場合は作成し直さずにキャッシュしたバイト列を返す。
+    """
     
     # 引数の解析
     if data_or_template is None:
@@ -172,16 +286,20 @@ def write_estimate_to_excel(data_or_template=None, output_filename=None):
     if not os.path.exists(template_path):
         raise FileNotFoundError(f"テンプレートファイルが見つかりません: {template_path}")
     
-    wb = load_workbook(template_path)
+    # 内容が変わっていない見積書はキャッシュから返す（テンプレートが更新された場合はキーが変わる）
+    if as_bytes:
+        キャッシュキー = export_cache_key(見積データ, template_path)
+        file_data = _get_cached_export(キャッシュキー)
+        if file_data is not None:
+            _archive_export(file_data, archive_path)
+            return file_data
+    
+    wb, 結合セル対応表 = load_template(template_path)
     ws = wb.active
 
     def safe_write(ws, row, col, value):
-        """結合セルに対応した書き込み"""
-        for merged in ws.merged_cells.ranges:
-            if (merged.min_row <= row <= merged.max_row and 
-                merged.min_col <= col <= merged.max_col):
-                ws.cell(merged.min_row, merged.min_col, value)
-                return
+        """結合セルに対応した書き込み（結合範囲内のセルは左上のセルに書き込む）"""
+        row, col = 結合セル対応表.get((row, col), (row, col))
         ws.cell(row, col, value)
 
     # 見積データから各項目を取得
@@ -328,6 +446,15 @@ def write_estimate_to_excel(data_or_template=None, output_filename=None):
         ws.cell(41, 13).value = "=ROUNDDOWN(M40*0.1,0)"  # M41: 消費税
         ws.cell(42, 13).value = "=M40+M41"           # M42: 合計
 
+    # メモリ上で作成してバイト列を返す（ダウンロード用・一時ファイルを作らない）
+    if as_bytes:
+        buffer = io.BytesIO()
+        wb.save(buffer)
+        file_data = buffer.getvalue()
+        _put_cached_export(キャッシュキー, file_data)
+        _archive_export(file_data, archive_path)
+        return file_data
+
     # ファイルを保存
     wb.save(保存先ファイル名)
     return True
@@ -0,0 +1,172 @@
+# 見積番号の採番
+# 発行日ごとの最終連番を管理ファイルに保持し、ファイルロックの下で更新する。
+# 採番のコストは既存の見積件数に依存せず、同時に採番した複数セッションが
+# 同じ番号を受け取ることはない。
+# 画面に表示・提案する番号は peek_estimate_no で取得し（採番しない）、
+# 見積を初めて保存するときに reserve_estimate_no で確定する（取り消された
+# 日付変更や再生成で連番が欠番にならない）。
+#
+# 管理ファイルの再構築:
+#     python estimate_no_allocator.py rebuild [データフォルダ]
+import os
+import sys
+import json
+
+from file_lock import file_lock
+from project_index import load_project_index
+
+SEQUENCE_TABLE_FILENAME = "_sequence_table.json"
+SEQUENCE_LOCK_FILENAME = "_sequence_table.lock"
+SEQUENCE_TABLE_VERSION = 1
+
+
+def _table_path(data_folder):
+    return os.path.join(data_folder, SEQUENCE_TABLE_FILENAME)
+
+
+def _lock_path(data_folder):
+    return os.path.join(data_folder, SEQUENCE_LOCK_FILENAME)
+
+
+def _parse_estimate_no(見積No):
+    """見積番号（YYYYMMDDXXX）を発行日文字列と連番に分解（形式が異なる場合はNone）"""
+    見積No = str(見積No)
+    if len(見積No) >= 11 and 見積No[:8].isdigit() and 見積No[8:].isdigit():
+        return 見積No[:8], int(見積No[8:])
+    return None
+
+
+def _read_table(data_folder):
+    """連番テーブルを読み込む（存在しない・壊れている場合はNone）"""
+    try:
+        with open(_table_path(data_folder), "r", encoding="utf-8") as f:
+            table = json.load(f)
+        if isinstance(table, dict) and table.get("version") == SEQUENCE_TABLE_VERSION:
+            return table.get("sequences", {})
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _write_table(data_folder, sequences):
+    """連番テーブルを一時ファイル経由で書き込み"""
+    os.makedirs(data_folder, exist_ok=True)
+    path = _table_path(data_folder)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": SEQUENCE_TABLE_VERSION, "sequences": sequences}, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def _scan_sequences(data_folder):
+    """data/ 内の見積から発行日ごとの最大連番を集計"""
+    sequences = {}
+    サマリー一覧, _ = load_project_index(data_folder)
+
+    for ファイル見積No, サマリー in サマリー一覧.items():
+        # ファイル名とJSON内の見積番号の両方を確認（不一致の場合に備えて）
+        for 見積No in (ファイル見積No, サマリー.get("見積No", "")):
+            parsed = _parse_estimate_no(見積No)
+            if parsed:
+                発行日_str, 連番 = parsed
+                sequences[発行日_str] = max(sequences.get(発行日_str, 0), 連番)
+
+    return sequences
+
+
+def rebuild_sequence_table(data_folder):
+    """data/ の見積から連番テーブルを再構築"""
+    with file_lock(_lock_path(data_folder)):
+        sequences = _scan_sequences(data_folder)
+        _write_table(data_folder, sequences)
+    return sequences
+
+
+def get_max_sequence(data_folder, 発行日_str):
+    """指定日付の最終連番を取得（採番はしない）"""
+    sequences = _read_table(data_folder)
+    if sequences is None:
+        sequences = rebuild_sequence_table(data_folder)
+    return sequences.get(発行日_str, 0)
+
+
+def _format_estimate_no(発行日_str, 連番):
+    return f"{発行日_str}{str(連番).zfill(3)}"
+
+
+def _estimate_file_exists(data_folder, 発行日_str, 連番):
+    return os.path.exists(os.path.join(data_folder, f"{_format_estimate_no(発行日_str, 連番)}.json"))
+
+
+def _next_sequence(data_folder, sequences, 発行日_str):
+    """指定日付の次の連番（テーブル外で作成されたファイルと重複しないようにする）"""
+    連番 = sequences.get(発行日_str, 0) + 1
+    while _estimate_file_exists(data_folder, 発行日_str, 連番):
+        連番 += 1
+    return 連番
+
+
+def peek_estimate_no(data_folder, 発行日):
+    """指定日付の次の見積番号を取得（採番はしない・表示や提案用・発行日がNoneの場合は空文字列）"""
+    if 発行日 is None:
+        return ""
+
+    発行日_str = 発行日.strftime('%Y%m%d')
+    sequences = _read_table(data_folder)
+    if sequences is None:
+        sequences = _scan_sequences(data_folder)
+    return _format_estimate_no(発行日_str, _next_sequence(data_folder, sequences, 発行日_str))
+
+
+def reserve_estimate_no(data_folder, 見積No):
+    """peek_estimate_no で取得した見積番号を採番済みにする（戻り値: 確定した見積番号）
+
+    その間に他のセッションが同じ番号を確定していた場合は次の番号を採番する。
+    YYYYMMDDXXX 形式でない見積番号はそのまま返す。
+    """
+    parsed = _parse_estimate_no(見積No)
+    if parsed is None:
+        return 見積No
+    発行日_str, 連番 = parsed
+
+    with file_lock(_lock_path(data_folder)):
+        sequences = _read_table(data_folder)
+        if sequences is None:
+            sequences = _scan_sequences(data_folder)
+
+        if 連番 <= sequences.get(発行日_str, 0) or _estimate_file_exists(data_folder, 発行日_str, 連番):
+            連番 = _next_sequence(data_folder, sequences, 発行日_str)
+
+        sequences[発行日_str] = max(sequences.get(発行日_str, 0), 連番)
+        _write_table(data_folder, sequences)
+
+    return _format_estimate_no(発行日_str, 連番)
+
+
+def allocate_estimate_no(data_folder, 発行日):
+    """指定日付の次の見積番号を採番（発行日がNoneの場合は空文字列）"""
+    if 発行日 is None:
+        return ""
+
+    発行日_str = 発行日.strftime('%Y%m%d')
+
+    with file_lock(_lock_path(data_folder)):
+        sequences = _read_table(data_folder)
+        if sequences is None:
+            sequences = _scan_sequences(data_folder)
+
+        連番 = _next_sequence(data_folder, sequences, 発行日_str)
+        sequences[発行日_str] = 連番
+        _write_table(data_folder, sequences)
+
+    return _format_estimate_no(発行日_str, 連番)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "rebuild":
+        print("使い方: python estimate_no_allocator.py rebuild [データフォルダ]")
+        sys.exit(1)
+
+    data_folder = sys.argv[2] if len(sys.argv) > 2 else "data"
+    sequences = rebuild_sequence_table(data_folder)
+    print(f"連番テーブルを再構築しました: {len(sequences)}日分")
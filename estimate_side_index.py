@@ -0,0 +1,208 @@
+# 見積ごとの付随インデックス（全文検索・品名の使用回数・過去単価）の共通部分
+# 見積キーごとに、見積データのシグネチャと見積データから取り出した内容を保持する。
+# 内容から作る集計（転置インデックス・使用回数・単価表など）はメモリ上にだけ持ち、
+# 保存・削除された見積の分だけ加減する。アプリ外で変更された見積はシグネチャで検知する。
+#
+# 保存は list_journal と同じく本体ファイル＋追記型ジャーナルで行う。変更のあった見積の
+# 内容だけを「<ファイル名>.journal」に1行1レコード（JSON Lines）で追記し、
+# ジャーナルが一定サイズを超えたらバックグラウンドで本体ファイルに畳み込む。
+# 各レコードには追記時点の本体ファイルの内容のハッシュを記録し、本体と一致するレコードだけを適用する。
+import os
+import json
+import hashlib
+import threading
+
+from file_lock import file_lock
+from list_journal import (
+    COMPACT_THRESHOLD_BYTES,
+    append_journal_record,
+    get_file_signature,
+    get_journal_path,
+    get_journal_size,
+    get_lock_path,
+)
+
+
+class EstimateSideIndex:
+    """見積ごとの内容と、その集計を保持するインデックス
+
+    extract は見積データ（読み込めない見積はNone）から保持する内容を取り出す関数、
+    add・remove は集計に1見積分の内容を加える・外す関数（引数: 集計, 見積キー, 内容）、
+    new_aggregate は空の集計を作る関数。
+    """
+
+    def __init__(self, filename, version, extract, add, remove, new_aggregate=dict):
+        self.filename = filename
+        self.version = version
+        self._extract = extract
+        self._add = add
+        self._remove = remove
+        self._new_aggregate = new_aggregate
+
+        # データフォルダごとのプロセス内キャッシュ（全セッションで共有）
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def get_path(self, data_folder):
+        """本体ファイルのパスを取得"""
+        return os.path.join(data_folder, self.filename)
+
+    def _read_base(self, path):
+        """本体ファイルを読み込む（戻り値: (見積キー → 記録, 内容のハッシュ)・存在しない場合は ({}, None)）
+
+        壊れている・旧形式の場合は空として扱う（ハッシュは本体の内容のもの）
+        """
+        try:
+            with open(path, "rb") as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return {}, None
+        base_hash = hashlib.sha1(raw).hexdigest()
+        try:
+            base = json.loads(raw.decode("utf-8"))
+        except ValueError:
+            return {}, base_hash
+        if isinstance(base, dict) and base.get("version") == self.version:
+            return base.get("estimates", {}), base_hash
+        return {}, base_hash
+
+    def _replay(self, path):
+        """本体ファイルにジャーナルを適用した内容を取得（戻り値: (見積キー → 記録, 本体のハッシュ)）"""
+        entries, base_hash = self._read_base(path)
+        try:
+            with open(get_journal_path(path), "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # 書き込み途中で途切れた行は無視
+                        continue
+                    if record.get("base") != base_hash or record.get("version") != self.version:
+                        continue
+                    for key, entry in record["estimates"].items():
+                        if entry is None:
+                            entries.pop(key, None)
+                        else:
+                            entries[key] = entry
+        except FileNotFoundError:
+            pass
+        return entries, base_hash
+
+    def _get_state(self, data_folder):
+        """最新の状態を取得（本体・ジャーナルが他のプロセスで変更された場合のみ読み込み直して集計を作り直す）"""
+        path = self.get_path(data_folder)
+        key = os.path.abspath(path)
+        signature = get_file_signature(path)
+        journal_size = get_journal_size(path)
+        state = self._states.get(key)
+        if state is None or state["signature"] != signature or state["journal_size"] != journal_size:
+            entries, base_hash = self._replay(path)
+            aggregate = self._new_aggregate()
+            for estimate_key, entry in entries.items():
+                self._add(aggregate, estimate_key, entry["内容"])
+            state = {
+                "signature": signature,
+                "base": base_hash,
+                "journal_size": journal_size,
+                "entries": entries,
+                "aggregate": aggregate,
+            }
+            self._states[key] = state
+        return state
+
+    def _set(self, state, key, entry):
+        """見積1件分の記録を入れ替えて集計に反映（entry がNoneの場合は外す・変更があった場合True）"""
+        entries = state["entries"]
+        old = entries.pop(key, None)
+        if old is not None:
+            self._remove(state["aggregate"], key, old["内容"])
+        if entry is None:
+            return old is not None
+        entries[key] = entry
+        self._add(state["aggregate"], key, entry["内容"])
+        return True
+
+    def _entry(self, data, signature):
+        return {"シグネチャ": signature, "内容": self._extract(data if isinstance(data, dict) else None)}
+
+    def _persist(self, data_folder, state, changes):
+        """変更のあった見積の記録だけをジャーナルに追記（changes: 見積キー → 記録・削除はNone）"""
+        path = self.get_path(data_folder)
+        os.makedirs(data_folder, exist_ok=True)
+        record = json.dumps(
+            {"version": self.version, "base": state["base"], "estimates": changes},
+            ensure_ascii=False, default=str,
+        )
+        with file_lock(get_lock_path(path)):
+            append_journal_record(path, record)
+        state["journal_size"] = get_journal_size(path)
+        if state["journal_size"] > COMPACT_THRESHOLD_BYTES:
+            threading.Thread(target=self.compact, args=(data_folder,), daemon=True).start()
+
+    def compact(self, data_folder):
+        """ジャーナルを本体ファイルに畳み込む（本体は一時ファイル経由で置き換え）"""
+        path = self.get_path(data_folder)
+        with self._lock, file_lock(get_lock_path(path)):
+            state = self._get_state(data_folder)
+            if state["journal_size"] == 0:
+                return
+
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": self.version, "estimates": state["entries"]}, f, ensure_ascii=False, default=str)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+
+            # 本体の内容が変わったため、ここで異常終了しても旧レコードは適用されない
+            with open(get_journal_path(path), "w", encoding="utf-8"):
+                pass
+
+            self._states.pop(os.path.abspath(path), None)
+
+    def load(self, data_folder, signatures, read_document, view):
+        """シグネチャが変わった見積だけ読み込み直し、なくなった見積を外してから view(集計, 記録) を返す
+
+        signatures は 見積キー → シグネチャ、read_document は見積キーから見積データを返す関数、
+        view はロック中に集計から結果を作る関数（記録は 見積キー → {"シグネチャ", "内容"}）。
+        """
+        with self._lock:
+            state = self._get_state(data_folder)
+            entries = state["entries"]
+            changes = {}
+
+            for key in [key for key in entries if key not in signatures]:
+                self._set(state, key, None)
+                changes[key] = None
+
+            for key, signature in signatures.items():
+                entry = entries.get(key)
+                if entry is not None and entry["シグネチャ"] == signature:
+                    continue
+                try:
+                    data = read_document(key)
+                except Exception:
+                    # 読み込めない見積は内容なしとして登録（変更されるまで再読み込みしない）
+                    data = None
+                entry = self._entry(data, signature)
+                self._set(state, key, entry)
+                changes[key] = entry
+
+            if changes:
+                self._persist(data_folder, state, changes)
+            return view(state["aggregate"], entries)
+
+    def update(self, data_folder, key, data, signature):
+        """保存した見積を反映"""
+        with self._lock:
+            state = self._get_state(data_folder)
+            entry = self._entry(data, signature)
+            self._set(state, str(key), entry)
+            self._persist(data_folder, state, {str(key): entry})
+
+    def remove(self, data_folder, key):
+        """削除した見積を外す"""
+        with self._lock:
+            state = self._get_state(data_folder)
+            if self._set(state, str(key), None):
+                self._persist(data_folder, state, {str(key): None})
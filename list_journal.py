@@ -0,0 +1,192 @@
+# 一覧データ（customers.json・products.json）の追記型ジャーナル
+# 保存のたびにファイル全体を書き直す代わりに、前回の内容との差分だけを
+# 「<ファイル名>.journal」に1行1レコード（JSON Lines）で追記する。
+# 読み込み時は本体ファイルにジャーナルを順に適用し、ジャーナルが一定サイズを
+# 超えたらバックグラウンドで本体ファイルに畳み込む（コンパクション）。
+#
+# 各レコードには追記時点の本体ファイルの内容のハッシュを記録しておき、
+# 本体ファイルと一致するレコードだけを適用する。コンパクション中に
+# 異常終了しても、畳み込み済みのレコードが二重に適用されることはない
+# （ファイルのコピーやチェックアウトで更新時刻が変わっても影響しない）。
+# 書き込み途中で途切れた最終行は読み込み時に無視する。
+import os
+import copy
+import json
+import difflib
+import hashlib
+import threading
+
+from file_lock import file_lock
+
+JOURNAL_SUFFIX = ".journal"
+LOCK_SUFFIX = ".lock"
+
+# ジャーナルがこのサイズを超えたら本体ファイルに畳み込む
+COMPACT_THRESHOLD_BYTES = 256 * 1024
+
+# ファイルごとのプロセス内キャッシュ（全セッションで共有）
+_states = {}
+_lock = threading.Lock()
+
+
+def get_journal_path(path):
+    """ジャーナルファイルのパスを取得"""
+    return f"{path}{JOURNAL_SUFFIX}"
+
+
+def get_lock_path(path):
+    """ロックファイルのパスを取得（data/_* として管理用ファイル扱い）"""
+    folder, filename = os.path.split(path)
+    return os.path.join(folder, f"_{filename}{LOCK_SUFFIX}")
+
+
+def get_file_signature(path):
+    """本体ファイルの変更検知用シグネチャ（存在しない場合はNone）"""
+    try:
+        stat_result = os.stat(path)
+    except OSError:
+        return None
+    return [stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns]
+
+
+def get_journal_size(path):
+    """ジャーナルファイルのサイズ（存在しない場合は0）"""
+    try:
+        return os.path.getsize(get_journal_path(path))
+    except OSError:
+        return 0
+
+
+def _ends_with_newline(journal_path):
+    """ジャーナルが改行で終わっているか（空・存在しない場合もTrue）"""
+    try:
+        with open(journal_path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() == 0:
+                return True
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+    except FileNotFoundError:
+        return True
+
+
+def _read_base(path):
+    """本体ファイルを読み込む（戻り値: (内容, 内容のハッシュ)・存在しない場合は ([], None)）"""
+    if not os.path.exists(path):
+        return [], None
+    with open(path, "rb") as f:
+        raw = f.read()
+    data = json.loads(raw.decode("utf-8"))
+    return (data if isinstance(data, list) else []), hashlib.sha1(raw).hexdigest()
+
+
+def _apply(items, splices):
+    """差分（[開始, 終了, 置き換える要素] のリスト・後方から順）を適用"""
+    for start, end, replacement in splices:
+        items[start:end] = replacement
+
+
+def _replay(path):
+    """本体ファイルにジャーナルを適用した内容を取得（戻り値: (内容, 本体のハッシュ)）"""
+    items, base_hash = _read_base(path)
+    try:
+        with open(get_journal_path(path), "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 書き込み途中で途切れた行は無視
+                    continue
+                if record.get("base") == base_hash:
+                    _apply(items, record["splices"])
+    except FileNotFoundError:
+        pass
+    return items, base_hash
+
+
+def _diff(old_items, new_items):
+    """2つの一覧の差分を [開始, 終了, 置き換える要素] のリストで返す（後方から適用する順）"""
+    old_keys = [json.dumps(item, ensure_ascii=False, sort_keys=True, default=str) for item in old_items]
+    new_keys = [json.dumps(item, ensure_ascii=False, sort_keys=True, default=str) for item in new_items]
+    matcher = difflib.SequenceMatcher(None, old_keys, new_keys, autojunk=False)
+    splices = [
+        [i1, i2, new_items[j1:j2]]
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != "equal"
+    ]
+    splices.reverse()
+    return splices
+
+
+def append_journal_record(path, record):
+    """ジャーナルに1レコード（1行）を追記してディスクに書き出す"""
+    journal_path = get_journal_path(path)
+    # 前回の書き込みが途中で途切れている場合は改行してから追記
+    if not _ends_with_newline(journal_path):
+        record = "\n" + record
+    with open(journal_path, "a", encoding="utf-8") as f:
+        f.write(record + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _current_state(path):
+    """最新の内容を取得（本体・ジャーナルが変わっていなければキャッシュを使用）"""
+    key = os.path.abspath(path)
+    signature = get_file_signature(path)
+    journal_size = get_journal_size(path)
+    state = _states.get(key)
+    if state is None or state["signature"] != signature or state["journal_size"] != journal_size:
+        items, base_hash = _replay(path)
+        state = {"signature": signature, "base": base_hash, "journal_size": journal_size, "items": items}
+        _states[key] = state
+    return state
+
+
+def load_list(path):
+    """一覧データを読み込む（本体ファイル＋ジャーナル）"""
+    with _lock:
+        return copy.deepcopy(_current_state(path)["items"])
+
+
+def save_list(path, items):
+    """一覧データを保存（前回との差分だけをジャーナルに追記）"""
+    items = copy.deepcopy(list(items))
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    with _lock, file_lock(get_lock_path(path)):
+        state = _current_state(path)
+        splices = _diff(state["items"], items)
+        if not splices:
+            return
+
+        record = json.dumps({"base": state["base"], "splices": splices}, ensure_ascii=False, default=str)
+        append_journal_record(path, record)
+
+        state["items"] = items
+        state["journal_size"] = get_journal_size(path)
+        needs_compaction = state["journal_size"] > COMPACT_THRESHOLD_BYTES
+
+    if needs_compaction:
+        threading.Thread(target=compact, args=(path,), daemon=True).start()
+
+
+def compact(path):
+    """ジャーナルを本体ファイルに畳み込む（本体は一時ファイル経由で置き換え）"""
+    with _lock, file_lock(get_lock_path(path)):
+        state = _current_state(path)
+        if state["journal_size"] == 0:
+            return
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state["items"], f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+        # 本体の内容が変わったため、ここで異常終了しても旧レコードは適用されない
+        with open(get_journal_path(path), "w", encoding="utf-8"):
+            pass
+
+        _states.pop(os.path.abspath(path), None)
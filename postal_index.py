@@ -0,0 +1,238 @@
+# 郵便番号辞書（オフライン）
+# 日本郵便の郵便番号データ（KEN_ALL.CSV 形式・Shift_JIS）から、郵便番号順に並べた
+# 固定長レコードのバイナリインデックス data/_postal_index.bin を作成し、
+# mmap で開いて二分探索する。CSV（約12万行）を再実行のたびに読み込むことはない。
+#
+# インデックスの形式:
+#     ヘッダー   "SFAPOST1" + レコード数（uint32）
+#     レコード   郵便番号7桁（ASCII） + 住所の位置（uint32） + 住所の長さ（uint16）
+#     住所       "都道府県\t市区町村\t町域"（UTF-8）を連結したもの
+#
+# インデックスの作成:
+#     python postal_index.py build [KEN_ALL.CSV] [データフォルダ]
+import os
+import re
+import sys
+import csv
+import mmap
+import struct
+import threading
+import unicodedata
+
+from file_lock import file_lock
+
+POSTAL_CSV_FILENAME = "KEN_ALL.CSV"
+POSTAL_INDEX_FILENAME = "_postal_index.bin"
+POSTAL_LOCK_FILENAME = "_postal_index.lock"
+
+_MAGIC = b"SFAPOST1"
+_HEADER = struct.Struct("<8sI")
+_RECORD = struct.Struct("<7sIH")
+
+# KEN_ALL.CSV の列位置
+_COLUMN_郵便番号 = 2
+_COLUMN_都道府県 = 6
+_COLUMN_市区町村 = 7
+_COLUMN_町域 = 8
+
+# 町域から取り除く表記
+_町域除外パターン = [
+    re.compile(r"^以下に掲載がない場合$"),
+    re.compile(r"^.+の次に番地がくる場合$"),
+    re.compile(r"（.*?）|\(.*?\)"),
+]
+_一円パターン = re.compile(r"^(.+[町村])一円$")
+
+# インデックスファイルごとのプロセス内キャッシュ（全セッションで共有）
+_indexes = {}
+_lock = threading.Lock()
+
+
+def get_postal_csv_path(data_folder):
+    """郵便番号データ（CSV）のパスを取得（環境変数 SFA_POSTAL_CSV で変更可）"""
+    return os.environ.get("SFA_POSTAL_CSV", os.path.join(data_folder, POSTAL_CSV_FILENAME))
+
+
+def get_postal_index_path(data_folder):
+    """郵便番号インデックスのパスを取得"""
+    return os.path.join(data_folder, POSTAL_INDEX_FILENAME)
+
+
+def normalize_postal_code(text):
+    """入力された郵便番号を7桁の数字に正規化（7桁にならない場合はNone）"""
+    digits = re.sub(r"[^0-9]", "", unicodedata.normalize("NFKC", str(text or "")))
+    return digits if len(digits) == 7 else None
+
+
+def format_postal_code(digits):
+    """7桁の郵便番号を「123-4567」形式に整形"""
+    return f"{digits[:3]}-{digits[3:]}"
+
+
+def clean_town(町域):
+    """町域の注記（「以下に掲載がない場合」や括弧書きなど）を取り除く"""
+    for pattern in _町域除外パターン:
+        町域 = pattern.sub("", 町域)
+    match = _一円パターン.match(町域)
+    if match:
+        町域 = ""
+    return 町域.strip()
+
+
+def _read_rows(csv_path):
+    """CSVから (郵便番号, 都道府県, 市区町村, 町域) を順に取り出す
+
+    町域の括弧書きが長い場合は複数行に分かれているため、括弧が閉じるまで連結する
+    """
+    with open(csv_path, "r", encoding="cp932", newline="") as f:
+        継続中 = None
+        for row in csv.reader(f):
+            if len(row) <= _COLUMN_町域:
+                continue
+            郵便番号 = row[_COLUMN_郵便番号].strip()
+            町域 = row[_COLUMN_町域]
+
+            if 継続中 is not None:
+                継続中[3] += 町域
+                if "）" in 町域:
+                    yield tuple(継続中)
+                    継続中 = None
+                continue
+
+            if "（" in 町域 and "）" not in 町域:
+                継続中 = [郵便番号, row[_COLUMN_都道府県], row[_COLUMN_市区町村], 町域]
+                continue
+
+            yield 郵便番号, row[_COLUMN_都道府県], row[_COLUMN_市区町村], 町域
+
+        if 継続中 is not None:
+            yield tuple(継続中)
+
+
+def build_postal_index(csv_path, index_path):
+    """郵便番号データ（CSV）からインデックスを作成（戻り値: 郵便番号の件数）"""
+    住所一覧 = {}
+    for 郵便番号, 都道府県, 市区町村, 町域 in _read_rows(csv_path):
+        if not (len(郵便番号) == 7 and 郵便番号.isdigit()):
+            continue
+        住所 = (都道府県, 市区町村, clean_town(町域))
+        既存 = 住所一覧.get(郵便番号)
+        if 既存 is None:
+            住所一覧[郵便番号] = 住所
+        elif 既存 != 住所:
+            # 1つの郵便番号に複数の町域がある場合は共通部分（市区町村まで）のみ
+            住所一覧[郵便番号] = 既存[:2] + ("",) if 既存[:2] == 住所[:2] else (既存[0], "", "")
+
+    records = []
+    blob = bytearray()
+    for 郵便番号 in sorted(住所一覧):
+        encoded = "\t".join(住所一覧[郵便番号]).encode("utf-8")
+        records.append(_RECORD.pack(郵便番号.encode("ascii"), len(blob), len(encoded)))
+        blob += encoded
+
+    os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+    tmp_path = f"{index_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, len(records)))
+        f.writelines(records)
+        f.write(blob)
+    os.replace(tmp_path, index_path)
+    return len(records)
+
+
+class PostalIndex:
+    """mmap で開いた郵便番号インデックス"""
+
+    def __init__(self, index_path):
+        with open(index_path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC:
+            self._map.close()
+            raise ValueError(f"郵便番号インデックスの形式が不正です: {index_path}")
+        self._blob_offset = _HEADER.size + _RECORD.size * self._count
+
+    def __len__(self):
+        return self._count
+
+    def _record(self, position):
+        return _RECORD.unpack_from(self._map, _HEADER.size + _RECORD.size * position)
+
+    def lookup(self, 郵便番号):
+        """7桁の郵便番号から住所を取得（戻り値: {"都道府県", "市区町村", "町域"}・見つからない場合はNone）"""
+        key = 郵便番号.encode("ascii")
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._record(middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self._count:
+            return None
+
+        record_key, offset, length = self._record(low)
+        if record_key != key:
+            return None
+        start = self._blob_offset + offset
+        都道府県, 市区町村, 町域 = self._map[start:start + length].decode("utf-8").split("\t")
+        return {"都道府県": 都道府県, "市区町村": 市区町村, "町域": 町域}
+
+    def close(self):
+        self._map.close()
+
+
+def _signature(path):
+    try:
+        stat_result = os.stat(path)
+    except OSError:
+        return None
+    return stat_result.st_mtime_ns, stat_result.st_size, stat_result.st_ino
+
+
+def get_postal_index(data_folder):
+    """共有の郵便番号インデックスを取得（CSVより古い・存在しない場合は作成・CSVもない場合はNone）"""
+    csv_path = get_postal_csv_path(data_folder)
+    index_path = get_postal_index_path(data_folder)
+
+    with _lock:
+        csv_signature = _signature(csv_path)
+        index_signature = _signature(index_path)
+        if csv_signature is not None and (index_signature is None or index_signature[0] < csv_signature[0]):
+            with file_lock(os.path.join(data_folder, POSTAL_LOCK_FILENAME)):
+                # 他のプロセスが作成済みでないか確認してから作成
+                index_signature = _signature(index_path)
+                if index_signature is None or index_signature[0] < csv_signature[0]:
+                    build_postal_index(csv_path, index_path)
+                index_signature = _signature(index_path)
+        if index_signature is None:
+            return None
+
+        key = os.path.abspath(index_path)
+        cached = _indexes.get(key)
+        if cached is not None and cached[0] == index_signature:
+            return cached[1]
+        index = PostalIndex(index_path)
+        _indexes[key] = (index_signature, index)
+        # 置き換えられた古いインデックスは参照中のセッションがあり得るため閉じずに手放す
+        return index
+
+
+def lookup_address(data_folder, 郵便番号):
+    """郵便番号から住所を取得（戻り値: {"都道府県", "市区町村", "町域"}・見つからない場合はNone）"""
+    digits = normalize_postal_code(郵便番号)
+    if digits is None:
+        return None
+    index = get_postal_index(data_folder)
+    return index.lookup(digits) if index is not None else None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "build":
+        print("使い方: python postal_index.py build [KEN_ALL.CSV] [データフォルダ]")
+        sys.exit(1)
+
+    data_folder = sys.argv[3] if len(sys.argv) > 3 else "data"
+    csv_path = sys.argv[2] if len(sys.argv) > 2 else get_postal_csv_path(data_folder)
+    count = build_postal_index(csv_path, get_postal_index_path(data_folder))
+    print(f"郵便番号インデックスを作成しました: {count}件")
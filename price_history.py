@@ -0,0 +1,149 @@
+# 過去単価の統計
+# 過去の見積の明細から (品名, 単位, 顧客会社名) ごとの単価を集計した表を
+# メモリ上に持ち、明細入力時の単価の提案（前回単価・中央値・範囲）に使う。
+# 顧客会社名を空にしたキーには全顧客分を集計する。
+#
+# 見積ごとの明細の単価を data/_price_history.json（＋ジャーナル）に保持し、
+# 保存・削除された見積の分だけ表を入れ替える。
+# 各見積にはシグネチャを持たせ、アプリ外で変更された見積だけを集計し直す。
+import bisect
+
+from estimate_side_index import EstimateSideIndex
+from product_classifier import extract_base_product_and_language
+
+PRICE_HISTORY_FILENAME = "_price_history.json"
+PRICE_HISTORY_VERSION = 2
+
+
+def _table_key(品名, 単位, 顧客会社名=""):
+    return "\t".join((品名, 単位, 顧客会社名))
+
+
+def _to_price(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def extract_prices(data):
+    """見積データの明細から [品名, 単位, 顧客会社名, 単価, 発行日] を取り出す
+
+    分類行・管理費（％指定）・単価0の明細は除外し、品名は言語指定を除いた基本品名にする
+    """
+    if not isinstance(data, dict):
+        return []
+    顧客会社名 = str(data.get("顧客会社名", "") or "")
+    発行日 = str(data.get("発行日", "") or "")
+    prices = []
+    for item in data.get("明細リスト", []) or []:
+        if not isinstance(item, dict) or item.get("分類", False) or item.get("管理費パーセンテージ"):
+            continue
+        品名 = str(item.get("品名", "") or "").strip()
+        単価 = _to_price(item.get("単価", 0))
+        if 品名 and 単価:
+            基本品名 = extract_base_product_and_language(品名)[0]
+            prices.append([基本品名, str(item.get("単位", "") or ""), 顧客会社名, 単価, 発行日])
+    return prices
+
+
+def _entry_keys(品名, 単位, 顧客会社名):
+    """明細1件を集計する表のキー（顧客別と全顧客）"""
+    return [_table_key(品名, 単位, 顧客会社名), _table_key(品名, 単位)] if 顧客会社名 else [_table_key(品名, 単位)]
+
+
+def _add_prices(table, key, prices):
+    """見積の分を表に加える"""
+    for 品名, 単位, 顧客会社名, 単価, 発行日 in prices:
+        for table_key in _entry_keys(品名, 単位, 顧客会社名):
+            # 単価の昇順に保持（中央値・範囲を並べ替えなしで求める）
+            bisect.insort(table.setdefault(table_key, []), [単価, 発行日, key])
+
+
+def _remove_prices(table, key, prices):
+    """見積の分を表から外す"""
+    for 品名, 単位, 顧客会社名, 単価, 発行日 in prices:
+        for table_key in _entry_keys(品名, 単位, 顧客会社名):
+            entries = table.get(table_key)
+            if not entries:
+                continue
+            position = bisect.bisect_left(entries, [単価, 発行日, key])
+            if position < len(entries) and entries[position] == [単価, 発行日, key]:
+                del entries[position]
+            if not entries:
+                del table[table_key]
+
+
+_index = EstimateSideIndex(
+    PRICE_HISTORY_FILENAME, PRICE_HISTORY_VERSION, extract_prices, _add_prices, _remove_prices
+)
+
+
+def get_price_history_path(data_folder):
+    """過去単価ファイルのパスを取得"""
+    return _index.get_path(data_folder)
+
+
+def load_price_table(data_folder, signatures, read_document):
+    """過去単価の表を取得（シグネチャが変わった見積だけ集計し直す）
+
+    signatures は 見積キー → シグネチャ、read_document は見積キーから見積データを返す関数。
+    """
+    return _index.load(
+        data_folder, signatures, read_document,
+        lambda table, estimates: PriceTable({table_key: list(entries) for table_key, entries in table.items()}),
+    )
+
+
+def update_estimate(data_folder, key, data, signature):
+    """保存した見積の明細を表に反映"""
+    _index.update(data_folder, key, data, signature)
+
+
+def remove_estimate(data_folder, key):
+    """削除した見積の分を表から外す"""
+    _index.remove(data_folder, key)
+
+
+def _summarize(entries):
+    """単価の昇順の一覧から統計を作成"""
+    件数 = len(entries)
+    middle = 件数 // 2
+    中央値 = entries[middle][0] if 件数 % 2 else (entries[middle - 1][0] + entries[middle][0]) / 2
+    前回 = max(entries, key=lambda entry: (entry[1], entry[2]))
+    return {
+        "件数": 件数,
+        "中央値": 中央値,
+        "最小": entries[0][0],
+        "最大": entries[-1][0],
+        "前回単価": 前回[0],
+        "前回発行日": 前回[1],
+    }
+
+
+class PriceTable:
+    """(品名, 単位, 顧客会社名) ごとの過去単価"""
+
+    def __init__(self, table):
+        self._table = table
+
+    def stats(self, 品名, 単位, 顧客会社名=""):
+        """過去単価の統計（件数・中央値・最小・最大・前回単価・前回発行日・記録がない場合はNone）
+
+        顧客会社名を省略した場合は全顧客分の統計
+        """
+        entries = self._table.get(_table_key(品名, 単位, 顧客会社名 or ""))
+        return _summarize(entries) if entries else None
+
+    def suggest(self, 品名, 単位, 顧客会社名=""):
+        """提案する単価と根拠（戻り値: (単価, 顧客別の統計, 全顧客の統計)・記録がない場合は単価None）
+
+        この顧客への前回単価を優先し、なければ全顧客の中央値
+        """
+        顧客別 = self.stats(品名, 単位, 顧客会社名) if 顧客会社名 else None
+        全体 = self.stats(品名, 単位)
+        if 顧客別:
+            return 顧客別["前回単価"], 顧客別, 全体
+        if 全体:
+            return 全体["中央値"], None, 全体
+        return None, None, None
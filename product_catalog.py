@@ -0,0 +1,157 @@
+# 商品カタログ
+# 商品一覧（products.json）を品名で引けるインデックスと、品名の部分一致検索用の
+# 文字・バイグラム索引を持つ。検索結果は過去の見積の明細で使われた回数の多い順に並べる。
+#
+# 使用回数の見積ごとの内訳を data/_product_usage.json（＋ジャーナル）に保持し、
+# 保存・削除された見積の分だけ差し引き・加算する（全見積を数え直さない）。
+# 各見積にはシグネチャを持たせ、アプリ外で変更された見積だけを数え直す。
+from estimate_side_index import EstimateSideIndex
+from product_classifier import extract_base_product_and_language
+from search_index import normalize_text
+
+PRODUCT_USAGE_FILENAME = "_product_usage.json"
+PRODUCT_USAGE_VERSION = 2
+
+
+def _count_products(data):
+    """見積データの明細で使われた品名ごとの件数（分類行は除外）"""
+    counts = {}
+    if not isinstance(data, dict):
+        return counts
+    for item in data.get("明細リスト", []) or []:
+        if not isinstance(item, dict) or item.get("分類", False):
+            continue
+        品名 = str(item.get("品名", "") or "").strip()
+        if 品名:
+            counts[品名] = counts.get(品名, 0) + 1
+    return counts
+
+
+def _add_counts(counts, key, product_counts):
+    """見積の分の使用回数を加算"""
+    for 品名, count in product_counts.items():
+        counts[品名] = counts.get(品名, 0) + count
+
+
+def _remove_counts(counts, key, product_counts):
+    """見積の分の使用回数を差し引く"""
+    for 品名, count in product_counts.items():
+        remaining = counts.get(品名, 0) - count
+        if remaining > 0:
+            counts[品名] = remaining
+        else:
+            counts.pop(品名, None)
+
+
+_index = EstimateSideIndex(
+    PRODUCT_USAGE_FILENAME, PRODUCT_USAGE_VERSION, _count_products, _add_counts, _remove_counts
+)
+
+
+def get_product_usage_path(data_folder):
+    """使用回数ファイルのパスを取得"""
+    return _index.get_path(data_folder)
+
+
+def load_usage_counts(data_folder, signatures, read_document):
+    """品名ごとの使用回数を取得（シグネチャが変わった見積だけ数え直す）
+
+    signatures は 見積キー → シグネチャ、read_document は見積キーから見積データを返す関数。
+    """
+    return _index.load(data_folder, signatures, read_document, lambda counts, estimates: dict(counts))
+
+
+def update_usage(data_folder, key, data, signature):
+    """保存した見積の明細を使用回数に反映"""
+    _index.update(data_folder, key, data, signature)
+
+
+def remove_usage(data_folder, key):
+    """削除した見積の分を使用回数から差し引く"""
+    _index.remove(data_folder, key)
+
+
+class ProductCatalog:
+    """商品一覧と品名のインデックス"""
+
+    def __init__(self, products, usage_counts=None):
+        self._products = [dict(product) for product in products or []]
+
+        # 品名 → 一覧内の位置（重複がある場合は先頭・品名が空の商品は索引しない）
+        self._position_by_name = {}
+        for position, product in enumerate(self._products):
+            if product.get("品名"):
+                self._position_by_name.setdefault(product["品名"], position)
+
+        # 使用回数（明細の品名が一覧にない場合は言語・％を除いた基本品名で数える）
+        self._usage = [0] * len(self._products)
+        for 品名, count in (usage_counts or {}).items():
+            position = self._position_by_name.get(品名)
+            if position is None:
+                position = self._position_by_name.get(extract_base_product_and_language(品名)[0])
+            if position is not None:
+                self._usage[position] += count
+
+        # 正規化した品名と、1文字・2文字 → 一覧内の位置 の索引
+        self._normalized = [normalize_text(product.get("品名", "")) for product in self._products]
+        self._postings = {}
+        for position, text in enumerate(self._normalized):
+            grams = set(text)
+            grams.update(text[i:i + 2] for i in range(len(text) - 1))
+            for gram in grams:
+                self._postings.setdefault(gram, set()).add(position)
+
+        # 使用回数の多い順（同数は一覧の順）
+        self._ranked = sorted(
+            (position for position in range(len(self._products)) if self._normalized[position]),
+            key=lambda position: (-self._usage[position], position),
+        )
+
+    def __len__(self):
+        return len(self._products)
+
+    def names(self):
+        """品名の一覧（商品一覧の順）"""
+        return [product["品名"] for product in self._products if product.get("品名")]
+
+    def position(self, 品名):
+        """品名が一致する商品の一覧内の位置（存在しない場合はNone）"""
+        return self._position_by_name.get(品名)
+
+    def exists(self, 品名):
+        """品名が登録済みか"""
+        return 品名 in self._position_by_name
+
+    def get(self, 品名):
+        """品名が一致する商品（存在しない場合はNone）"""
+        position = self._position_by_name.get(品名)
+        return dict(self._products[position]) if position is not None else None
+
+    def usage(self, 品名):
+        """品名の使用回数"""
+        position = self._position_by_name.get(品名)
+        return self._usage[position] if position is not None else 0
+
+    def search(self, query="", limit=None):
+        """品名を部分一致で検索（前方一致を優先し、使用回数の多い順・検索語が空の場合は全件）"""
+        term = normalize_text(query)
+        if not term:
+            positions = self._ranked
+        else:
+            # 1文字はその文字、2文字以上はバイグラムの積集合で候補を絞り込む
+            grams = {term} if len(term) < 2 else {term[i:i + 2] for i in range(len(term) - 1)}
+            candidates = None
+            for gram in grams:
+                matched = self._postings.get(gram, set())
+                candidates = set(matched) if candidates is None else candidates & matched
+                if not candidates:
+                    return []
+            positions = sorted(
+                (position for position in candidates if term in self._normalized[position]),
+                key=lambda position: (
+                    not self._normalized[position].startswith(term), -self._usage[position], position
+                ),
+            )
+        if limit is not None:
+            positions = positions[:limit]
+        return [self._products[position]["品名"] for position in positions]
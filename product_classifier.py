@@ -0,0 +1,114 @@
+# 品名の分類
+# 翻訳・単一言語・管理費などの商品の判定と、品名からの言語・％の分離をまとめる。
+# パターンはモジュール読み込み時に一度だけコンパイルし、判定結果は品名ごとに
+# プロセス内でメモ化する（明細の再表示のたびに正規表現を評価し直さない）。
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+# 単一言語として扱う言語名
+LANGUAGE_NAMES = [
+    "英語", "中国語", "韓国語", "タイ語", "ベトナム語", "フランス語", "ドイツ語", "スペイン語",
+    "ポルトガル語", "イタリア語", "ロシア語", "アラビア語", "ヒンディー語", "インドネシア語", "マレー語", "日本語",
+]
+
+# 翻訳関連商品（言語ペアを指定）のキーワード
+TRANSLATION_KEYWORDS = ["字幕翻訳", "文書翻訳", "通訳", "同時通訳", "逐次通訳"]
+
+# 単一言語指定商品のキーワード
+SINGLE_LANGUAGE_KEYWORDS = [
+    "翻訳準備費", "言語監修", "編集者", "文字起こし", "SRT作成",
+    "ナレーター派遣", "編集者派遣",
+]
+
+# 管理費関連商品のキーワード
+MANAGEMENT_FEE_KEYWORDS = ["管理費", "手数料", "事務手数料", "システム利用料", "処理手数料"]
+
+# 品名ごとのメモ化の上限
+CLASSIFY_CACHE_SIZE = 4096
+
+
+def _keyword_pattern(keywords):
+    return re.compile("|".join(re.escape(keyword) for keyword in keywords))
+
+
+_括弧内パターン = re.compile(r"（(.+?)）")
+_翻訳言語パターン = re.compile(r".+→.+")
+_単一言語パターン = re.compile(r"^(?:" + "|".join(re.escape(name) for name in LANGUAGE_NAMES) + r").*$")
+_言語付き品名パターン = re.compile(r"^(.+?)（(.+?)）$")
+_パーセント付き品名パターン = re.compile(r"^(.+?)（(.+?)%）$")
+
+_翻訳キーワード = _keyword_pattern(TRANSLATION_KEYWORDS)
+_単一言語キーワード = _keyword_pattern(SINGLE_LANGUAGE_KEYWORDS)
+_管理費キーワード = _keyword_pattern(MANAGEMENT_FEE_KEYWORDS)
+
+# 品名の分類結果
+ProductClass = namedtuple("ProductClass", ["言語指定済み", "翻訳", "単一言語", "管理費"])
+
+
+@lru_cache(maxsize=CLASSIFY_CACHE_SIZE)
+def classify_product(product_name):
+    """品名を分類（言語指定済みの品名は翻訳・単一言語の対象外）"""
+    product_name = str(product_name or "")
+
+    # 括弧内が言語指定（○○→○○ または言語名）になっているか
+    言語指定済み = any(
+        _翻訳言語パターン.match(content) or _単一言語パターン.match(content)
+        for content in _括弧内パターン.findall(product_name)
+    )
+
+    return ProductClass(
+        言語指定済み=言語指定済み,
+        翻訳=not 言語指定済み and _翻訳キーワード.search(product_name) is not None,
+        単一言語=not 言語指定済み and _単一言語キーワード.search(product_name) is not None,
+        管理費=_管理費キーワード.search(product_name) is not None,
+    )
+
+
+def classify_catalog(product_names):
+    """商品一覧の品名をまとめて分類（戻り値: 品名 → 分類結果）"""
+    return {product_name: classify_product(product_name) for product_name in product_names}
+
+
+def is_language_specified(product_name):
+    """商品名に言語が既に指定されているかを判定"""
+    return classify_product(product_name).言語指定済み
+
+
+def is_translation_product(product_name):
+    """翻訳関連商品かどうかを判定（既に言語指定済みは除外）"""
+    return classify_product(product_name).翻訳
+
+
+def is_single_language_product(product_name):
+    """単一言語指定商品かどうかを判定（既に言語指定済みは除外）"""
+    return classify_product(product_name).単一言語
+
+
+def is_management_fee_product(product_name):
+    """管理費関連商品かどうかを判定"""
+    return classify_product(product_name).管理費
+
+
+@lru_cache(maxsize=CLASSIFY_CACHE_SIZE)
+def extract_base_product_and_language(product_name):
+    """商品名から基本商品名と言語情報を分離（「品名（言語）」形式でない場合は言語なし）"""
+    match = _言語付き品名パターン.match(product_name)
+    if match:
+        return match.group(1), match.group(2)
+    return product_name, ""
+
+
+@lru_cache(maxsize=CLASSIFY_CACHE_SIZE)
+def extract_base_product_and_percentage(product_name):
+    """商品名から基本商品名と％情報を分離（「品名（○%）」形式でない場合は％なし）"""
+    match = _パーセント付き品名パターン.match(product_name)
+    if match:
+        return match.group(1), match.group(2)
+    return product_name, ""
+
+
+def extract_management_fee_percentage(product_name):
+    """管理費（％指定）の品名から％を取得（「管理費（○%）」形式の管理費商品でない場合は空文字列）"""
+    base_product_name, percentage = extract_base_product_and_percentage(str(product_name or ""))
+    return percentage if percentage and is_management_fee_product(base_product_name) else ""
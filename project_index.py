@@ -0,0 +1,368 @@
+# 案件サマリーインデックス
+# 案件一覧タブが必要とする項目だけを1ファイルにまとめて保持し、
+# 毎回 data/ 内のすべての見積JSONを開き直さなくて済むようにする
+# 各レコードにはファイルのシグネチャ（更新時刻・サイズ・inode）を持たせ、
+# 変更されたファイルだけを再読み込みする
+# インデックスファイルの更新は、ファイルロックの下で保存済みの内容を読み直して
+# 変更分だけを反映する（他のプロセスが同時に反映したレコードを消さない）
+import os
+import json
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from file_lock import file_lock
+
+INDEX_FILENAME = "_project_index.json"
+INDEX_LOCK_FILENAME = "_project_index.lock"
+INDEX_VERSION = 2
+
+# 見積JSONを並行して読み込むスレッド数の上限
+# （ネットワークドライブ等でファイルごとの待ち時間が大きい場合に効く）
+LOADER_MAX_WORKERS = 8
+
+# データフォルダごとのプロセス内キャッシュ（全セッションで共有）
+_caches = {}
+_lock = threading.Lock()
+
+# 見積JSON以外のJSONファイル（顧客・商品・管理用ファイル）の接頭辞
+RESERVED_JSON_PREFIXES = ("_", "customers", "products")
+
+
+def is_estimate_filename(filename):
+    """見積JSONファイルかどうかをファイル名で判定（顧客・商品・管理用ファイルを除外）"""
+    return filename.endswith(".json") and not filename.startswith(RESERVED_JSON_PREFIXES)
+
+
+def _to_number(value, default=0):
+    """数値フィールドを安全に数値へ変換（空文字列・None・変換不可は既定値）"""
+    if value == "" or value is None:
+        return default
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return default
+
+
+def _to_date_str(value):
+    """日付フィールドを YYYY-MM-DD 形式の文字列に正規化（変換できない場合は空文字列）"""
+    if not value:
+        return ""
+    try:
+        return datetime.date.fromisoformat(str(value)[:10]).isoformat()
+    except ValueError:
+        pass
+    try:
+        import pandas as pd
+        return pd.to_datetime(value).date().isoformat()
+    except Exception:
+        return ""
+
+
+def calculate_detail_totals(明細リスト, 担当部署=""):
+    """明細合計・部署別集計・明細件数を計算（分類項目除外・売上先部署未設定は担当部署を使用）"""
+    明細合計 = 0
+    部署別集計 = {}
+    明細件数 = 0
+
+    for item in 明細リスト or []:
+        if item.get("分類", False):
+            continue
+
+        明細件数 += 1
+        金額 = _to_number(item.get("金額", 0))
+        明細合計 += 金額
+
+        使用部署 = item.get("売上先部署", "") or 担当部署
+        if 使用部署:
+            部署別集計[使用部署] = 部署別集計.get(使用部署, 0) + 金額
+
+    return 明細合計, 部署別集計, 明細件数
+
+
+def recalculate_detail_list(明細リスト, 担当部署="", 係数機能使用=False):
+    """管理費（％指定）の明細を再計算し、明細合計・部署別集計・明細件数を返す
+
+    明細を上から1回だけ走査し、上位明細の累計（分類項目除外）から各管理費の単価・金額を求める。
+    管理費の金額も累計に含めるため、下にある管理費は上の管理費も対象にする（連鎖する管理費）。
+    係数機能が無効の場合、管理費の金額は係数を掛けずに 数量×単価 で求める（明細の編集と同じ）。
+    明細リストはその場で更新する（戻り値は calculate_detail_totals と同じ）。
+    """
+    累計 = 0
+    部署別集計 = {}
+    明細件数 = 0
+
+    for item in 明細リスト or []:
+        if item.get("分類", False):
+            continue
+
+        パーセンテージ = item.get("管理費パーセンテージ")
+        if パーセンテージ:
+            try:
+                単価 = int(累計 * float(パーセンテージ) / 100)
+            except (ValueError, TypeError):
+                単価 = None
+            if 単価 is not None:
+                item["単価"] = 単価
+                係数 = _to_number(item.get("係数", 1), 1) if 係数機能使用 else 1
+                item["金額"] = _to_number(item.get("数量", 0)) * 係数 * 単価
+                item["管理費ベース金額"] = 累計
+
+        明細件数 += 1
+        金額 = _to_number(item.get("金額", 0))
+        累計 += 金額
+
+        使用部署 = item.get("売上先部署", "") or 担当部署
+        if 使用部署:
+            部署別集計[使用部署] = 部署別集計.get(使用部署, 0) + 金額
+
+    return 累計, 部署別集計, 明細件数
+
+
+def summarize_project(data, filename):
+    """見積JSONの内容から案件一覧用のサマリーレコードを作成"""
+    担当部署 = data.get("担当部署", "")
+
+    # 保存時に計算済みの集計があればそのまま使用（旧形式のファイルのみ明細を集計）
+    if all(key in data for key in ("明細合計", "部署別集計", "明細件数")):
+        明細合計 = _to_number(data["明細合計"])
+        部署別集計 = data["部署別集計"] if isinstance(data["部署別集計"], dict) else {}
+        明細件数 = int(_to_number(data["明細件数"]))
+    else:
+        明細合計, 部署別集計, 明細件数 = calculate_detail_totals(data.get("明細リスト", []), 担当部署)
+
+    # 明細がある場合は明細合計を優先、ない場合は保存された売上額を使用
+    売上額 = 明細合計 if 明細合計 > 0 else _to_number(data.get("売上額", 0))
+
+    return {
+        "見積No": data.get("見積No", ""),
+        "案件名": data.get("案件名", "案件名未設定"),
+        "顧客会社名": data.get("顧客会社名", ""),
+        "顧客部署名": data.get("顧客部署名", ""),
+        "顧客担当者": data.get("顧客担当者", ""),
+        "発行日": _to_date_str(data.get("発行日")),
+        "受注日": _to_date_str(data.get("受注日")),
+        "納品日": _to_date_str(data.get("納品日")),
+        "売上額": int(売上額),
+        "仕入額": int(_to_number(data.get("仕入額", 0))),
+        "粗利": int(_to_number(data.get("粗利", 0))),
+        "粗利率": _to_number(data.get("粗利率", 0)),
+        "状況": data.get("状況", "見積中"),
+        "発行者名": data.get("発行者名", ""),
+        "メモ": data.get("メモ", ""),
+        "担当部署": 担当部署,
+        "明細件数": 明細件数,
+        "明細合計": 明細合計,
+        "部署別集計": 部署別集計,
+        "JSONファイル": filename,
+    }
+
+
+def get_index_path(data_folder):
+    """インデックスファイルのパスを取得"""
+    return os.path.join(data_folder, INDEX_FILENAME)
+
+
+def _lock_path(data_folder):
+    return os.path.join(data_folder, INDEX_LOCK_FILENAME)
+
+
+def file_signature(stat_result):
+    """ファイルの変更検知用シグネチャ（更新時刻・サイズ・inode）"""
+    return [stat_result.st_mtime_ns, stat_result.st_size, stat_result.st_ino]
+
+
+def scan_estimate_files(data_folder):
+    """os.scandir で見積JSONの一覧とシグネチャを取得（ファイルは開かない）"""
+    signatures = {}
+    try:
+        with os.scandir(data_folder) as entries:
+            for entry in entries:
+                if is_estimate_filename(entry.name) and entry.is_file():
+                    signatures[entry.name] = file_signature(entry.stat())
+    except FileNotFoundError:
+        pass
+    return signatures
+
+
+def _write_project_index(data_folder, records):
+    """インデックスを一時ファイル経由で書き込み（書き込み途中のファイルを読ませない・ロックは呼び出し側で取得）"""
+    os.makedirs(data_folder, exist_ok=True)
+    index_path = get_index_path(data_folder)
+    tmp_path = f"{index_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": INDEX_VERSION, "projects": records}, f, ensure_ascii=False)
+    os.replace(tmp_path, index_path)
+
+
+def save_project_index(data_folder, records):
+    """インデックス全体を置き換える（再構築用）"""
+    os.makedirs(data_folder, exist_ok=True)
+    with file_lock(_lock_path(data_folder)):
+        _write_project_index(data_folder, records)
+
+
+def _merge_project_index(data_folder, changes):
+    """保存済みインデックスに変更分だけを反映（changes: 見積No → レコード・削除はNone・変更がなければ書き込まない）"""
+    os.makedirs(data_folder, exist_ok=True)
+    with file_lock(_lock_path(data_folder)):
+        records = _read_persisted_index(data_folder)
+        changed = False
+        for 見積No, record in changes.items():
+            if record is None:
+                changed |= records.pop(見積No, None) is not None
+            elif records.get(見積No) != record:
+                records[見積No] = record
+                changed = True
+        if changed:
+            _write_project_index(data_folder, dict(sorted(records.items())))
+
+
+def _read_persisted_index(data_folder):
+    """保存済みインデックスを読み込む（存在しない・壊れている・旧形式の場合は空）"""
+    try:
+        with open(get_index_path(data_folder), "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if isinstance(index, dict) and index.get("version") == INDEX_VERSION:
+            return index.get("projects", {})
+    except (OSError, ValueError):
+        pass
+    return {}
+
+
+def _get_cache(data_folder):
+    """プロセス内キャッシュを取得（初回のみ保存済みインデックスから復元）"""
+    key = os.path.abspath(data_folder)
+    cache = _caches.get(key)
+    if cache is None:
+        cache = {"records": _read_persisted_index(data_folder), "failed": {}, "ignored": {}}
+        _caches[key] = cache
+    return cache
+
+
+def _parse_estimate_file(data_folder, filename):
+    """見積JSONを読み込んでサマリーレコードを作成（見積データでない場合はNone）"""
+    with open(os.path.join(data_folder, filename), "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        return None
+    return summarize_project(data, filename)
+
+
+def _try_parse_estimate_file(data_folder, filename):
+    """_parse_estimate_file の結果を (レコード, エラー) で返す（スレッドプール用）"""
+    try:
+        return _parse_estimate_file(data_folder, filename), None
+    except Exception as e:
+        return None, e
+
+
+def _parse_estimate_files(data_folder, filenames):
+    """複数の見積JSONをスレッドプールで並行して読み込む（結果は filenames と同じ順序）"""
+    if len(filenames) <= 1:
+        return [_try_parse_estimate_file(data_folder, filename) for filename in filenames]
+    with ThreadPoolExecutor(max_workers=min(LOADER_MAX_WORKERS, len(filenames))) as executor:
+        return list(executor.map(lambda filename: _try_parse_estimate_file(data_folder, filename), filenames))
+
+
+def _refresh(data_folder, cache):
+    """シグネチャが変わったファイルだけ再読み込みし、削除されたファイルのレコードを破棄"""
+    records = cache["records"]
+    failed = cache["failed"]
+    ignored = cache["ignored"]
+    signatures = scan_estimate_files(data_folder)
+    # インデックスファイルに反映する変更（見積No → レコード・削除はNone）
+    changes = {}
+
+    # 削除されたファイルのレコードを破棄
+    現存ファイル = set(signatures)
+    for 見積No, record in list(records.items()):
+        if record.get("JSONファイル") not in 現存ファイル:
+            del records[見積No]
+            changes[見積No] = None
+    for skipped in (failed, ignored):
+        for filename in list(skipped):
+            if filename not in 現存ファイル:
+                del skipped[filename]
+
+    # 追加・更新されたファイルのみ再読み込み
+    登録済み = {record.get("JSONファイル"): record.get("シグネチャ") for record in records.values()}
+    読み込み対象 = []
+    for filename, signature in signatures.items():
+        if 登録済み.get(filename) == signature:
+            continue
+        if filename in failed and failed[filename][0] == signature:
+            continue
+        if ignored.get(filename) == signature:
+            continue
+        読み込み対象.append(filename)
+
+    結果一覧 = _parse_estimate_files(data_folder, 読み込み対象)
+    for filename, (record, error) in zip(読み込み対象, 結果一覧):
+        signature = signatures[filename]
+        見積No = filename[:-len(".json")]
+        if error is not None:
+            failed[filename] = (signature, error)
+            if records.pop(見積No, None) is not None:
+                changes[見積No] = None
+            continue
+
+        failed.pop(filename, None)
+        if record is None:
+            # 見積データ形式でないファイルは次回以降読み込まない
+            ignored[filename] = signature
+            continue
+        record["シグネチャ"] = signature
+        records[見積No] = record
+        changes[見積No] = record
+
+    if changes:
+        cache["records"] = dict(sorted(records.items()))
+        _merge_project_index(data_folder, changes)
+
+    errors = [(filename, e) for filename, (_, e) in sorted(failed.items())]
+    return dict(cache["records"]), errors
+
+
+def load_project_index(data_folder):
+    """最新のサマリーを取得（変更のあったファイルだけ再読み込みするため変更がなければほぼ無コスト）
+
+    戻り値: (見積No → サマリーレコードの辞書, [(ファイル名, エラー), ...])
+    """
+    with _lock:
+        return _refresh(data_folder, _get_cache(data_folder))
+
+
+def rebuild_project_index(data_folder):
+    """キャッシュを破棄し、data/ 内のすべての見積JSONからインデックスを再構築"""
+    with _lock:
+        cache = {"records": {}, "failed": {}, "ignored": {}}
+        _caches[os.path.abspath(data_folder)] = cache
+        records, errors = _refresh(data_folder, cache)
+        save_project_index(data_folder, cache["records"])
+        return records, errors
+
+
+def upsert_project_summary(data_folder, data, filename):
+    """保存した見積JSONのサマリーをインデックスに反映（作成したサマリーを返す）"""
+    with _lock:
+        cache = _get_cache(data_folder)
+        record = summarize_project(data, filename)
+        try:
+            record["シグネチャ"] = file_signature(os.stat(os.path.join(data_folder, filename)))
+        except OSError:
+            record["シグネチャ"] = None
+        cache["records"][filename[:-len(".json")]] = record
+        cache["failed"].pop(filename, None)
+        _merge_project_index(data_folder, {filename[:-len(".json")]: record})
+        return record
+
+
+def remove_project_summary(data_folder, 見積No):
+    """削除した見積のサマリーをインデックスから削除（他のプロセスが反映したサマリーも削除）"""
+    with _lock:
+        cache = _get_cache(data_folder)
+        cache["records"].pop(str(見積No), None)
+        _merge_project_index(data_folder, {str(見積No): None})
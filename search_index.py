@@ -0,0 +1,143 @@
+# 案件の全文検索インデックス
+# 案件名・顧客名・メモ・備考・明細の品名/備考を正規化（全角半角統一・小文字化・空白除去）し、
+# 見積ごとの正規化済みテキストを data/_search_index.json（＋ジャーナル）に保持し、
+# 文字単位と2文字単位（バイグラム）の転置インデックスをメモリ上に作る。
+# 検索語はバイグラムで候補を絞り込んだ後、正規化済みテキストで一致を確認してスコア順に返す。
+# 各文書には見積データのシグネチャを持たせ、変更された見積だけを索引し直す。
+import re
+import unicodedata
+
+from estimate_side_index import EstimateSideIndex
+
+SEARCH_INDEX_FILENAME = "_search_index.json"
+SEARCH_INDEX_VERSION = 2
+
+# 項目ごとの重み（案件名・顧客名での一致を上位に表示）
+FIELD_WEIGHTS = {"案件名": 3, "顧客": 2, "メモ": 1, "備考": 1, "明細": 1}
+
+_whitespace_pattern = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    """検索用にテキストを正規化（NFKCで全角英数・半角カナを統一、小文字化、空白除去）"""
+    return _whitespace_pattern.sub("", unicodedata.normalize("NFKC", str(text or ""))).lower()
+
+
+def _join_normalized(values):
+    """複数の値を正規化して改行区切りで連結（値をまたいだ一致を防ぐ）"""
+    return "\n".join(normalized for normalized in (normalize_text(value) for value in values) if normalized)
+
+
+def extract_fields(data):
+    """見積データから検索対象項目の正規化済みテキストを取り出す（読み込めない見積は空）"""
+    if not isinstance(data, dict):
+        return {}
+    明細リスト = data.get("明細リスト", []) or []
+    return {
+        "案件名": normalize_text(data.get("案件名", "")),
+        "顧客": _join_normalized([data.get("顧客会社名", ""), data.get("顧客部署名", ""), data.get("顧客担当者", "")]),
+        "メモ": normalize_text(data.get("メモ", "")),
+        "備考": normalize_text(data.get("備考", "")),
+        "明細": _join_normalized(
+            value for item in 明細リスト for value in (item.get("品名", ""), item.get("備考", ""))
+        ),
+    }
+
+
+def _document_grams(fields):
+    """文書の索引語（1文字・2文字）の集合"""
+    grams = set()
+    for text in fields.values():
+        grams.update(text)
+        grams.update(text[i:i + 2] for i in range(len(text) - 1))
+    grams.discard("\n")
+    return grams
+
+
+def _query_grams(term):
+    """検索語の候補絞り込み用の索引語（2文字以上はバイグラム、1文字はその文字）"""
+    if len(term) < 2:
+        return {term}
+    return {term[i:i + 2] for i in range(len(term) - 1)}
+
+
+def _add_postings(postings, key, fields):
+    """文書を転置インデックスに追加"""
+    for gram in _document_grams(fields):
+        postings.setdefault(gram, set()).add(key)
+
+
+def _remove_postings(postings, key, fields):
+    """文書を転置インデックスから外す"""
+    for gram in _document_grams(fields):
+        keys = postings.get(gram)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del postings[gram]
+
+
+_index = EstimateSideIndex(
+    SEARCH_INDEX_FILENAME, SEARCH_INDEX_VERSION, extract_fields, _add_postings, _remove_postings
+)
+
+
+def get_search_index_path(data_folder):
+    """検索インデックスファイルのパスを取得"""
+    return _index.get_path(data_folder)
+
+
+def _score(postings, documents, terms):
+    """すべての検索語を含む文書のスコアを計算"""
+    scores = None
+    for term in terms:
+        # バイグラムの積集合で候補を絞り込む
+        candidates = None
+        for gram in _query_grams(term):
+            keys = postings.get(gram, set())
+            candidates = set(keys) if candidates is None else candidates & keys
+            if not candidates:
+                return {}
+
+        # 正規化済みテキストで実際に含まれるか確認してスコアを加算
+        term_scores = {}
+        for key in candidates if scores is None else candidates & scores.keys():
+            fields = documents[key]["内容"]
+            score = sum(FIELD_WEIGHTS.get(name, 1) * text.count(term) for name, text in fields.items())
+            if score:
+                term_scores[key] = score
+        if not term_scores:
+            return {}
+
+        scores = term_scores if scores is None else {key: scores[key] + score for key, score in term_scores.items()}
+
+    return scores
+
+
+def search(data_folder, query, signatures, read_document):
+    """キーワードで全文検索
+
+    query はスペース区切りで複数指定可（すべてを含む見積が対象）。
+    signatures は 見積キー → シグネチャ、read_document は見積キーから見積データを返す関数。
+    戻り値: 見積キー → スコア（一致回数×項目の重み）
+    """
+    terms = list(dict.fromkeys(
+        normalize_text(term) for term in unicodedata.normalize("NFKC", str(query or "")).split()
+    ))
+    terms = [term for term in terms if term]
+    if not terms:
+        return {}
+
+    return _index.load(
+        data_folder, signatures, read_document, lambda postings, documents: _score(postings, documents, terms)
+    )
+
+
+def upsert_document(data_folder, key, data, signature):
+    """保存した見積をインデックスに反映"""
+    _index.update(data_folder, key, data, signature)
+
+
+def remove_document(data_folder, key):
+    """削除した見積をインデックスから外す"""
+    _index.remove(data_folder, key)
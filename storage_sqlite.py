@@ -0,0 +1,393 @@
+# SQLiteストレージ
+# 見積・明細・顧客・商品をローカルのSQLiteファイル（WALモード）に保存する。
+# 環境変数 SFA_STORAGE_BACKEND=sqlite のときにアプリから使用される。
+# 案件一覧用のサマリー項目は列として保持し、見積No・発行日・納品日・
+# 顧客会社名・状況・発行者名にインデックスを張っている。
+#
+# JSON形式（data/*.json）からの移行:
+#     python storage_sqlite.py migrate [データフォルダ] [DBファイル]
+import os
+import sys
+import json
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from project_index import summarize_project, is_estimate_filename
+from list_journal import load_list, get_journal_path
+
+DEFAULT_DB_FILENAME = "sfa.db"
+
+# スキーマ作成済みのDBファイル（パス・inode ごと・接続のたびにDDLを実行しない）
+_initialized = set()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS estimates (
+    見積No TEXT PRIMARY KEY,
+    案件名 TEXT,
+    顧客会社名 TEXT,
+    顧客部署名 TEXT,
+    顧客担当者 TEXT,
+    顧客会社名_検索 TEXT,
+    顧客担当者_検索 TEXT,
+    発行日 TEXT,
+    受注日 TEXT,
+    納品日 TEXT,
+    売上額 INTEGER,
+    仕入額 INTEGER,
+    粗利 INTEGER,
+    粗利率 REAL,
+    状況 TEXT,
+    発行者名 TEXT,
+    メモ TEXT,
+    担当部署 TEXT,
+    明細件数 INTEGER,
+    明細合計 REAL,
+    部署別集計 TEXT,
+    更新時刻 INTEGER,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_estimates_発行日 ON estimates(発行日);
+CREATE INDEX IF NOT EXISTS idx_estimates_納品日 ON estimates(納品日);
+CREATE INDEX IF NOT EXISTS idx_estimates_顧客会社名 ON estimates(顧客会社名);
+CREATE INDEX IF NOT EXISTS idx_estimates_顧客検索 ON estimates(顧客会社名_検索, 顧客担当者_検索);
+CREATE INDEX IF NOT EXISTS idx_estimates_状況 ON estimates(状況);
+CREATE INDEX IF NOT EXISTS idx_estimates_発行者名 ON estimates(発行者名);
+
+CREATE TABLE IF NOT EXISTS line_items (
+    見積No TEXT NOT NULL REFERENCES estimates(見積No) ON DELETE CASCADE,
+    行番号 INTEGER NOT NULL,
+    品名 TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (見積No, 行番号)
+);
+CREATE INDEX IF NOT EXISTS idx_line_items_品名 ON line_items(品名);
+
+CREATE TABLE IF NOT EXISTS customers (
+    順番 INTEGER PRIMARY KEY,
+    顧客会社名 TEXT,
+    顧客部署名 TEXT,
+    顧客担当者 TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_customers_顧客 ON customers(顧客会社名, 顧客部署名, 顧客担当者);
+
+CREATE TABLE IF NOT EXISTS products (
+    順番 INTEGER PRIMARY KEY,
+    品名 TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_products_品名 ON products(品名);
+
+CREATE TABLE IF NOT EXISTS sequences (
+    発行日 TEXT PRIMARY KEY,
+    連番 INTEGER NOT NULL
+);
+"""
+
+# サマリーとして列に保持する項目
+SUMMARY_COLUMNS = [
+    "見積No", "案件名", "顧客会社名", "顧客部署名", "顧客担当者",
+    "発行日", "受注日", "納品日", "売上額", "仕入額", "粗利", "粗利率",
+    "状況", "発行者名", "メモ", "担当部署", "明細件数", "明細合計", "部署別集計",
+]
+
+
+def get_db_path(data_folder):
+    """既定のDBファイルのパスを取得"""
+    return os.path.join(data_folder, DEFAULT_DB_FILENAME)
+
+
+def _normalize_for_search(value):
+    """顧客検索用に空白（全角・半角）を除去"""
+    return str(value or "").strip().replace(" ", "").replace("　", "")
+
+
+@contextmanager
+def _connect(db_path):
+    """DBに接続（初回のみスキーマ作成・WALモード設定）
+
+    DBファイルが削除・置き換えられた場合（inodeが変わった・空のファイル）はスキーマを作成し直す
+    """
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    try:
+        conn.execute("PRAGMA foreign_keys = ON")
+        stat_result = os.stat(db_path)
+        key = (os.path.abspath(db_path), stat_result.st_dev, stat_result.st_ino)
+        if key not in _initialized or stat_result.st_size == 0:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.executescript(SCHEMA)
+            _initialized.add(key)
+        yield conn
+    finally:
+        conn.close()
+
+
+@contextmanager
+def _transaction(conn):
+    """書き込みトランザクション（開始時に書き込みロックを取得）"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def _summary_from_row(row):
+    """estimates の行（サマリー列＋更新時刻）から案件サマリーレコード（project_index と同じ形式）を作成"""
+    record = dict(zip(SUMMARY_COLUMNS, row[:-1]))
+    record["部署別集計"] = json.loads(record["部署別集計"] or "{}")
+    for 日付項目 in ["発行日", "受注日", "納品日"]:
+        record[日付項目] = record[日付項目] or ""
+    record["JSONファイル"] = f"{record['見積No']}.json"
+    # 明細キャッシュ等の変更検知用（JSON版のファイルシグネチャに相当）
+    record["シグネチャ"] = [row[-1]]
+    return record
+
+
+def _write_estimate(conn, 見積No, data):
+    """見積1件を書き込み（明細は行ごとに保存し直す）・シグネチャを返す"""
+    サマリー = summarize_project(data, f"{見積No}.json")
+    本体 = {key: value for key, value in data.items() if key != "明細リスト"}
+
+    values = [サマリー[column] for column in SUMMARY_COLUMNS]
+    values[0] = str(見積No)
+    values[SUMMARY_COLUMNS.index("部署別集計")] = json.dumps(サマリー["部署別集計"], ensure_ascii=False)
+    更新時刻 = time.time_ns()
+
+    conn.execute("DELETE FROM line_items WHERE 見積No = ?", (str(見積No),))
+    conn.execute(
+        f"INSERT OR REPLACE INTO estimates ({', '.join(SUMMARY_COLUMNS)}, 顧客会社名_検索, 顧客担当者_検索, 更新時刻, data) "
+        f"VALUES ({', '.join('?' * (len(SUMMARY_COLUMNS) + 4))})",
+        values + [
+            _normalize_for_search(data.get("顧客会社名", "")),
+            _normalize_for_search(data.get("顧客担当者", "")),
+            更新時刻,
+            json.dumps(本体, ensure_ascii=False, default=str),
+        ],
+    )
+    conn.executemany(
+        "INSERT INTO line_items (見積No, 行番号, 品名, data) VALUES (?, ?, ?, ?)",
+        [
+            (str(見積No), 行番号, str(item.get("品名", "")), json.dumps(item, ensure_ascii=False, default=str))
+            for 行番号, item in enumerate(data.get("明細リスト", []) or [])
+        ],
+    )
+    return [更新時刻]
+
+
+# 見積データ
+def read_estimate(db_path, 見積No):
+    """見積データを読み込む（存在しない場合はNone）"""
+    with _connect(db_path) as conn:
+        row = conn.execute("SELECT data FROM estimates WHERE 見積No = ?", (str(見積No),)).fetchone()
+        if row is None:
+            return None
+        data = json.loads(row[0])
+        data["明細リスト"] = [
+            json.loads(item)
+            for (item,) in conn.execute("SELECT data FROM line_items WHERE 見積No = ? ORDER BY 行番号", (str(見積No),))
+        ]
+    return data
+
+
+def write_estimate(db_path, 見積No, data):
+    """見積データを保存（既存の場合は上書き）・シグネチャを返す"""
+    with _connect(db_path) as conn:
+        with _transaction(conn):
+            return _write_estimate(conn, 見積No, data)
+
+
+def delete_estimate(db_path, 見積No):
+    """見積データを削除（削除した場合True）"""
+    with _connect(db_path) as conn:
+        with _transaction(conn):
+            cursor = conn.execute("DELETE FROM estimates WHERE 見積No = ?", (str(見積No),))
+    return cursor.rowcount > 0
+
+
+def estimate_exists(db_path, 見積No):
+    """見積番号が既に存在するかチェック"""
+    with _connect(db_path) as conn:
+        return conn.execute("SELECT 1 FROM estimates WHERE 見積No = ?", (str(見積No),)).fetchone() is not None
+
+
+def load_project_summaries(db_path):
+    """案件サマリーを取得（戻り値は project_index.load_project_index と同じ形式）"""
+    with _connect(db_path) as conn:
+        rows = conn.execute(f"SELECT {', '.join(SUMMARY_COLUMNS)}, 更新時刻 FROM estimates ORDER BY 見積No").fetchall()
+    return {row[0]: _summary_from_row(row) for row in rows}, []
+
+
+def search_estimates_by_customer(db_path, 顧客会社名, 顧客担当者):
+    """顧客会社名・担当者（空白を無視）が一致する案件サマリーを取得"""
+    with _connect(db_path) as conn:
+        rows = conn.execute(
+            f"SELECT {', '.join(SUMMARY_COLUMNS)}, 更新時刻 FROM estimates WHERE 顧客会社名_検索 = ? AND 顧客担当者_検索 = ?",
+            (_normalize_for_search(顧客会社名), _normalize_for_search(顧客担当者)),
+        ).fetchall()
+    return [_summary_from_row(row) for row in rows]
+
+
+# 見積番号の採番
+def _max_sequence_in_estimates(conn, 発行日_str):
+    """estimates から指定日付の最大連番を取得（見積Noの主キー範囲検索）"""
+    max_sequence = 0
+    next_day = str(int(発行日_str) + 1)
+    for (見積No,) in conn.execute("SELECT 見積No FROM estimates WHERE 見積No > ? AND 見積No < ?", (発行日_str, next_day)):
+        if 見積No[8:].isdigit():
+            max_sequence = max(max_sequence, int(見積No[8:]))
+    return max_sequence
+
+
+def get_max_sequence(db_path, 発行日_str):
+    """指定日付の最終連番を取得（採番はしない）"""
+    with _connect(db_path) as conn:
+        row = conn.execute("SELECT 連番 FROM sequences WHERE 発行日 = ?", (発行日_str,)).fetchone()
+        return max(row[0] if row else 0, _max_sequence_in_estimates(conn, 発行日_str))
+
+
+def peek_estimate_no(db_path, 発行日):
+    """指定日付の次の見積番号を取得（採番はしない・表示や提案用・発行日がNoneの場合は空文字列）"""
+    if 発行日 is None:
+        return ""
+
+    発行日_str = 発行日.strftime('%Y%m%d')
+    return f"{発行日_str}{str(get_max_sequence(db_path, 発行日_str) + 1).zfill(3)}"
+
+
+def reserve_estimate_no(db_path, 見積No):
+    """peek_estimate_no で取得した見積番号を採番済みにする（戻り値: 確定した見積番号）
+
+    その間に他のセッションが同じ番号を確定していた場合は次の番号を採番する。
+    YYYYMMDDXXX 形式でない見積番号はそのまま返す。
+    """
+    見積No = str(見積No)
+    if not (len(見積No) >= 11 and 見積No[:8].isdigit() and 見積No[8:].isdigit()):
+        return 見積No
+    発行日_str, 連番 = 見積No[:8], int(見積No[8:])
+
+    with _connect(db_path) as conn:
+        with _transaction(conn):
+            row = conn.execute("SELECT 連番 FROM sequences WHERE 発行日 = ?", (発行日_str,)).fetchone()
+            最終連番 = max(row[0] if row else 0, _max_sequence_in_estimates(conn, 発行日_str))
+            if 連番 <= 最終連番:
+                連番 = 最終連番 + 1
+            conn.execute(
+                "INSERT INTO sequences (発行日, 連番) VALUES (?, ?) "
+                "ON CONFLICT(発行日) DO UPDATE SET 連番 = MAX(連番, excluded.連番)",
+                (発行日_str, 連番),
+            )
+
+    return f"{発行日_str}{str(連番).zfill(3)}"
+
+
+def allocate_estimate_no(db_path, 発行日):
+    """指定日付の次の見積番号を採番（発行日がNoneの場合は空文字列）"""
+    if 発行日 is None:
+        return ""
+
+    発行日_str = 発行日.strftime('%Y%m%d')
+
+    with _connect(db_path) as conn:
+        with _transaction(conn):
+            row = conn.execute("SELECT 連番 FROM sequences WHERE 発行日 = ?", (発行日_str,)).fetchone()
+            連番 = max(row[0] if row else 0, _max_sequence_in_estimates(conn, 発行日_str)) + 1
+            conn.execute(
+                "INSERT INTO sequences (発行日, 連番) VALUES (?, ?) "
+                "ON CONFLICT(発行日) DO UPDATE SET 連番 = excluded.連番",
+                (発行日_str, 連番),
+            )
+
+    return f"{発行日_str}{str(連番).zfill(3)}"
+
+
+# 顧客・商品データ
+def load_customers(db_path):
+    """顧客一覧を登録順に取得"""
+    with _connect(db_path) as conn:
+        return [json.loads(data) for (data,) in conn.execute("SELECT data FROM customers ORDER BY 順番")]
+
+
+def save_customers(db_path, customers_list):
+    """顧客一覧を保存（一覧全体を置き換え）"""
+    with _connect(db_path) as conn:
+        with _transaction(conn):
+            conn.execute("DELETE FROM customers")
+            conn.executemany(
+                "INSERT INTO customers (順番, 顧客会社名, 顧客部署名, 顧客担当者, data) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (順番, customer.get("顧客会社名", ""), customer.get("顧客部署名", ""), customer.get("顧客担当者", ""),
+                     json.dumps(customer, ensure_ascii=False, default=str))
+                    for 順番, customer in enumerate(customers_list)
+                ],
+            )
+
+
+def load_products(db_path):
+    """商品一覧を登録順に取得"""
+    with _connect(db_path) as conn:
+        return [json.loads(data) for (data,) in conn.execute("SELECT data FROM products ORDER BY 順番")]
+
+
+def save_products(db_path, products_list):
+    """商品一覧を保存（一覧全体を置き換え）"""
+    with _connect(db_path) as conn:
+        with _transaction(conn):
+            conn.execute("DELETE FROM products")
+            conn.executemany(
+                "INSERT INTO products (順番, 品名, data) VALUES (?, ?, ?)",
+                [
+                    (順番, product.get("品名", ""), json.dumps(product, ensure_ascii=False, default=str))
+                    for 順番, product in enumerate(products_list)
+                ],
+            )
+
+
+# JSON形式からの移行
+def migrate_from_json(data_folder, db_path):
+    """data/*.json の見積・customers.json・products.json をDBに取り込む
+
+    戻り値: (取り込んだ見積件数, [(ファイル名, エラー), ...])
+    """
+    件数 = 0
+    errors = []
+
+    with _connect(db_path) as conn:
+        with _transaction(conn):
+            for filename in sorted(os.listdir(data_folder)):
+                if not is_estimate_filename(filename):
+                    continue
+                try:
+                    with open(os.path.join(data_folder, filename), "r", encoding="utf-8") as f:
+                        data = json.load(f)
+                except Exception as e:
+                    errors.append((filename, e))
+                    continue
+                if isinstance(data, dict):
+                    _write_estimate(conn, filename[:-len(".json")], data)
+                    件数 += 1
+
+    for filename, save in (("customers.json", save_customers), ("products.json", save_products)):
+        path = os.path.join(data_folder, filename)
+        if os.path.exists(path) or os.path.exists(get_journal_path(path)):
+            # 追記ジャーナルも適用した最新の内容を取り込む
+            save(db_path, load_list(path))
+
+    return 件数, errors
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "migrate":
+        print("使い方: python storage_sqlite.py migrate [データフォルダ] [DBファイル]")
+        sys.exit(1)
+
+    data_folder = sys.argv[2] if len(sys.argv) > 2 else "data"
+    db_path = sys.argv[3] if len(sys.argv) > 3 else get_db_path(data_folder)
+    件数, errors = migrate_from_json(data_folder, db_path)
+    for filename, e in errors:
+        print(f"ファイル {filename} の読み込みでエラー: {e}")
+    print(f"{件数}件の見積を {db_path} に移行しました")
@@ -0,0 +1,6 @@
+# テスト共通設定
+# アプリのモジュールはリポジトリ直下にあるため、直下をインポートパスに追加する
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,129 @@
+# 住所の分割と一括移行のテスト
+import json
+
+import pytest
+
+import storage_sqlite
+from address_migrator import migrate_json, migrate_sqlite, needs_migration
+from estimate_excel_writer import parse_address_with_confidence
+from list_journal import load_list, save_list
+
+確実な住所 = "〒100-0001 東京都千代田区千代田1-1 テストビル5F"
+不確実な住所 = "千代田区千代田1-1"
+
+
+@pytest.mark.parametrize("address, 期待", [
+    (確実な住所, ("100-0001", "東京都千代田区千代田1-1", "テストビル5F", True)),
+    ("100-0001 東京都千代田区千代田1-1", ("100-0001", "東京都千代田区千代田1-1", "", True)),
+    # 郵便番号がない・都道府県から始まらない
+    (不確実な住所, ("", "千代田区千代田1-1", "", False)),
+    ("〒100-0001 千代田区千代田1-1", ("100-0001", "千代田区千代田1-1", "", False)),
+    # 空の住所は分割するものがないため確実
+    ("", ("", "", "", True)),
+    ("　 ", ("", "", "", True)),
+    (None, ("", "", "", True)),
+    # 欠損値の文字列は確実ではない
+    ("nan", ("", "", "", False)),
+    ("None", ("", "", "", False)),
+    (float("nan"), ("", "", "", False)),
+])
+def test_住所の分割と確実かの判定(address, 期待):
+    assert parse_address_with_confidence(address) == 期待
+
+
+def _customers():
+    return [
+        {"顧客会社名": "A社", "顧客担当者": "山田", "顧客住所": 確実な住所},
+        {"顧客会社名": "B社", "顧客担当者": "佐藤", "顧客住所": 不確実な住所},
+        {"顧客会社名": "C社", "顧客担当者": "鈴木", "顧客住所": "nan"},
+        # 移行済み・住所なしは対象外
+        {"顧客会社名": "D社", "顧客担当者": "高橋", "顧客住所": 確実な住所, "住所1": "東京都港区"},
+        {"顧客会社名": "E社", "顧客担当者": "田中", "顧客住所": ""},
+    ]
+
+
+@pytest.fixture
+def data_folder(tmp_path):
+    data_folder = tmp_path / "data"
+    data_folder.mkdir()
+    save_list(str(data_folder / "customers.json"), _customers())
+    for 見積No, 顧客住所 in [("20240401001", 確実な住所), ("20240401002", 不確実な住所)]:
+        with open(data_folder / f"{見積No}.json", "w", encoding="utf-8") as f:
+            json.dump({"見積No": 見積No, "顧客住所": 顧客住所, "明細リスト": []}, f, ensure_ascii=False)
+    (data_folder / "20240401003.json").write_text("{壊れたJSON", encoding="utf-8")
+    return data_folder
+
+
+def _estimate(data_folder, 見積No):
+    with open(data_folder / f"{見積No}.json", "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_移行対象は旧形式の住所だけを持つレコード():
+    assert [needs_migration(customer) for customer in _customers()] == [True, True, True, False, False]
+    assert not needs_migration(None)
+
+
+def test_確実に分割できた住所だけを書き戻し残りは要確認として返す(data_folder):
+    件数, 要確認一覧 = migrate_json(str(data_folder))
+
+    assert 件数 == 2
+    assert [(ラベル, 顧客住所) for ラベル, 顧客住所, _ in 要確認一覧] == [
+        ("顧客 B社 / 佐藤", 不確実な住所),
+        ("顧客 C社 / 鈴木", "nan"),
+        ("見積 20240401002.json", 不確実な住所),
+        ("見積 20240401003.json", ""),
+    ]
+
+    customers = load_list(str(data_folder / "customers.json"))
+    assert {key: customers[0][key] for key in ("郵便番号", "住所1", "住所2")} == {
+        "郵便番号": "100-0001", "住所1": "東京都千代田区千代田1-1", "住所2": "テストビル5F",
+    }
+    assert customers[1:] == _customers()[1:]
+    assert _estimate(data_folder, "20240401001")["住所1"] == "東京都千代田区千代田1-1"
+    assert "住所1" not in _estimate(data_folder, "20240401002")
+
+    # 移行済みのレコードは2回目の実行で対象にならない
+    件数, 要確認一覧 = migrate_json(str(data_folder))
+    assert 件数 == 0
+    assert len(要確認一覧) == 4
+
+
+def test_dry_runは件数と要確認だけを返し書き込まない(data_folder):
+    変更前 = {path.name: path.read_bytes() for path in data_folder.iterdir()}
+
+    件数, 要確認一覧 = migrate_json(str(data_folder), dry_run=True)
+
+    assert 件数 == 2
+    assert len(要確認一覧) == 4
+    assert {path.name: path.read_bytes() for path in data_folder.iterdir()} == 変更前
+
+
+def test_forceは要確認の住所も書き戻す(data_folder):
+    件数, 要確認一覧 = migrate_json(str(data_folder), force=True)
+
+    # 要確認の一覧には残すが、読み込めない見積以外は書き戻す
+    assert 件数 == 5
+    assert len(要確認一覧) == 4
+    customers = load_list(str(data_folder / "customers.json"))
+    assert customers[1]["住所1"] == 不確実な住所
+    assert (customers[2]["郵便番号"], customers[2]["住所1"], customers[2]["住所2"]) == ("", "", "")
+    assert _estimate(data_folder, "20240401002")["住所1"] == 不確実な住所
+
+
+def test_SQLite版も同じく移行する(tmp_path):
+    db_path = str(tmp_path / "sfa.db")
+    storage_sqlite.save_customers(db_path, _customers())
+    storage_sqlite.write_estimate(db_path, "20240401001", {"見積No": "20240401001", "顧客住所": 確実な住所, "明細リスト": []})
+    storage_sqlite.write_estimate(db_path, "20240401002", {"見積No": "20240401002", "顧客住所": 不確実な住所, "明細リスト": []})
+
+    assert migrate_sqlite(db_path, dry_run=True)[0] == 2
+    assert "住所1" not in storage_sqlite.read_estimate(db_path, "20240401001")
+
+    件数, 要確認一覧 = migrate_sqlite(db_path)
+
+    assert 件数 == 2
+    assert [ラベル for ラベル, _, _ in 要確認一覧] == ["顧客 B社 / 佐藤", "顧客 C社 / 鈴木", "見積 20240401002"]
+    assert storage_sqlite.load_customers(db_path)[0]["郵便番号"] == "100-0001"
+    assert storage_sqlite.read_estimate(db_path, "20240401001")["住所2"] == "テストビル5F"
+    assert "住所1" not in storage_sqlite.read_estimate(db_path, "20240401002")
@@ -0,0 +1,142 @@
+# アプリ（app_sfa.py）の関数のテスト
+# セッション状態を使う関数は AppTest でセッションごとに実行する
+import os
+import sys
+import json
+
+import pytest
+from streamlit.testing.v1 import AppTest
+
+
+def estimate_script():
+    """テスト用のスクリプト（セッション状態の「操作」に応じてアプリの関数を呼ぶ）"""
+    import datetime
+    import streamlit as st
+    import app_sfa
+
+    操作 = st.session_state.get("操作")
+    if 操作 == "新規":
+        st.session_state["見積No"] = app_sfa.peek_new_estimate_no(datetime.date(2024, 4, 1))
+    elif 操作 == "保存":
+        st.session_state["保存結果"] = app_sfa.save_meisai_as_json(st.session_state["見積No"], {"明細リスト": []})
+    elif 操作 == "読み込み":
+        app_sfa.auto_load_json_by_estimate_no(st.session_state["読み込む見積No"], auto_rerun=False)
+
+
+@pytest.fixture(autouse=True)
+def restore_main_module(monkeypatch):
+    """AppTest は __main__ をテスト用スクリプトに差し替えるため、終了後に元に戻す
+    （spawn で起動するプロセスが __main__ を読み込み直すため）"""
+    monkeypatch.setitem(sys.modules, "__main__", sys.modules["__main__"])
+
+
+@pytest.fixture
+def data_folder(tmp_path, monkeypatch):
+    """アプリの data/ を一時フォルダにする（DATA_FOLDER は相対パス）"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path / "data"
+
+
+def _session(**状態):
+    at = AppTest.from_function(estimate_script)
+    for key, value in 状態.items():
+        at.session_state[key] = value
+    return at
+
+
+def _run(at, 操作):
+    at.session_state["操作"] = 操作
+    at.run()
+    assert not at.exception
+    return at
+
+
+def _read(data_folder, 見積No):
+    with open(data_folder / f"{見積No}.json", "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_同じ番号を表示していた2つのセッションが保存しても上書きしない(data_folder):
+    a = _run(_session(案件名="案件A"), "新規")
+    b = _run(_session(案件名="案件B"), "新規")
+    assert a.session_state["見積No"] == b.session_state["見積No"] == "20240401001"
+
+    _run(a, "保存")
+    _run(b, "保存")
+
+    assert a.session_state["見積No"] == "20240401001"
+    assert b.session_state["見積No"] == "20240401002"
+    assert _read(data_folder, "20240401001")["案件名"] == "案件A"
+    assert _read(data_folder, "20240401002")["案件名"] == "案件B"
+
+
+def test_保存済みの見積は同じ番号で上書き保存する(data_folder):
+    a = _run(_run(_session(案件名="案件A"), "新規"), "保存")
+    a.session_state["案件名"] = "案件A（修正）"
+    _run(a, "保存")
+
+    assert a.session_state["見積No"] == "20240401001"
+    assert _read(data_folder, "20240401001")["案件名"] == "案件A（修正）"
+    assert sorted(name for name in os.listdir(data_folder) if name.startswith("2024")) == ["20240401001.json"]
+
+
+def test_読み込んだ見積は同じ番号で上書き保存する(data_folder):
+    _run(_run(_session(案件名="案件A"), "新規"), "保存")
+
+    b = _run(_session(読み込む見積No="20240401001"), "読み込み")
+    assert b.session_state["案件名"] == "案件A"
+    b.session_state["案件名"] = "別のセッションで修正"
+    _run(b, "保存")
+
+    assert b.session_state["見積No"] == "20240401001"
+    assert _read(data_folder, "20240401001")["案件名"] == "別のセッションで修正"
+
+
+def _detail_frame():
+    import app_sfa
+
+    明細リスト = [
+        {"品名": "映像編集", "数量": 2, "単位": "式", "係数": 1.5, "単価": 10000, "金額": 30000, "分類": False},
+        {"品名": "管理費（10%）", "数量": 1, "単位": "式", "係数": 2, "単価": 3000, "金額": 3000, "分類": False,
+         "管理費パーセンテージ": "10"},
+    ]
+    return 明細リスト, app_sfa.build_detail_frame(明細リスト)
+
+
+def test_一括編集は係数機能が無効なら係数を掛けずに金額を計算する():
+    import app_sfa
+
+    明細リスト, 明細_df = _detail_frame()
+    明細_df.loc[0, "数量"] = 3
+
+    新明細リスト = app_sfa.apply_detail_frame(明細リスト, 明細_df, 係数機能使用=False)
+
+    # 係数は保持するが金額には掛けない
+    assert 新明細リスト[0]["係数"] == 1.5
+    assert 新明細リスト[0]["金額"] == 30000
+
+
+def test_一括編集は係数機能が有効なら係数を掛けて金額を計算する():
+    import app_sfa
+
+    明細リスト, 明細_df = _detail_frame()
+    明細_df.loc[0, "数量"] = 3
+
+    新明細リスト = app_sfa.apply_detail_frame(明細リスト, 明細_df, 係数機能使用=True)
+
+    assert 新明細リスト[0]["係数"] == 1.5
+    assert 新明細リスト[0]["金額"] == 45000
+
+
+@pytest.mark.parametrize("係数機能使用", [False, True])
+def test_一括編集は管理費の行の単価と金額を表の入力で変えない(係数機能使用):
+    import app_sfa
+
+    明細リスト, 明細_df = _detail_frame()
+    明細_df.loc[1, "単価"] = 99999
+
+    管理費 = app_sfa.apply_detail_frame(明細リスト, 明細_df, 係数機能使用)[1]
+
+    assert 管理費["管理費パーセンテージ"] == "10"
+    assert 管理費["係数"] == 2
+    assert (管理費["単価"], 管理費["金額"]) == (3000, 3000)
@@ -0,0 +1,106 @@
+# 見積書の一括出力のテスト
+import os
+import zipfile
+
+import pytest
+
+import bulk_export
+from bulk_export import build_export_data, export_estimates_zip, make_export_filename
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(autouse=True)
+def repo_root(monkeypatch):
+    """テンプレートはカレントディレクトリから読み込むためリポジトリ直下で実行"""
+    monkeypatch.chdir(REPO_ROOT)
+
+
+@pytest.fixture
+def shared_executor():
+    """テスト用のプロセスプール（終了時に破棄）"""
+    yield
+    if bulk_export._executor is not None:
+        bulk_export._discard_executor(bulk_export._executor)
+
+
+def _見積データ(見積No, 案件名="テスト案件", **項目):
+    return build_export_data({
+        "見積No": 見積No,
+        "案件名": 案件名,
+        "発行日": "2024-04-01",
+        "明細リスト": [{"品名": "翻訳", "数量": 1, "単位": "式", "単価": 1000, "金額": 1000}],
+        **項目,
+    })
+
+
+def _names(zip_file):
+    with zipfile.ZipFile(zip_file) as archive:
+        return sorted(archive.namelist())
+
+
+def test_このプロセスで作成してZIPにまとめる():
+    見積データ一覧 = [_見積データ(f"2024040100{i}") for i in range(1, 4)]
+    進捗 = []
+
+    zip_file, 出力件数, エラー一覧 = export_estimates_zip(見積データ一覧, progress=lambda *args: 進捗.append(args))
+
+    with zip_file:
+        assert _names(zip_file) == sorted(make_export_filename(f"2024040100{i}", "テスト案件") for i in range(1, 4))
+    assert 出力件数 == 3
+    assert エラー一覧 == []
+    assert 進捗 == [(1, 3), (2, 3), (3, 3)]
+
+
+def test_同じファイル名には連番を付ける():
+    見積データ一覧 = [_見積データ("20240401001"), _見積データ("20240401001"), _見積データ("20240401001")]
+
+    zip_file, 出力件数, _ = export_estimates_zip(見積データ一覧)
+
+    with zip_file:
+        assert _names(zip_file) == [
+            "20240401001見積書_テスト案件.xlsx",
+            "20240401001見積書_テスト案件_2.xlsx",
+            "20240401001見積書_テスト案件_3.xlsx",
+        ]
+    assert 出力件数 == 3
+
+
+def test_作成できなかった見積はエラー一覧に入れて残りを出力する():
+    見積データ一覧 = [_見積データ("20240401001"), dict(_見積データ("20240401002"), 明細リスト=5)]
+
+    zip_file, 出力件数, エラー一覧 = export_estimates_zip(見積データ一覧)
+
+    with zip_file:
+        assert _names(zip_file) == ["20240401001見積書_テスト案件.xlsx"]
+    assert 出力件数 == 1
+    assert [(見積No, type(e)) for 見積No, e in エラー一覧] == [("20240401002", TypeError)]
+
+
+def test_プロセスプールで作成してZIPにまとめる(shared_executor):
+    見積データ一覧 = [_見積データ(f"202404010{i:02d}") for i in range(1, 10)]
+    見積データ一覧.append(dict(_見積データ("20240401099"), 明細リスト=5))
+
+    zip_file, 出力件数, エラー一覧 = export_estimates_zip(見積データ一覧, max_workers=2)
+
+    with zip_file:
+        assert len(_names(zip_file)) == 9
+    assert 出力件数 == 9
+    assert [見積No for 見積No, _ in エラー一覧] == ["20240401099"]
+    executor = bulk_export._executor
+    assert executor is not None
+
+    # 2回目の出力では同じプロセスプールを使う
+    zip_file, 出力件数, _ = export_estimates_zip(見積データ一覧[:9], max_workers=2)
+    zip_file.close()
+    assert 出力件数 == 9
+    assert bulk_export._executor is executor
+
+
+def test_係数機能の使用有無は保存された値を優先する():
+    係数あり明細 = [{"品名": "翻訳", "数量": 1, "係数": 1.5, "単価": 1000}]
+
+    assert build_export_data({"明細リスト": 係数あり明細})["係数機能使用"] is True
+    assert build_export_data({"明細リスト": 係数あり明細, "係数機能使用": False})["係数機能使用"] is False
+    assert build_export_data({"明細リスト": [], "係数機能使用": True})["係数機能使用"] is True
+    assert build_export_data({"明細リスト": [{"品名": "分類", "分類": True, "係数": 2}]})["係数機能使用"] is False
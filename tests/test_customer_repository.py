@@ -0,0 +1,141 @@
+# 顧客リポジトリのテスト（インデックスによる検索が従来の一覧の線形探索と同じ結果になること）
+import itertools
+
+import pytest
+
+from customer_repository import CustomerRepository, get_customer_repository
+
+
+def _顧客(顧客No, 会社名, 部署名, 担当者, **項目):
+    return {"顧客No": 顧客No, "顧客会社名": 会社名, "顧客部署名": 部署名, "顧客担当者": 担当者, **項目}
+
+
+# 全角・半角の空白の違い、同じ会社の複数の担当者、部署違いの同名担当者、重複登録、顧客Noなしを含める
+顧客一覧 = [
+    _顧客(1, "株式会社テスト", "営業部", "山田 太郎", 住所1="東京都千代田区"),
+    _顧客(1, "株式会社テスト", "制作部", "山田 太郎", 住所1="東京都港区"),
+    _顧客(1, "株式会社テスト", "営業部", "山田　太郎"),
+    _顧客(1, "株式会社テスト", "", "佐藤"),
+    _顧客(2, "株式会社 テスト", "営業部", "山田 太郎"),
+    _顧客(2, "株式会社 テスト", "営業部", "山田 太郎", 住所1="重複登録"),
+    _顧客(3, "株式会社　テスト", "", "鈴木"),
+    {"顧客会社名": "顧客Noなし商事", "顧客部署名": "", "顧客担当者": "高橋"},
+]
+
+会社名一覧 = ["株式会社テスト", "株式会社 テスト", "株式会社　テスト", "顧客Noなし商事", "未登録の会社"]
+部署名一覧 = ["営業部", "制作部", ""]
+担当者一覧 = ["山田 太郎", "山田　太郎", "山田太郎", "佐藤", "鈴木", "高橋"]
+
+
+def _old_position(customers, 会社名, 部署名, 担当者):
+    """従来の更新・削除の検索（一覧を先頭から探索）"""
+    for i, customer in enumerate(customers):
+        if (customer.get("顧客会社名") == 会社名 and
+                customer.get("顧客部署名") == 部署名 and
+                customer.get("顧客担当者") == 担当者):
+            return i
+    return None
+
+
+def _old_find_by_contact(customers, 会社名, 担当者):
+    """従来の住所の引き当て（会社名・担当者が一致する最初の顧客）"""
+    for customer in customers:
+        if customer.get("顧客会社名") == 会社名 and customer.get("顧客担当者") == 担当者:
+            return customer
+    return None
+
+
+def _old_customer_no(customers, 会社名, 除外位置=None):
+    """従来の顧客Noの採番（同一会社の顧客Noを使い、新しい会社は会社数 + 1）"""
+    対象 = [c for i, c in enumerate(customers) if i != 除外位置]
+    同一会社の顧客 = [c for c in 対象 if c.get("顧客会社名") == 会社名]
+    if 同一会社の顧客:
+        return 同一会社の顧客[0].get("顧客No", 1)
+    return len(set(c.get("顧客会社名") for c in 対象)) + 1
+
+
+@pytest.fixture(scope="module")
+def repository():
+    return CustomerRepository(顧客一覧)
+
+
+@pytest.mark.parametrize("会社名, 部署名, 担当者", list(itertools.product(会社名一覧, 部署名一覧, 担当者一覧)))
+def test_重複チェックと位置の検索は線形探索と一致する(repository, 会社名, 部署名, 担当者):
+    期待 = _old_position(顧客一覧, 会社名, 部署名, 担当者)
+
+    assert repository.position(会社名, 部署名, 担当者) == 期待
+    assert repository.exists(会社名, 部署名, 担当者) == (期待 is not None)
+
+
+@pytest.mark.parametrize("会社名, 担当者", list(itertools.product(会社名一覧, 担当者一覧)))
+def test_会社名と担当者による検索は線形探索と一致する(repository, 会社名, 担当者):
+    assert repository.find_by_contact(会社名, 担当者) == _old_find_by_contact(顧客一覧, 会社名, 担当者)
+
+
+@pytest.mark.parametrize("会社名", 会社名一覧)
+def test_新規登録の顧客Noは線形探索と一致する(repository, 会社名):
+    期待 = _old_customer_no(顧客一覧, 会社名)
+
+    顧客No = repository.customer_no_for_company(会社名)
+    if 顧客No is None:
+        顧客No = repository.next_customer_no()
+    assert 顧客No == 期待
+
+
+# 会社名を変更しない場合は顧客Noを引き継ぐため、別の会社へ移る組み合わせのみ
+@pytest.mark.parametrize("移動元位置, 移動先会社名", [
+    (位置, 会社名) for 位置, 会社名 in itertools.product(range(len(顧客一覧)), 会社名一覧)
+    if 会社名 != 顧客一覧[位置]["顧客会社名"]
+])
+def test_会社を変更したときの顧客Noは線形探索と一致する(repository, 移動元位置, 移動先会社名):
+    移動元 = 顧客一覧[移動元位置]
+    期待 = _old_customer_no(顧客一覧, 移動先会社名, 除外位置=移動元位置)
+
+    顧客No = repository.customer_no_for_company(移動先会社名)
+    if 顧客No is None:
+        顧客No = repository.next_customer_no(移動元会社名=移動元["顧客会社名"])
+    assert 顧客No == 期待
+
+
+def test_空白の違う会社名や担当者は別の顧客として扱う(repository):
+    # 表記の違う会社・担当者を同じ顧客にまとめない（従来どおり完全一致）
+    assert repository.find_by_contact("株式会社テスト", "山田 太郎")["住所1"] == "東京都千代田区"
+    assert repository.find_by_contact("株式会社テスト", "山田　太郎") == 顧客一覧[2]
+    assert repository.find_by_contact("株式会社テスト", "山田太郎") is None
+    assert repository.customer_no_for_company("株式会社　テスト") == 3
+
+
+def test_部署名のない顧客は部署名が空の顧客として検索する():
+    # 部署名の項目がない古い形式の顧客も、部署名が空の顧客として更新・削除できる
+    repository = CustomerRepository([{"顧客会社名": "A社", "顧客担当者": "山田"}])
+
+    assert repository.position("A社", "", "山田") == 0
+    assert repository.position("A社", None, "山田") == 0
+    assert repository.exists("A社", "", "山田")
+
+
+def test_取得した一覧を変更してもキャッシュに影響しない(repository):
+    customers = repository.all()
+    customers[0]["顧客会社名"] = "変更"
+    repository.find_by_contact("株式会社テスト", "山田 太郎")["顧客会社名"] = "変更"
+
+    assert repository.all() == 顧客一覧
+    assert len(repository) == len(顧客一覧)
+
+
+def test_元データが変更された場合のみ読み込み直す(tmp_path):
+    path = tmp_path / "customers.json"
+    path.write_text("[]", encoding="utf-8")
+    読み込み回数 = []
+
+    def load_customers():
+        読み込み回数.append(1)
+        return [_顧客(1, "A社", "", "山田")]
+
+    first = get_customer_repository([str(path), str(tmp_path / "customers.json.journal")], load_customers)
+    assert get_customer_repository([str(path), str(tmp_path / "customers.json.journal")], load_customers) is first
+    assert len(読み込み回数) == 1
+
+    (tmp_path / "customers.json.journal").write_text("{}\n", encoding="utf-8")
+    assert get_customer_repository([str(path), str(tmp_path / "customers.json.journal")], load_customers) is not first
+    assert len(読み込み回数) == 2
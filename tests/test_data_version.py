@@ -0,0 +1,92 @@
+# データバージョン（保存のたびに増える共有の値）のテスト
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from data_version import bump_data_version, get_data_version
+
+
+@pytest.fixture
+def app_data_folder(tmp_path, monkeypatch):
+    """アプリの data/ を一時フォルダにする（DATA_FOLDER は相対パス）"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path / "data"
+
+
+def test_保存のたびに1つ増える(tmp_path):
+    data_folder = str(tmp_path / "data")
+
+    assert get_data_version(data_folder) == 0
+    assert bump_data_version(data_folder) == 1
+    assert bump_data_version(data_folder) == 2
+    assert get_data_version(data_folder) == 2
+
+
+def test_壊れている場合は0から数え直す(tmp_path):
+    (tmp_path / "_data_version").write_text("壊れた値", encoding="utf-8")
+
+    assert get_data_version(str(tmp_path)) == 0
+    assert bump_data_version(str(tmp_path)) == 1
+
+
+def test_同時に増やしても取りこぼさない_スレッド(tmp_path):
+    data_folder = str(tmp_path)
+    回数 = 50
+
+    def bump():
+        for _ in range(回数):
+            bump_data_version(data_folder)
+
+    threads = [threading.Thread(target=bump) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert get_data_version(data_folder) == 8 * 回数
+
+
+def test_同時に増やしても取りこぼさない_プロセス(tmp_path):
+    data_folder = str(tmp_path)
+
+    with ProcessPoolExecutor(max_workers=4, mp_context=multiprocessing.get_context("spawn")) as executor:
+        versions = list(executor.map(bump_data_version, [data_folder] * 40))
+
+    # 各保存が異なるバージョンを受け取る
+    assert sorted(versions) == list(range(1, 41))
+    assert get_data_version(data_folder) == 40
+
+
+def test_見積の保存と削除でデータバージョンが増える(app_data_folder):
+    import app_sfa
+
+    assert app_sfa.current_data_version() == 0
+
+    app_sfa.write_estimate_data("20240401001", {"見積No": "20240401001", "案件名": "案件A", "明細リスト": []})
+    assert app_sfa.current_data_version() == 1
+
+    app_sfa.write_estimate_data("20240401001", {"見積No": "20240401001", "案件名": "案件A（修正）", "明細リスト": []})
+    assert app_sfa.current_data_version() == 2
+
+    assert app_sfa.delete_estimate_data("20240401001")
+    assert app_sfa.current_data_version() == 3
+
+    # 存在しない見積の削除では増やさない
+    assert not app_sfa.delete_estimate_data("20240401001")
+    assert app_sfa.current_data_version() == 3
+
+
+def test_SQLite版でも見積の保存と削除でデータバージョンが増える(app_data_folder, monkeypatch):
+    import app_sfa
+
+    monkeypatch.setattr(app_sfa, "STORAGE_BACKEND", "sqlite")
+    monkeypatch.setattr(app_sfa, "SQLITE_DB_PATH", str(app_data_folder / "sfa.db"))
+
+    app_sfa.write_estimate_data("20240401001", {"見積No": "20240401001", "案件名": "案件A", "明細リスト": []})
+    assert app_sfa.current_data_version() == 1
+
+    assert app_sfa.delete_estimate_data("20240401001")
+    assert not app_sfa.delete_estimate_data("20240401001")
+    assert app_sfa.current_data_version() == 2
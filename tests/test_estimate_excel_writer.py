@@ -0,0 +1,263 @@
+# 見積書の出力（テンプレート・出力結果のキャッシュ）のテスト
+import io
+import os
+import datetime
+import shutil
+from collections import OrderedDict
+
+import pytest
+from openpyxl import load_workbook
+
+import estimate_excel_writer
+from estimate_excel_writer import export_cache_key, write_estimate_to_excel
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(autouse=True)
+def empty_export_cache(monkeypatch):
+    """テストごとに空の出力結果キャッシュを使う"""
+    monkeypatch.setattr(estimate_excel_writer, "_export_cache", OrderedDict())
+    monkeypatch.setattr(estimate_excel_writer, "_export_cache_size", 0)
+
+
+@pytest.fixture
+def template_path(tmp_path):
+    path = tmp_path / "estimate_template.xlsx"
+    shutil.copy(os.path.join(REPO_ROOT, "estimate_template.xlsx"), path)
+    return str(path)
+
+
+def _見積データ(**項目):
+    return {
+        "見積No": "20240401001",
+        "案件名": "テスト案件",
+        "発行日": datetime.date(2024, 4, 1),
+        "顧客会社名": "テスト商事",
+        "明細リスト": [{"品名": "翻訳", "数量": 1, "単位": "式", "単価": 1000, "金額": 1000, "商品番号": 1}],
+        "係数機能使用": False,
+        **項目,
+    }
+
+
+def test_キャッシュキーは項目の順序に依存しない(template_path):
+    見積データ = _見積データ()
+    逆順 = dict(reversed(list(見積データ.items())))
+
+    assert export_cache_key(見積データ, template_path) == export_cache_key(逆順, template_path)
+    assert export_cache_key(見積データ, template_path) == export_cache_key(_見積データ(), template_path)
+
+
+def test_内容やテンプレートが変わるとキャッシュキーが変わる(template_path):
+    キー = export_cache_key(_見積データ(), template_path)
+
+    assert export_cache_key(_見積データ(案件名="別の案件"), template_path) != キー
+    assert export_cache_key(_見積データ(発行日=datetime.date(2024, 4, 2)), template_path) != キー
+
+    stat_result = os.stat(template_path)
+    os.utime(template_path, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns + 1_000_000_000))
+    assert export_cache_key(_見積データ(), template_path) != キー
+
+
+def test_上限を超えると使われていない順に破棄する(monkeypatch):
+    monkeypatch.setattr(estimate_excel_writer, "EXPORT_CACHE_MAX_BYTES", 30)
+    put = estimate_excel_writer._put_cached_export
+    get = estimate_excel_writer._get_cached_export
+
+    put("a", b"a" * 10)
+    put("b", b"b" * 10)
+    put("c", b"c" * 10)
+    # a を使うと b が最も長く使われていないものになる
+    assert get("a") == b"a" * 10
+    put("d", b"d" * 10)
+
+    assert get("b") is None
+    assert [get(key) is not None for key in ("a", "c", "d")] == [True, True, True]
+    assert estimate_excel_writer._export_cache_size == 30
+
+    # 同じキーの置き換えはサイズを二重に数えない
+    put("a", b"A" * 5)
+    assert estimate_excel_writer._export_cache_size == 25
+
+    # 上限より大きいものは保持しない
+    put("e", b"e" * 31)
+    assert get("e") is None
+    assert estimate_excel_writer._export_cache_size == 25
+
+
+def test_同じ見積は作成し直さずにキャッシュから返す(monkeypatch):
+    monkeypatch.chdir(REPO_ROOT)
+
+    file_data = write_estimate_to_excel(_見積データ(), as_bytes=True)
+
+    assert file_data[:2] == b"PK"
+    assert write_estimate_to_excel(_見積データ(), as_bytes=True) is file_data
+    assert write_estimate_to_excel(_見積データ(案件名="別の案件"), as_bytes=True) is not file_data
+
+
+def test_控えを指定した場合はキャッシュから返すときも書き込む(monkeypatch, tmp_path):
+    monkeypatch.chdir(REPO_ROOT)
+    file_data = write_estimate_to_excel(_見積データ(), as_bytes=True)
+
+    archive_path = tmp_path / "archive" / "控え.xlsx"
+    write_estimate_to_excel(_見積データ(), as_bytes=True, archive_path=str(archive_path))
+
+    assert archive_path.read_bytes() == file_data
+
+
+def _詳細な見積データ(係数機能使用):
+    明細リスト = [{"品名": "字幕関係", "分類": True}]
+    明細リスト += [
+        {"品名": f"字幕翻訳{i}", "数量": i, "単位": "分", "係数": 1.5 if i % 2 else 1, "単価": 1000 * i,
+         "金額": 1000 * i * i, "備考": f"備考{i}", "商品番号": i}
+        for i in range(1, 15)
+    ]
+    明細リスト.append({"品名": "無償対応", "数量": 1, "単位": "式", "係数": 1, "単価": 0, "金額": 0})
+    return _見積データ(
+        顧客部署名="制作部",
+        顧客担当者="山田 太郎",
+        郵便番号="100-0001",
+        住所1="東京都千代田区千代田1-1",
+        住所2="テストビル5F",
+        発行者名="佐藤",
+        備考="納期は別途ご相談",
+        明細リスト=明細リスト,
+        係数機能使用=係数機能使用,
+    )
+
+
+def _workbook_cells(file_data):
+    """ブックの全シートのセルの値・書式と、結合範囲・列幅・行の高さ"""
+    wb = load_workbook(io.BytesIO(file_data))
+    result = {}
+    for ws in wb.worksheets:
+        result[ws.title] = {
+            "cells": {
+                cell.coordinate: (
+                    cell.value, cell.number_format, repr(cell.font), repr(cell.fill),
+                    repr(cell.border), repr(cell.alignment), repr(cell.protection),
+                )
+                for row in ws.iter_rows() for cell in row
+            },
+            "merged": sorted(str(merged) for merged in ws.merged_cells.ranges),
+            "columns": {key: dimension.width for key, dimension in ws.column_dimensions.items()},
+            "rows": {key: dimension.height for key, dimension in ws.row_dimensions.items()},
+        }
+    return result
+
+
+@pytest.fixture
+def templates(tmp_path, monkeypatch):
+    """両方のテンプレートを置いた一時フォルダで、空のテンプレートキャッシュを使う"""
+    for filename in ("estimate_template.xlsx", "estimate_templat_keisuu.xlsx"):
+        shutil.copy(os.path.join(REPO_ROOT, filename), tmp_path / filename)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(estimate_excel_writer, "_template_cache", {})
+    return tmp_path
+
+
+def _export(見積データ):
+    """出力結果キャッシュを使わずに出力"""
+    estimate_excel_writer._export_cache.clear()
+    estimate_excel_writer._export_cache_size = 0
+    return write_estimate_to_excel(見積データ, as_bytes=True)
+
+
+def _fresh_export(見積データ, monkeypatch):
+    """毎回 load_workbook でテンプレートを解析して出力（キャッシュ導入前と同じ）"""
+    def load_fresh_template(template_path):
+        wb = load_workbook(template_path)
+        return wb, estimate_excel_writer.build_merged_cell_map(wb.active)
+
+    with monkeypatch.context() as m:
+        m.setattr(estimate_excel_writer, "load_template", load_fresh_template)
+        return _export(見積データ)
+
+
+@pytest.mark.parametrize("係数機能使用", [False, True])
+def test_キャッシュしたテンプレートからの出力は毎回解析した出力とセル単位で一致する(templates, monkeypatch, 係数機能使用):
+    見積データ = _詳細な見積データ(係数機能使用)
+    別の見積データ = _見積データ(案件名="別の案件", 係数機能使用=係数機能使用)
+
+    # 原本を書き換えていないこと（前の出力の内容が次の出力に残らない）も確認する
+    出力 = [_export(見積データ), _export(別の見積データ), _export(見積データ)]
+
+    assert len(estimate_excel_writer._template_cache) == 1
+    期待 = _workbook_cells(_fresh_export(見積データ, monkeypatch))
+    assert _workbook_cells(出力[0]) == 期待
+    assert _workbook_cells(出力[2]) == 期待
+    assert _workbook_cells(出力[1]) == _workbook_cells(_fresh_export(別の見積データ, monkeypatch))
+
+
+def test_テンプレートが更新された場合のみ解析し直す(templates, monkeypatch):
+    解析回数 = []
+    original_load_workbook = estimate_excel_writer.load_workbook
+    monkeypatch.setattr(
+        estimate_excel_writer, "load_workbook",
+        lambda path: 解析回数.append(path) or original_load_workbook(path),
+    )
+    _export(_見積データ())
+    _export(_見積データ(案件名="別の案件"))
+    assert len(解析回数) == 1
+
+    # テンプレートを書き換える（更新時刻も変わる）
+    template_path = templates / "estimate_template.xlsx"
+    wb = original_load_workbook(template_path)
+    wb.active["Z60"] = "改訂版"
+    wb.save(template_path)
+    stat_result = os.stat(template_path)
+    os.utime(template_path, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns + 1_000_000_000))
+
+    file_data = _export(_見積データ())
+
+    assert len(解析回数) == 2
+    assert load_workbook(io.BytesIO(file_data)).active["Z60"].value == "改訂版"
+
+    # 内容が同じでも更新時刻が変わった場合は解析し直す
+    stat_result = os.stat(template_path)
+    os.utime(template_path, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns + 1_000_000_000))
+    _export(_見積データ())
+    assert len(解析回数) == 3
+
+
+class _ScanningMergedCells:
+    """結合範囲を毎回すべて調べて左上のセルを求める（対応表の導入前の safe_write と同じ）"""
+
+    def __init__(self, ws):
+        self._ws = ws
+
+    def get(self, cell, default):
+        row, col = cell
+        for merged in self._ws.merged_cells.ranges:
+            if merged.min_row <= row <= merged.max_row and merged.min_col <= col <= merged.max_col:
+                return merged.min_row, merged.min_col
+        return default
+
+
+@pytest.mark.parametrize("filename", ["estimate_template.xlsx", "estimate_templat_keisuu.xlsx"])
+def test_結合セルの対応表は結合範囲の探索と一致する(filename):
+    ws = load_workbook(os.path.join(REPO_ROOT, filename)).active
+    merged_map = estimate_excel_writer.build_merged_cell_map(ws)
+    scanning = _ScanningMergedCells(ws)
+
+    assert ws.merged_cells.ranges
+    for row in range(1, ws.max_row + 2):
+        for col in range(1, ws.max_column + 2):
+            assert merged_map.get((row, col), (row, col)) == scanning.get((row, col), (row, col))
+    # 結合範囲外のセルは対応表に入れない
+    assert len(merged_map) == sum(merged.size["rows"] * merged.size["columns"] for merged in ws.merged_cells.ranges)
+
+
+@pytest.mark.parametrize("係数機能使用", [False, True])
+def test_結合セルの対応表を使った出力は結合範囲を探索した出力とセル単位で一致する(templates, monkeypatch, 係数機能使用):
+    見積データ = _詳細な見積データ(係数機能使用)
+
+    def load_scanning_template(template_path):
+        wb = load_workbook(template_path)
+        return wb, _ScanningMergedCells(wb.active)
+
+    with monkeypatch.context() as m:
+        m.setattr(estimate_excel_writer, "load_template", load_scanning_template)
+        期待 = _workbook_cells(_export(見積データ))
+
+    assert _workbook_cells(_export(見積データ)) == 期待
@@ -0,0 +1,74 @@
+# 見積番号の採番のテスト
+import os
+import json
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from estimate_no_allocator import (
+    SEQUENCE_TABLE_FILENAME,
+    allocate_estimate_no,
+    get_max_sequence,
+    peek_estimate_no,
+    reserve_estimate_no,
+)
+
+発行日 = datetime.date(2024, 4, 1)
+
+
+def _見積を作成(data_folder, 見積No):
+    with open(os.path.join(data_folder, f"{見積No}.json"), "w", encoding="utf-8") as f:
+        json.dump({"見積No": 見積No, "案件名": "テスト", "明細リスト": []}, f, ensure_ascii=False)
+
+
+def test_peekでは採番しない(tmp_path):
+    _見積を作成(tmp_path, "20240401001")
+
+    assert peek_estimate_no(str(tmp_path), 発行日) == "20240401002"
+    assert peek_estimate_no(str(tmp_path), 発行日) == "20240401002"
+    assert not os.path.exists(tmp_path / SEQUENCE_TABLE_FILENAME)
+
+
+def test_reserveで確定した番号は次のpeekで使われない(tmp_path):
+    見積No = peek_estimate_no(str(tmp_path), 発行日)
+
+    assert reserve_estimate_no(str(tmp_path), 見積No) == "20240401001"
+    assert get_max_sequence(str(tmp_path), "20240401") == 1
+    assert peek_estimate_no(str(tmp_path), 発行日) == "20240401002"
+
+
+def test_他のセッションが確定済みの番号は次の番号になる(tmp_path):
+    見積No = peek_estimate_no(str(tmp_path), 発行日)
+    assert reserve_estimate_no(str(tmp_path), 見積No) == "20240401001"
+
+    # 同じ番号を提案されていた別のセッションが保存
+    assert reserve_estimate_no(str(tmp_path), 見積No) == "20240401002"
+
+
+def test_テーブル外で作成された見積と重複しない(tmp_path):
+    reserve_estimate_no(str(tmp_path), "20240401001")
+    _見積を作成(tmp_path, "20240401002")
+
+    assert peek_estimate_no(str(tmp_path), 発行日) == "20240401003"
+    assert reserve_estimate_no(str(tmp_path), "20240401002") == "20240401003"
+
+
+def test_形式の異なる見積番号はそのまま返す(tmp_path):
+    assert reserve_estimate_no(str(tmp_path), "見積A") == "見積A"
+    assert peek_estimate_no(str(tmp_path), None) == ""
+
+
+def test_同時に確定しても同じ番号にならない(tmp_path):
+    提案 = peek_estimate_no(str(tmp_path), 発行日)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        確定 = list(executor.map(lambda _: reserve_estimate_no(str(tmp_path), 提案), range(20)))
+
+    assert sorted(確定) == [f"20240401{連番:03d}" for 連番 in range(1, 21)]
+
+
+def test_同時に採番しても同じ番号にならない(tmp_path):
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        採番 = list(executor.map(lambda _: allocate_estimate_no(str(tmp_path), 発行日), range(20)))
+
+    assert len(set(採番)) == 20
+    assert get_max_sequence(str(tmp_path), "20240401") == 20
@@ -0,0 +1,82 @@
+# 一覧データの追記型ジャーナルのテスト
+import os
+import json
+
+import list_journal
+from list_journal import compact, get_journal_path, load_list, save_list
+
+
+def _reload(path):
+    """プロセス内キャッシュを破棄して読み込む（別プロセスでの読み込みに相当）"""
+    list_journal._states.clear()
+    return load_list(path)
+
+
+def test_保存した内容をジャーナルから復元できる(tmp_path):
+    path = str(tmp_path / "products.json")
+    items = [{"品名": "翻訳", "単価": 1000}, {"品名": "校正", "単価": 500}]
+
+    save_list(path, items)
+    items[1]["単価"] = 600
+    items.append({"品名": "ナレーション", "単価": 3000})
+    save_list(path, items)
+    del items[0]
+    save_list(path, items)
+
+    assert not os.path.exists(path)
+    assert _reload(path) == items
+
+
+def test_差分だけを追記する(tmp_path):
+    path = str(tmp_path / "customers.json")
+    items = [{"顧客会社名": f"会社{i}"} for i in range(100)]
+    save_list(path, items)
+    size = os.path.getsize(get_journal_path(path))
+
+    items[50]["顧客担当者"] = "山田"
+    save_list(path, items)
+    # 変更のない保存は追記しない
+    save_list(path, items)
+
+    with open(get_journal_path(path), "r", encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 2
+    assert os.path.getsize(get_journal_path(path)) - size < size / 10
+    assert _reload(path) == items
+
+
+def test_コンパクション後も同じ内容を読み込める(tmp_path):
+    path = str(tmp_path / "products.json")
+    items = [{"品名": "翻訳"}]
+    save_list(path, items)
+    items.append({"品名": "校正"})
+    save_list(path, items)
+
+    compact(path)
+
+    assert os.path.getsize(get_journal_path(path)) == 0
+    with open(path, "r", encoding="utf-8") as f:
+        assert json.load(f) == items
+    assert _reload(path) == items
+
+    items.append({"品名": "字幕"})
+    save_list(path, items)
+    assert _reload(path) == items
+
+
+def test_本体と一致しないレコードと途切れた行は適用しない(tmp_path):
+    path = str(tmp_path / "products.json")
+    save_list(path, [{"品名": "翻訳"}])
+    compact(path)
+    save_list(path, [{"品名": "翻訳"}, {"品名": "校正"}])
+
+    with open(get_journal_path(path), "a", encoding="utf-8") as f:
+        # コンパクション前の本体に対するレコードと、書き込み途中で途切れた行
+        f.write(json.dumps({"base": None, "splices": [[0, 1, []]]}) + "\n")
+        f.write('{"base": "')
+
+    assert _reload(path) == [{"品名": "翻訳"}, {"品名": "校正"}]
+
+    # 途切れた行の後にも追記できる
+    save_list(path, [{"品名": "校正"}])
+    assert _reload(path) == [{"品名": "校正"}]
@@ -0,0 +1,71 @@
+# 郵便番号辞書のテスト（KEN_ALL.CSV 形式の小さなCSVを作成して使用）
+import os
+
+import pytest
+
+from postal_index import (
+    POSTAL_CSV_FILENAME,
+    build_postal_index,
+    get_postal_index_path,
+    lookup_address,
+    normalize_postal_code,
+)
+
+# 全国地方公共団体コード, 旧郵便番号, 郵便番号, 都道府県名（カナ）, 市区町村名（カナ）, 町域名（カナ）,
+# 都道府県名, 市区町村名, 町域名, 以降のフラグ
+_ROWS = [
+    ["13101", "100  ", "1000001", "ﾄｳｷｮｳﾄ", "ﾁﾖﾀﾞｸ", "ﾁﾖﾀﾞ", "東京都", "千代田区", "千代田", "0", "0", "0", "0", "0", "0"],
+    ["13101", "100  ", "1000000", "ﾄｳｷｮｳﾄ", "ﾁﾖﾀﾞｸ", "ｲｶﾆｹｲｻｲｶﾞﾅｲﾊﾞｱｲ", "東京都", "千代田区", "以下に掲載がない場合", "0", "0", "0", "0", "0", "0"],
+    ["01101", "060  ", "0600042", "ﾎｯｶｲﾄﾞｳ", "ｻｯﾎﾟﾛｼﾁｭｳｵｳｸ", "ｵｵﾄﾞｵﾘﾆｼ", "北海道", "札幌市中央区", "大通西（１～１９丁目）", "1", "0", "1", "0", "0", "0"],
+    # 括弧書きが長く2行に分かれた町域
+    ["27127", "530  ", "5300001", "ｵｵｻｶﾌ", "ｵｵｻｶｼｷﾀｸ", "ｳﾒﾀﾞ", "大阪府", "大阪市北区", "梅田（次のビルを除く", "0", "0", "1", "0", "0", "0"],
+    ["27127", "530  ", "5300001", "ｵｵｻｶﾌ", "ｵｵｻｶｼｷﾀｸ", "ｳﾒﾀﾞ", "大阪府", "大阪市北区", "梅田スカイビル）", "0", "0", "1", "0", "0", "0"],
+    # 1つの郵便番号に複数の町域
+    ["13103", "105  ", "1050011", "ﾄｳｷｮｳﾄ", "ﾐﾅﾄｸ", "ｼﾊﾞｺｳｴﾝ", "東京都", "港区", "芝公園", "0", "0", "1", "0", "0", "0"],
+    ["13103", "105  ", "1050011", "ﾄｳｷｮｳﾄ", "ﾐﾅﾄｸ", "ｼﾊﾞ", "東京都", "港区", "芝", "0", "0", "1", "0", "0", "0"],
+]
+
+
+@pytest.fixture
+def data_folder(tmp_path, monkeypatch):
+    monkeypatch.delenv("SFA_POSTAL_CSV", raising=False)
+    with open(tmp_path / POSTAL_CSV_FILENAME, "w", encoding="cp932", newline="") as f:
+        for row in _ROWS:
+            f.write(",".join(f'"{value}"' for value in row) + "\r\n")
+    return str(tmp_path)
+
+
+def test_郵便番号から住所を引ける(data_folder):
+    assert lookup_address(data_folder, "100-0001") == {"都道府県": "東京都", "市区町村": "千代田区", "町域": "千代田"}
+    assert os.path.exists(get_postal_index_path(data_folder))
+
+
+def test_町域の注記を取り除く(data_folder):
+    assert lookup_address(data_folder, "1000000")["町域"] == ""
+    assert lookup_address(data_folder, "0600042")["町域"] == "大通西"
+    assert lookup_address(data_folder, "5300001") == {"都道府県": "大阪府", "市区町村": "大阪市北区", "町域": "梅田"}
+
+
+def test_複数の町域がある郵便番号は市区町村まで(data_folder):
+    assert lookup_address(data_folder, "1050011") == {"都道府県": "東京都", "市区町村": "港区", "町域": ""}
+
+
+def test_登録のない郵便番号と不正な入力はNone(data_folder):
+    assert lookup_address(data_folder, "9999999") is None
+    assert lookup_address(data_folder, "0000000") is None
+    assert lookup_address(data_folder, "123") is None
+
+
+def test_全角やハイフンを含む入力を正規化する():
+    assert normalize_postal_code("〒１００－０００１") == "1000001"
+    assert normalize_postal_code("100 0001") == "1000001"
+    assert normalize_postal_code("1000") is None
+
+
+def test_CSVがない場合はNone(tmp_path, monkeypatch):
+    monkeypatch.delenv("SFA_POSTAL_CSV", raising=False)
+    assert lookup_address(str(tmp_path), "1000001") is None
+
+
+def test_インデックスの件数(data_folder, tmp_path):
+    assert build_postal_index(os.path.join(data_folder, POSTAL_CSV_FILENAME), str(tmp_path / "index.bin")) == 5
@@ -0,0 +1,160 @@
+# 過去単価の統計（単価の提案）のテスト
+import os
+
+import pytest
+
+import price_history
+from list_journal import get_journal_path
+from price_history import (
+    extract_prices,
+    get_price_history_path,
+    load_price_table,
+    remove_estimate,
+    update_estimate,
+)
+
+
+def _見積(顧客会社名, 発行日, *明細):
+    return {
+        "顧客会社名": 顧客会社名,
+        "発行日": 発行日,
+        "明細リスト": [{"品名": 品名, "単位": 単位, "単価": 単価} for 品名, 単位, 単価 in 明細],
+    }
+
+
+見積一覧 = {
+    "20240401001": _見積("A社", "2024-04-01", ("字幕翻訳", "分", 1000), ("校正", "式", 5000)),
+    "20240501001": _見積("A社", "2024-05-01", ("字幕翻訳（英語）", "分", 1200)),
+    "20240601001": _見積("B社", "2024-06-01", ("字幕翻訳", "分", 800)),
+    "20240701001": _見積("B社", "2024-07-01", ("字幕翻訳", "分", 900), ("字幕翻訳", "分", 2000)),
+}
+シグネチャ一覧 = {key: [1] for key in 見積一覧}
+
+
+def _reload():
+    """プロセス内キャッシュを破棄（再起動後の読み込みに相当）"""
+    price_history._index._states.clear()
+
+
+def _unreadable(key):
+    raise AssertionError(f"変更のない見積を読み込み直した: {key}")
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    _reload()
+    yield
+    _reload()
+
+
+def test_集計対象外の明細は取り出さない():
+    data = {
+        "顧客会社名": "A社",
+        "発行日": "2024-04-01",
+        "明細リスト": [
+            {"品名": "翻訳関係", "分類": True},
+            {"品名": "管理費（10%）", "単価": 300, "管理費パーセンテージ": "10"},
+            {"品名": "無償対応", "単価": 0},
+            {"品名": "字幕翻訳（英語）", "単位": "分", "単価": "1000"},
+        ],
+    }
+
+    assert extract_prices(data) == [["字幕翻訳", "分", "A社", 1000.0, "2024-04-01"]]
+    assert extract_prices(None) == []
+
+
+def test_顧客別の前回単価を優先して提案する(tmp_path):
+    table = load_price_table(str(tmp_path), シグネチャ一覧, 見積一覧.get)
+
+    単価, 顧客別, 全体 = table.suggest("字幕翻訳", "分", "A社")
+
+    # 言語指定付きの明細も基本品名で集計し、発行日の新しい明細を前回単価とする（中央値は件数が偶数なら中央の2件の平均）
+    assert 単価 == 1200
+    assert 顧客別 == {"件数": 2, "中央値": 1100, "最小": 1000, "最大": 1200, "前回単価": 1200, "前回発行日": "2024-05-01"}
+    assert 全体["件数"] == 5
+
+
+def test_顧客別の記録がない場合は全顧客の中央値を提案する(tmp_path):
+    table = load_price_table(str(tmp_path), シグネチャ一覧, 見積一覧.get)
+
+    単価, 顧客別, 全体 = table.suggest("字幕翻訳", "分", "C社")
+
+    assert 単価 == 1000
+    assert 顧客別 is None
+    assert 全体 == {"件数": 5, "中央値": 1000, "最小": 800, "最大": 2000, "前回単価": 900, "前回発行日": "2024-07-01"}
+    assert table.stats("字幕翻訳", "分", "B社")["中央値"] == 900
+    # 単位が違う場合・記録がない場合は提案しない
+    assert table.suggest("字幕翻訳", "式", "A社") == (None, None, None)
+    assert table.suggest("ナレーション", "分") == (None, None, None)
+
+
+def test_削除した見積の単価は提案から外れる(tmp_path):
+    data_folder = str(tmp_path)
+    load_price_table(data_folder, シグネチャ一覧, 見積一覧.get)
+
+    remove_estimate(data_folder, "20240501001")
+    remove_estimate(data_folder, "20240401001")
+    シグネチャ = {key: value for key, value in シグネチャ一覧.items() if key not in ("20240401001", "20240501001")}
+    table = load_price_table(data_folder, シグネチャ, _unreadable)
+
+    assert table.stats("字幕翻訳", "分", "A社") is None
+    assert table.stats("校正", "式") is None
+    assert table.suggest("字幕翻訳", "分", "A社") == (900, None, table.stats("字幕翻訳", "分"))
+    assert table.stats("字幕翻訳", "分")["件数"] == 3
+
+
+def test_上書き保存した見積は前回の単価と入れ替える(tmp_path):
+    data_folder = str(tmp_path)
+    load_price_table(data_folder, シグネチャ一覧, 見積一覧.get)
+
+    update_estimate(data_folder, "20240701001", _見積("B社", "2024-07-01", ("字幕翻訳", "分", 950)), [2])
+    table = load_price_table(data_folder, {**シグネチャ一覧, "20240701001": [2]}, _unreadable)
+
+    assert table.stats("字幕翻訳", "分", "B社") == {
+        "件数": 2, "中央値": 875, "最小": 800, "最大": 950, "前回単価": 950, "前回発行日": "2024-07-01",
+    }
+
+
+def test_再起動後は付随インデックスから表を作り直す(tmp_path):
+    data_folder = str(tmp_path)
+    load_price_table(data_folder, シグネチャ一覧, 見積一覧.get)
+    update_estimate(data_folder, "20240801001", _見積("A社", "2024-08-01", ("字幕翻訳", "分", 1500)), [1])
+    remove_estimate(data_folder, "20240601001")
+    シグネチャ = {**シグネチャ一覧, "20240801001": [1]}
+    del シグネチャ["20240601001"]
+    期待 = load_price_table(data_folder, シグネチャ, _unreadable)
+
+    # 本体ファイル＋ジャーナルから、見積を読み込み直さずに同じ表を作る
+    _reload()
+    assert load_price_table(data_folder, シグネチャ, _unreadable)._table == 期待._table
+
+    # ジャーナルを本体に畳み込んだ後も同じ
+    price_history._index.compact(data_folder)
+    assert os.path.getsize(get_journal_path(get_price_history_path(data_folder))) == 0
+    _reload()
+    table = load_price_table(data_folder, シグネチャ, _unreadable)
+    assert table._table == 期待._table
+    assert table.suggest("字幕翻訳", "分", "A社")[0] == 1500
+
+
+def test_アプリ外で変更された見積だけを集計し直す(tmp_path):
+    data_folder = str(tmp_path)
+    load_price_table(data_folder, シグネチャ一覧, 見積一覧.get)
+    _reload()
+    読み込み = []
+
+    def read_document(key):
+        読み込み.append(key)
+        return _見積("B社", "2024-06-01", ("字幕翻訳", "分", 700))
+
+    table = load_price_table(data_folder, {**シグネチャ一覧, "20240601001": [2]}, read_document)
+
+    assert 読み込み == ["20240601001"]
+    assert table.stats("字幕翻訳", "分", "B社")["最小"] == 700
+
+
+def test_表はキャッシュと共有しない(tmp_path):
+    table = load_price_table(str(tmp_path), シグネチャ一覧, 見積一覧.get)
+    table._table["字幕翻訳\t分\t"].clear()
+
+    assert load_price_table(str(tmp_path), シグネチャ一覧, _unreadable).stats("字幕翻訳", "分")["件数"] == 5
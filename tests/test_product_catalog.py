@@ -0,0 +1,113 @@
+# 商品カタログ（品名の検索・使用回数）のテスト
+import pytest
+
+import product_catalog
+from product_catalog import ProductCatalog, load_usage_counts, remove_usage, update_usage
+
+商品一覧 = [
+    {"品名": "字幕翻訳", "単価": 1000},
+    {"品名": "翻訳チェック", "単価": 500},
+    {"品名": "映像翻訳", "単価": 2000},
+    {"品名": "ナレーション", "単価": 3000},
+    {"品名": "翻訳", "単価": 800},
+    {"品名": "", "単価": 0},
+]
+
+
+def _見積(*品名一覧):
+    return {"明細リスト": [{"品名": 品名} for 品名 in 品名一覧]}
+
+
+def _reload():
+    """プロセス内キャッシュを破棄（再起動後の読み込みに相当）"""
+    product_catalog._index._states.clear()
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    _reload()
+    yield
+    _reload()
+
+
+def test_前方一致を優先し使用回数の多い順に並べる():
+    catalog = ProductCatalog(商品一覧, {"映像翻訳": 5, "字幕翻訳": 2, "翻訳チェック": 1})
+
+    # 前方一致（翻訳・翻訳チェック）の後に部分一致を使用回数順、同数は一覧の順
+    assert catalog.search("翻訳") == ["翻訳チェック", "翻訳", "映像翻訳", "字幕翻訳"]
+    assert catalog.search("翻訳", limit=2) == ["翻訳チェック", "翻訳"]
+    assert catalog.search("チェック") == ["翻訳チェック"]
+    assert catalog.search("翻訳チェックA") == []
+
+
+def test_検索語が空の場合は品名のある全商品を使用回数順に返す():
+    catalog = ProductCatalog(商品一覧, {"ナレーション": 3, "翻訳": 1})
+
+    assert catalog.search() == ["ナレーション", "翻訳", "字幕翻訳", "翻訳チェック", "映像翻訳"]
+    assert catalog.search("　 ") == catalog.search()
+    assert catalog.search("", limit=1) == ["ナレーション"]
+
+
+def test_1文字の検索語はその文字を含む品名に一致する():
+    catalog = ProductCatalog(商品一覧, {"映像翻訳": 1})
+
+    assert catalog.search("訳") == ["映像翻訳", "字幕翻訳", "翻訳チェック", "翻訳"]
+    assert catalog.search("ナ") == ["ナレーション"]
+    # 全角・半角や大文字・小文字の違いは正規化して比較
+    assert ProductCatalog([{"品名": "ＭＡ作業"}]).search("m") == ["ＭＡ作業"]
+    assert catalog.search("無") == []
+
+
+def test_一覧にない品名の使用回数は言語を除いた品名で数える():
+    catalog = ProductCatalog(商品一覧, {"字幕翻訳（英語）": 2, "字幕翻訳（中国語）": 1, "未登録の品名": 10})
+
+    assert catalog.usage("字幕翻訳") == 3
+    assert catalog.usage("未登録の品名") == 0
+    assert catalog.search("翻訳")[:2] == ["翻訳チェック", "翻訳"]
+    assert catalog.search("字幕") == ["字幕翻訳"]
+
+
+def test_保存と削除で使用回数と検索順が変わる(tmp_path):
+    data_folder = str(tmp_path)
+    見積一覧 = {"20240401001": _見積("字幕翻訳", "字幕翻訳", "翻訳")}
+    シグネチャ一覧 = {"20240401001": [1]}
+
+    使用回数 = load_usage_counts(data_folder, シグネチャ一覧, 見積一覧.get)
+    assert 使用回数 == {"字幕翻訳": 2, "翻訳": 1}
+    assert ProductCatalog(商品一覧, 使用回数).search("翻訳") == ["翻訳", "翻訳チェック", "字幕翻訳", "映像翻訳"]
+
+    # 保存：新しい見積の分を加算し、上書きした見積は前回の分を差し引く
+    update_usage(data_folder, "20240401002", _見積("映像翻訳", "映像翻訳", "映像翻訳"), [2])
+    update_usage(data_folder, "20240401001", _見積("翻訳チェック"), [3])
+    シグネチャ一覧 = {"20240401001": [3], "20240401002": [2]}
+    _reload()
+
+    使用回数 = load_usage_counts(data_folder, シグネチャ一覧, lambda key: pytest.fail(f"保存済みの見積を読み込み直した: {key}"))
+    assert 使用回数 == {"映像翻訳": 3, "翻訳チェック": 1}
+    assert ProductCatalog(商品一覧, 使用回数).search("翻訳") == ["翻訳チェック", "翻訳", "映像翻訳", "字幕翻訳"]
+
+    # 削除：見積の分を差し引く（0になった品名は消える）
+    remove_usage(data_folder, "20240401002")
+    del シグネチャ一覧["20240401002"]
+    _reload()
+
+    使用回数 = load_usage_counts(data_folder, シグネチャ一覧, lambda key: pytest.fail(f"保存済みの見積を読み込み直した: {key}"))
+    assert 使用回数 == {"翻訳チェック": 1}
+    assert ProductCatalog(商品一覧, 使用回数).search("翻訳") == ["翻訳チェック", "翻訳", "字幕翻訳", "映像翻訳"]
+
+
+def test_アプリ外で変更された見積だけを数え直す(tmp_path):
+    data_folder = str(tmp_path)
+    見積一覧 = {"20240401001": _見積("翻訳"), "20240401002": _見積("ナレーション")}
+    load_usage_counts(data_folder, {"20240401001": [1], "20240401002": [1]}, 見積一覧.get)
+
+    読み込み = []
+
+    def read_document(key):
+        読み込み.append(key)
+        return _見積("翻訳", "翻訳")
+
+    使用回数 = load_usage_counts(data_folder, {"20240401001": [2]}, read_document)
+
+    assert 読み込み == ["20240401001"]
+    assert 使用回数 == {"翻訳": 2}
@@ -0,0 +1,100 @@
+# 品名の分類のテスト
+# 事前コンパイル・メモ化した判定が、移行前に app_sfa.py で毎回評価していた
+# 正規表現による判定と同じ結果になることを確認する。
+import re
+
+import pytest
+
+from product_classifier import (
+    classify_catalog,
+    extract_base_product_and_language,
+    extract_base_product_and_percentage,
+    is_language_specified,
+    is_management_fee_product,
+    is_single_language_product,
+    is_translation_product,
+)
+
+
+# 移行前の判定（app_sfa.py から転記）
+def old_is_language_specified(product_name):
+    matches = re.findall(r'（(.+?)）', product_name)
+    if not matches:
+        return False
+    language_patterns = [
+        r'.+→.+',
+        r'^(英語|中国語|韓国語|タイ語|ベトナム語|フランス語|ドイツ語|スペイン語|ポルトガル語|イタリア語|ロシア語|アラビア語|ヒンディー語|インドネシア語|マレー語|日本語).*$'
+    ]
+    for match in matches:
+        for pattern in language_patterns:
+            if re.match(pattern, match):
+                return True
+    return False
+
+
+def old_is_translation_product(product_name):
+    if old_is_language_specified(product_name):
+        return False
+    translation_keywords = ["字幕翻訳", "文書翻訳", "通訳", "同時通訳", "逐次通訳"]
+    return any(keyword in product_name for keyword in translation_keywords)
+
+
+def old_is_single_language_product(product_name):
+    if old_is_language_specified(product_name):
+        return False
+    single_language_keywords = [
+        "翻訳準備費", "言語監修", "編集者", "文字起こし", "SRT作成",
+        "ナレーター派遣", "編集者派遣"
+    ]
+    return any(keyword in product_name for keyword in single_language_keywords)
+
+
+def old_extract_base_product_and_language(product_name):
+    # 移行前は言語の種類を確認していたが、どの分岐でも同じ値を返していた
+    match = re.match(r'^(.+?)（(.+?)）$', product_name)
+    if match:
+        return match.group(1), match.group(2)
+    return product_name, ""
+
+
+def old_is_management_fee_product(product_name):
+    management_fee_keywords = ["管理費", "手数料", "事務手数料", "システム利用料", "処理手数料"]
+    return any(keyword in product_name for keyword in management_fee_keywords)
+
+
+def old_extract_base_product_and_percentage(product_name):
+    match = re.match(r'^(.+?)（(.+?)%）$', product_name)
+    if match:
+        return match.group(1), match.group(2)
+    return product_name, ""
+
+
+品名一覧 = [
+    "", "制作進行", "ディレクション", "専用辞書制作（日本語）", "翻訳準備費（専用辞書制作など）",
+    "翻訳準備費", "翻訳準備費（英語）", "字幕翻訳", "字幕翻訳（日本語→英語）", "字幕翻訳（英語→日本語）（修正）",
+    "文書翻訳（日本語→中国語(簡体字)）", "同時通訳者派遣（全日）", "同時通訳者派遣（全日）（日本語→英語）",
+    "逐次通訳者派遣（半日）", "文字起こし", "文字起こし（日本語）", "文字起こし（英語版）", "SRT作成",
+    "ナレーター派遣（全日）", "編集者派遣", "編集者", "言語監修（フランス語）", "言語監修（その他）",
+    "管理費", "管理費（10%）", "管理費（7.5%）", "事務手数料（5%）", "システム利用料", "処理手数料（%）",
+    "手数料（英語）", "（英語）", "字幕翻訳（", "字幕翻訳）", "通訳（→）", "通訳（日本語→）", "機材費（10%）",
+]
+
+
+@pytest.mark.parametrize("品名", 品名一覧)
+def test_移行前の判定と同じ結果になる(品名):
+    assert is_language_specified(品名) == old_is_language_specified(品名)
+    assert is_translation_product(品名) == old_is_translation_product(品名)
+    assert is_single_language_product(品名) == old_is_single_language_product(品名)
+    assert is_management_fee_product(品名) == old_is_management_fee_product(品名)
+    assert extract_base_product_and_language(品名) == old_extract_base_product_and_language(品名)
+    assert extract_base_product_and_percentage(品名) == old_extract_base_product_and_percentage(品名)
+
+
+def test_商品一覧をまとめて分類できる():
+    分類結果 = classify_catalog(品名一覧)
+
+    assert set(分類結果) == set(品名一覧)
+    assert 分類結果["字幕翻訳"].翻訳
+    assert not 分類結果["字幕翻訳（日本語→英語）"].翻訳
+    assert 分類結果["字幕翻訳（日本語→英語）"].言語指定済み
+
@@ -0,0 +1,120 @@
+# 案件一覧のフィルタ・統計（DataFrame版）が従来の案件ごとのループと同じ結果になることのテスト
+import datetime
+import itertools
+
+import pytest
+
+import app_sfa
+
+
+def _baseline_filter(案件リスト, 売上年度, 売上月, 顧客, 発行者, 担当部署, 状況含む, 状況除く, 検索キーワード):
+    """従来の render_project_list_tab のフィルタ処理（案件ごとのループ）"""
+    フィルタ済み案件 = 案件リスト.copy()
+
+    if 売上年度 != "すべて" or 売上月 != "すべて":
+        フィルタ済み案件 = []
+        for 案件 in 案件リスト:
+            if not 案件["納品日"]:
+                continue
+
+            納品日 = 案件["納品日"]
+            案件年度 = 納品日.year if 納品日.month >= 4 else 納品日.year - 1
+
+            年度一致 = True
+            if 売上年度 != "すべて":
+                年度一致 = (案件年度 == int(売上年度.replace("年度", "")))
+
+            月一致 = True
+            if 売上月 != "すべて":
+                月一致 = (納品日.month == int(売上月.replace("月", "")))
+
+            if 年度一致 and 月一致:
+                フィルタ済み案件.append(案件)
+
+    if 発行者 != "すべて":
+        フィルタ済み案件 = [案件 for 案件 in フィルタ済み案件 if 案件["発行者名"] == 発行者]
+    if 顧客 != "すべて":
+        フィルタ済み案件 = [案件 for 案件 in フィルタ済み案件 if 案件["顧客会社名"] == 顧客]
+    if 担当部署 != "すべて":
+        フィルタ済み案件 = [案件 for 案件 in フィルタ済み案件 if 案件.get("担当部署") == 担当部署]
+    if 状況含む:
+        フィルタ済み案件 = [案件 for 案件 in フィルタ済み案件 if 案件["状況"] in 状況含む]
+    if 状況除く:
+        フィルタ済み案件 = [案件 for 案件 in フィルタ済み案件 if 案件["状況"] not in 状況除く]
+    if 検索キーワード:
+        フィルタ済み案件 = [案件 for 案件 in フィルタ済み案件 if 検索キーワード in 案件["案件名"]]
+    return フィルタ済み案件
+
+
+def _baseline_summary(フィルタ済み案件):
+    """従来の統計情報の計算"""
+    return {
+        "案件数": len(フィルタ済み案件),
+        "見積中件数": len([案件 for 案件 in フィルタ済み案件 if 案件["状況"] == "見積中"]),
+        "請求済み件数": len([案件 for 案件 in フィルタ済み案件 if 案件["状況"] == "請求済"]),
+        "売上見込み": sum(案件["売上額"] for 案件 in フィルタ済み案件 if 案件["状況"] in ["受注", "納品済", "請求済"]),
+        "売上合計": sum(案件["売上額"] for 案件 in フィルタ済み案件 if 案件["状況"] == "請求済"),
+    }
+
+
+def _案件(番号, 案件名, 納品日, 状況, 担当部署, 売上額, 顧客会社名="A社", 発行者名="山田"):
+    return {
+        "JSONファイル": f"2024040100{番号}.json",
+        "案件名": 案件名,
+        "顧客会社名": 顧客会社名,
+        "発行者名": 発行者名,
+        "担当部署": 担当部署,
+        "状況": 状況,
+        "納品日": 納品日,
+        "売上額": 売上額,
+    }
+
+
+# 年度の境目（3月・4月）、納品日なし、担当部署なし、想定外の状況、0円〜高額の売上額を含める
+案件リスト = [
+    _案件(1, "映像制作 春", datetime.date(2024, 4, 1), "見積中", "映像制作部", 0),
+    _案件(2, "映像制作 年度末", datetime.date(2024, 3, 31), "受注", "映像制作部", 150000),
+    _案件(3, "翻訳 年度末", datetime.date(2025, 3, 15), "請求済", "翻訳制作部", 1200000, 顧客会社名="B社"),
+    _案件(4, "翻訳 納品日なし", None, "請求済", "翻訳制作部", 98000),
+    _案件(5, "字幕 部署なし", datetime.date(2024, 12, 24), "納品済", None, 45000, 発行者名="佐藤"),
+    _案件(6, "字幕 高額", datetime.date(2024, 4, 30), "請求済", "字幕展開部", 123456789, 顧客会社名="B社"),
+    _案件(7, "生字幕 失注", datetime.date(2023, 7, 1), "失注", "生字幕制作部", 30000, 発行者名="佐藤"),
+    _案件(8, "完プロ 保留", datetime.date(2024, 4, 2), "保留", "完プロ制作部", 500),
+    _案件(9, "完プロ 不採用", None, "不採用", "", 0, 顧客会社名="", 発行者名=""),
+]
+
+条件一覧 = list(itertools.product(
+    ["すべて", "2024年度", "2023年度", "2022年度"],
+    ["すべて", "3月", "4月", "12月"],
+    [("すべて", "すべて", "すべて"), ("B社", "すべて", "すべて"), ("すべて", "佐藤", "すべて"), ("すべて", "すべて", "翻訳制作部")],
+    [([], []), (["請求済"], []), ([], ["失注", "不採用"]), (["受注", "納品済", "請求済"], ["請求済"]), (["保留"], [])],
+    ["", "字幕", "翻訳 年度末", "該当なし"],
+))
+
+
+@pytest.fixture(scope="module")
+def 案件一覧_df():
+    return app_sfa.build_project_frame(案件リスト)
+
+
+@pytest.mark.parametrize("売上年度, 売上月, 顧客発行者部署, 状況, 検索キーワード", 条件一覧)
+def test_DataFrameのフィルタと統計が従来のループと一致する(案件一覧_df, 売上年度, 売上月, 顧客発行者部署, 状況, 検索キーワード):
+    顧客, 発行者, 担当部署 = 顧客発行者部署
+    状況含む, 状況除く = 状況
+    期待 = _baseline_filter(案件リスト, 売上年度, 売上月, 顧客, 発行者, 担当部署, 状況含む, 状況除く, 検索キーワード)
+
+    # キーワード検索は全文検索のスコアで絞り込むため、案件名に含む案件に同じスコアを付けて渡す
+    検索スコア = None
+    if 検索キーワード:
+        検索スコア = {
+            str(案件["JSONファイル"])[:-len(".json")]: 1.0
+            for 案件 in 案件リスト if 検索キーワード in 案件["案件名"]
+        }
+
+    結果_df = app_sfa.filter_project_frame(
+        案件一覧_df, 売上年度=売上年度, 売上月=売上月, 顧客=顧客, 発行者=発行者, 担当部署=担当部署,
+        状況含む=状況含む, 状況除く=状況除く, 検索スコア=検索スコア,
+    )
+
+    assert [案件リスト[位置] for 位置 in 結果_df["位置"]] == 期待
+    assert app_sfa.summarize_project_frame(結果_df) == _baseline_summary(期待)
@@ -0,0 +1,232 @@
+# 明細の集計（管理費の再計算）と案件サマリーインデックスのテスト
+import os
+import json
+import pathlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+import project_index
+from project_index import (
+    calculate_detail_totals,
+    get_index_path,
+    load_project_index,
+    recalculate_detail_list,
+    remove_project_summary,
+    upsert_project_summary,
+)
+
+
+def _明細(品名, 数量, 単価, **項目):
+    return {"品名": 品名, "数量": 数量, "単価": 単価, "金額": 数量 * 単価, **項目}
+
+
+def test_管理費は上位明細の編集後の合計から再計算される():
+    明細リスト = [
+        _明細("翻訳", 2, 1000),
+        _明細("管理費10%", 1, 200, 管理費パーセンテージ=10),
+    ]
+
+    # 上の明細の数量を変更（管理費の行は古い単価のまま）
+    明細リスト[0]["数量"] = 3
+    明細リスト[0]["金額"] = 3000
+
+    明細合計, _, 明細件数 = recalculate_detail_list(明細リスト)
+
+    assert 明細リスト[1]["単価"] == 300
+    assert 明細リスト[1]["金額"] == 300
+    assert 明細リスト[1]["管理費ベース金額"] == 3000
+    assert 明細合計 == 3300
+    assert 明細件数 == 2
+
+
+def test_下の管理費は上の管理費も対象にする():
+    明細リスト = [
+        _明細("翻訳", 2, 1000),
+        _明細("管理費10%", 1, 0, 管理費パーセンテージ=10),
+        _明細("諸経費5%", 1, 0, 管理費パーセンテージ=5),
+    ]
+
+    明細合計, _, _ = recalculate_detail_list(明細リスト)
+
+    assert 明細リスト[1]["金額"] == 200
+    assert 明細リスト[2]["単価"] == 110
+    assert 明細合計 == 2310
+
+
+def test_分類行は集計から除外し部署別に集計する():
+    明細リスト = [
+        {"品名": "翻訳関係", "分類": True},
+        _明細("翻訳", 1, 1000, 売上先部署="営業部"),
+        _明細("校正", 1, 500),
+        _明細("管理費10%", 1, 0, 管理費パーセンテージ=10, 係数=2),
+    ]
+
+    明細合計, 部署別集計, 明細件数 = recalculate_detail_list(明細リスト, 担当部署="制作部", 係数機能使用=True)
+
+    assert 明細リスト[3]["金額"] == 300
+    assert 明細合計 == 1800
+    assert 部署別集計 == {"営業部": 1000, "制作部": 800}
+    assert 明細件数 == 3
+    assert calculate_detail_totals(明細リスト, "制作部") == (明細合計, 部署別集計, 明細件数)
+
+
+def test_係数機能が無効なら管理費の金額に係数を掛けない():
+    明細リスト = [
+        _明細("翻訳", 1, 1000, 係数=1.5),
+        _明細("管理費10%", 1, 0, 管理費パーセンテージ=10, 係数=2),
+    ]
+
+    明細合計, _, _ = recalculate_detail_list(明細リスト)
+
+    assert 明細リスト[1]["係数"] == 2
+    assert (明細リスト[1]["単価"], 明細リスト[1]["金額"]) == (100, 100)
+    assert 明細合計 == 1100
+
+    明細合計, _, _ = recalculate_detail_list(明細リスト, 係数機能使用=True)
+
+    assert 明細リスト[1]["金額"] == 200
+    assert 明細合計 == 1200
+
+
+def _write_estimate(data_folder, filename, data):
+    path = data_folder / filename
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    return path
+
+
+def _案件(見積No, **項目):
+    return {"見積No": 見積No, "案件名": f"案件{見積No}", "明細リスト": [_明細("翻訳", 1, 1000)], **項目}
+
+
+def _upsert_in_process(data_folder, 番号):
+    """別のプロセスで見積を保存してサマリーを反映"""
+    見積No = f"20240401{番号:03d}"
+    _write_estimate(pathlib.Path(data_folder), f"{見積No}.json", _案件(見積No))
+    upsert_project_summary(data_folder, _案件(見積No), f"{見積No}.json")
+
+
+def _persisted(data_folder):
+    with open(get_index_path(str(data_folder)), "r", encoding="utf-8") as f:
+        return json.load(f)["projects"]
+
+
+@pytest.fixture
+def data_folder(tmp_path):
+    project_index._caches.clear()
+    yield tmp_path
+    project_index._caches.clear()
+
+
+def test_変更されたファイルだけを読み込み直す(data_folder, monkeypatch):
+    _write_estimate(data_folder, "20240401001.json", _案件("20240401001"))
+    path = _write_estimate(data_folder, "20240401002.json", _案件("20240401002"))
+    load_project_index(str(data_folder))
+
+    読み込み = []
+    parse = project_index._parse_estimate_file
+    monkeypatch.setattr(project_index, "_parse_estimate_file",
+                        lambda folder, filename: 読み込み.append(filename) or parse(folder, filename))
+    _write_estimate(data_folder, "20240401002.json", _案件("20240401002", 案件名="変更後", 状況="受注"))
+    os.utime(path, ns=(0, 10 ** 9))
+
+    records, errors = load_project_index(str(data_folder))
+
+    assert 読み込み == ["20240401002.json"]
+    assert errors == []
+    assert records["20240401002"]["案件名"] == "変更後"
+    assert records["20240401002"]["シグネチャ"] == project_index.file_signature(os.stat(path))
+    assert _persisted(data_folder)["20240401002"]["案件名"] == "変更後"
+
+
+def test_削除されたファイルのサマリーを外す(data_folder):
+    _write_estimate(data_folder, "20240401001.json", _案件("20240401001"))
+    _write_estimate(data_folder, "20240401002.json", _案件("20240401002"))
+    load_project_index(str(data_folder))
+
+    os.remove(data_folder / "20240401001.json")
+    records, _ = load_project_index(str(data_folder))
+
+    assert sorted(records) == ["20240401002"]
+    assert sorted(_persisted(data_folder)) == ["20240401002"]
+
+
+def test_読み込めないファイルはエラー一覧に入れ修正されたら読み込む(data_folder):
+    _write_estimate(data_folder, "20240401001.json", _案件("20240401001"))
+    path = data_folder / "20240401002.json"
+    path.write_text("{壊れたJSON", encoding="utf-8")
+    # 見積データでないファイル・管理用ファイルは一覧にもエラーにも入れない
+    _write_estimate(data_folder, "20240401003.json", ["見積ではない"])
+    _write_estimate(data_folder, "_settings.json", {"key": "value"})
+
+    records, errors = load_project_index(str(data_folder))
+
+    assert sorted(records) == ["20240401001"]
+    assert [filename for filename, _ in errors] == ["20240401002.json"]
+    assert isinstance(errors[0][1], ValueError)
+
+    # 変更されていない壊れたファイルは読み込み直さずにエラーを返し続ける
+    assert [filename for filename, _ in load_project_index(str(data_folder))[1]] == ["20240401002.json"]
+
+    _write_estimate(data_folder, "20240401002.json", _案件("20240401002"))
+    os.utime(path, ns=(0, 10 ** 9))
+    records, errors = load_project_index(str(data_folder))
+
+    assert sorted(records) == ["20240401001", "20240401002"]
+    assert errors == []
+
+
+def test_読み込めなくなったファイルのサマリーを外す(data_folder):
+    path = _write_estimate(data_folder, "20240401001.json", _案件("20240401001"))
+    load_project_index(str(data_folder))
+
+    path.write_text("{", encoding="utf-8")
+    os.utime(path, ns=(0, 10 ** 9))
+    records, errors = load_project_index(str(data_folder))
+
+    assert records == {}
+    assert [filename for filename, _ in errors] == ["20240401001.json"]
+    assert _persisted(data_folder) == {}
+
+
+def test_再起動後は保存済みのインデックスから変更のないファイルを読み込まない(data_folder, monkeypatch):
+    _write_estimate(data_folder, "20240401001.json", _案件("20240401001"))
+    期待, _ = load_project_index(str(data_folder))
+    project_index._caches.clear()
+    monkeypatch.setattr(project_index, "_parse_estimate_file", lambda folder, filename: pytest.fail(filename))
+
+    assert load_project_index(str(data_folder)) == (期待, [])
+
+
+def test_他のプロセスが反映したサマリーを上書きしない(data_folder):
+    # プロセスAとプロセスBがそれぞれのプロセス内キャッシュを持つ
+    load_project_index(str(data_folder))
+    キャッシュA = dict(project_index._caches)
+    project_index._caches.clear()
+    load_project_index(str(data_folder))
+    キャッシュB = dict(project_index._caches)
+
+    project_index._caches.clear()
+    project_index._caches.update(キャッシュB)
+    _write_estimate(data_folder, "20240401001.json", _案件("20240401001"))
+    upsert_project_summary(str(data_folder), _案件("20240401001"), "20240401001.json")
+
+    project_index._caches.clear()
+    project_index._caches.update(キャッシュA)
+    _write_estimate(data_folder, "20240401002.json", _案件("20240401002"))
+    upsert_project_summary(str(data_folder), _案件("20240401002"), "20240401002.json")
+
+    assert sorted(_persisted(data_folder)) == ["20240401001", "20240401002"]
+
+    remove_project_summary(str(data_folder), "20240401001")
+    assert sorted(_persisted(data_folder)) == ["20240401002"]
+
+
+def test_同時に反映してもサマリーを取りこぼさない(data_folder):
+    件数 = 20
+
+    with ProcessPoolExecutor(max_workers=4, mp_context=multiprocessing.get_context("spawn")) as executor:
+        list(executor.map(_upsert_in_process, [str(data_folder)] * 件数, range(1, 件数 + 1)))
+
+    assert sorted(_persisted(data_folder)) == [f"20240401{番号:03d}" for 番号 in range(1, 件数 + 1)]
@@ -0,0 +1,81 @@
+# 全文検索インデックス（見積ごとの付随インデックス）のテスト
+import os
+
+import pytest
+
+import search_index
+from list_journal import get_journal_path
+from search_index import get_search_index_path, remove_document, search, upsert_document
+
+見積一覧 = {
+    "20240401001": {"案件名": "東京タワー改修", "明細リスト": [{"品名": "字幕翻訳", "備考": ""}]},
+    "20240401002": {"案件名": "大阪城", "顧客会社名": "東京商事"},
+}
+シグネチャ一覧 = {"20240401001": [1, 1, 1], "20240401002": [2, 2, 2]}
+
+
+def _reload():
+    """プロセス内キャッシュを破棄（再起動後の読み込みに相当）"""
+    search_index._index._states.clear()
+
+
+def _unreadable(key):
+    raise AssertionError(f"変更のない見積を読み込み直した: {key}")
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    _reload()
+    yield
+    _reload()
+
+
+def test_項目の重みでスコアを付ける(tmp_path):
+    assert search(str(tmp_path), "東京", シグネチャ一覧, 見積一覧.get) == {"20240401001": 3, "20240401002": 2}
+    assert search(str(tmp_path), "東京 翻訳", シグネチャ一覧, 見積一覧.get) == {"20240401001": 4}
+    assert search(str(tmp_path), "ＴＯＫＹＯ", シグネチャ一覧, 見積一覧.get) == {}
+
+
+def test_変更のない見積は読み込み直さない(tmp_path):
+    search(str(tmp_path), "東京", シグネチャ一覧, 見積一覧.get)
+    _reload()
+
+    assert search(str(tmp_path), "大阪", シグネチャ一覧, _unreadable) == {"20240401002": 3}
+
+
+def test_保存と削除は差分だけをジャーナルに追記する(tmp_path):
+    data_folder = str(tmp_path)
+    search(data_folder, "東京", シグネチャ一覧, 見積一覧.get)
+    journal_path = get_journal_path(get_search_index_path(data_folder))
+    size = os.path.getsize(journal_path)
+
+    upsert_document(data_folder, "20240401003", {"案件名": "東京駅"}, [3, 3, 3])
+    remove_document(data_folder, "20240401001")
+
+    with open(journal_path, "r", encoding="utf-8") as f:
+        assert len(f.read().splitlines()) == 3
+    assert os.path.getsize(journal_path) - size < size
+
+    _reload()
+    シグネチャ = {"20240401002": [2, 2, 2], "20240401003": [3, 3, 3]}
+    assert search(data_folder, "東京", シグネチャ, _unreadable) == {"20240401002": 2, "20240401003": 3}
+
+
+def test_コンパクション後も同じ結果になる(tmp_path):
+    data_folder = str(tmp_path)
+    search(data_folder, "東京", シグネチャ一覧, 見積一覧.get)
+    remove_document(data_folder, "20240401002")
+
+    search_index._index.compact(data_folder)
+
+    assert os.path.getsize(get_journal_path(get_search_index_path(data_folder))) == 0
+    _reload()
+    assert search(data_folder, "東京", {"20240401001": [1, 1, 1]}, _unreadable) == {"20240401001": 3}
+
+
+def test_なくなった見積とシグネチャが変わった見積を反映する(tmp_path):
+    data_folder = str(tmp_path)
+    search(data_folder, "東京", シグネチャ一覧, 見積一覧.get)
+
+    変更後 = {"20240401002": {"案件名": "東京ドーム"}}
+    assert search(data_folder, "東京", {"20240401002": [9, 9, 9]}, 変更後.get) == {"20240401002": 3}
@@ -0,0 +1,174 @@
+# SQLiteストレージのテスト
+import os
+import json
+import datetime
+
+import storage_sqlite
+from list_journal import save_list
+from project_index import load_project_index
+
+
+def _見積(見積No, **項目):
+    data = {
+        "見積No": 見積No,
+        "案件名": f"案件{見積No}",
+        "顧客会社名": "株式会社 テスト",
+        "顧客担当者": "山田 太郎",
+        "発行日": "2024-04-01",
+        "納品日": "2024-05-10",
+        "状況": "受注",
+        "担当部署": "翻訳制作部",
+        "明細リスト": [
+            {"品名": "翻訳", "数量": 2, "単価": 1000, "金額": 2000},
+            {"品名": "校正", "数量": 1, "単価": 500, "金額": 500, "売上先部署": "映像制作部"},
+        ],
+    }
+    data.update(項目)
+    return data
+
+
+def _write_json(data_folder, filename, data):
+    with open(data_folder / filename, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+def test_JSON形式のデータを移行する(tmp_path):
+    data_folder = tmp_path / "data"
+    data_folder.mkdir()
+    _write_json(data_folder, "20240401001.json", _見積("20240401001"))
+    _write_json(data_folder, "20240401002.json", _見積("20240401002", 案件名="案件2"))
+    (data_folder / "20240401003.json").write_text("{壊れたJSON", encoding="utf-8")
+    # 管理用のJSONは取り込まない
+    _write_json(data_folder, "_settings.json", {"key": "value"})
+    # 顧客・商品は追記ジャーナルも適用した内容を取り込む
+    save_list(str(data_folder / "customers.json"), [{"顧客会社名": "A社"}, {"顧客会社名": "B社"}])
+    save_list(str(data_folder / "products.json"), [{"品名": "翻訳", "単価": 1000}])
+    db_path = str(tmp_path / "sfa.db")
+
+    件数, errors = storage_sqlite.migrate_from_json(str(data_folder), db_path)
+
+    assert 件数 == 2
+    assert [filename for filename, _ in errors] == ["20240401003.json"]
+    assert storage_sqlite.read_estimate(db_path, "20240401001") == _見積("20240401001")
+    assert storage_sqlite.read_estimate(db_path, "20240401002")["案件名"] == "案件2"
+    assert storage_sqlite.read_estimate(db_path, "_settings") is None
+    assert storage_sqlite.load_customers(db_path) == [{"顧客会社名": "A社"}, {"顧客会社名": "B社"}]
+    assert storage_sqlite.load_products(db_path) == [{"品名": "翻訳", "単価": 1000}]
+
+
+def test_案件サマリーはJSON版の案件インデックスと同じ内容になる(tmp_path):
+    data_folder = tmp_path / "data"
+    data_folder.mkdir()
+    _write_json(data_folder, "20240401001.json", _見積("20240401001"))
+    _write_json(data_folder, "20240401002.json", _見積("20240401002", 状況="請求済", 納品日=None))
+    db_path = str(tmp_path / "sfa.db")
+    storage_sqlite.migrate_from_json(str(data_folder), db_path)
+
+    サマリー一覧, errors = storage_sqlite.load_project_summaries(db_path)
+    期待, _ = load_project_index(str(data_folder))
+
+    assert errors == []
+    assert sorted(サマリー一覧) == sorted(期待)
+    for 見積No, サマリー in サマリー一覧.items():
+        # シグネチャは保存方式ごとに異なる
+        assert {k: v for k, v in サマリー.items() if k != "シグネチャ"} == {k: v for k, v in 期待[見積No].items() if k != "シグネチャ"}
+    assert サマリー一覧["20240401001"]["明細合計"] == 2500
+    assert サマリー一覧["20240401001"]["部署別集計"] == {"翻訳制作部": 2000, "映像制作部": 500}
+
+
+def test_上書き保存でシグネチャが変わり削除で一覧から外れる(tmp_path):
+    db_path = str(tmp_path / "sfa.db")
+    storage_sqlite.write_estimate(db_path, "20240401001", _見積("20240401001"))
+    シグネチャ = storage_sqlite.load_project_summaries(db_path)[0]["20240401001"]["シグネチャ"]
+
+    storage_sqlite.write_estimate(db_path, "20240401001", _見積("20240401001", 明細リスト=[]))
+
+    サマリー = storage_sqlite.load_project_summaries(db_path)[0]["20240401001"]
+    assert サマリー["シグネチャ"] != シグネチャ
+    assert サマリー["明細件数"] == 0
+    assert storage_sqlite.read_estimate(db_path, "20240401001")["明細リスト"] == []
+
+    assert storage_sqlite.delete_estimate(db_path, "20240401001")
+    assert not storage_sqlite.delete_estimate(db_path, "20240401001")
+    assert not storage_sqlite.estimate_exists(db_path, "20240401001")
+    assert storage_sqlite.load_project_summaries(db_path) == ({}, [])
+
+
+def test_顧客検索は全角半角の空白を無視する(tmp_path):
+    db_path = str(tmp_path / "sfa.db")
+    storage_sqlite.write_estimate(db_path, "20240401001", _見積("20240401001", 顧客会社名="株式会社　テスト", 顧客担当者="山田　太郎"))
+    storage_sqlite.write_estimate(db_path, "20240401002", _見積("20240401002", 顧客会社名="株式会社テスト", 顧客担当者="佐藤"))
+    storage_sqlite.write_estimate(db_path, "20240401003", _見積("20240401003", 顧客会社名="別の会社", 顧客担当者="山田太郎"))
+
+    結果 = storage_sqlite.search_estimates_by_customer(db_path, " 株式会社 テスト ", "山田 太郎")
+
+    assert [サマリー["見積No"] for サマリー in 結果] == ["20240401001"]
+    assert 結果[0]["JSONファイル"] == "20240401001.json"
+
+
+def test_次の見積番号は採番済みと保存済みの大きい方の次になる(tmp_path):
+    db_path = str(tmp_path / "sfa.db")
+    発行日 = datetime.date(2024, 4, 1)
+
+    assert storage_sqlite.peek_estimate_no(db_path, 発行日) == "20240401001"
+    assert storage_sqlite.peek_estimate_no(db_path, None) == ""
+
+    storage_sqlite.write_estimate(db_path, "20240401005", _見積("20240401005"))
+    assert storage_sqlite.peek_estimate_no(db_path, 発行日) == "20240401006"
+
+    assert storage_sqlite.reserve_estimate_no(db_path, "20240401006") == "20240401006"
+    # 表示した番号は採番しても保存されるまで見積には現れない
+    assert storage_sqlite.peek_estimate_no(db_path, 発行日) == "20240401007"
+    # 他の日付の採番には影響しない
+    assert storage_sqlite.peek_estimate_no(db_path, datetime.date(2024, 4, 2)) == "20240402001"
+
+
+def test_同じ番号を確定しようとした2つ目のセッションは次の番号になる(tmp_path):
+    db_path = str(tmp_path / "sfa.db")
+    発行日 = datetime.date(2024, 4, 1)
+    表示番号A = storage_sqlite.peek_estimate_no(db_path, 発行日)
+    表示番号B = storage_sqlite.peek_estimate_no(db_path, 発行日)
+
+    assert storage_sqlite.reserve_estimate_no(db_path, 表示番号A) == "20240401001"
+    assert storage_sqlite.reserve_estimate_no(db_path, 表示番号B) == "20240401002"
+    assert storage_sqlite.allocate_estimate_no(db_path, 発行日) == "20240401003"
+    # 形式が違う見積番号はそのまま
+    assert storage_sqlite.reserve_estimate_no(db_path, "手入力-1") == "手入力-1"
+
+
+def test_DBファイルを削除してもスキーマを作り直す(tmp_path):
+    db_path = str(tmp_path / "sfa.db")
+    storage_sqlite.write_estimate(db_path, "20240401001", _見積("20240401001"))
+
+    for suffix in ["", "-wal", "-shm"]:
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+    storage_sqlite.write_estimate(db_path, "20240401002", _見積("20240401002"))
+    assert sorted(storage_sqlite.load_project_summaries(db_path)[0]) == ["20240401002"]
+
+    # 空のファイルに置き換えられた場合も同じ
+    open(db_path, "w").close()
+    for suffix in ["-wal", "-shm"]:
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    assert storage_sqlite.load_customers(db_path) == []
+    assert storage_sqlite.load_project_summaries(db_path) == ({}, [])
+
+
+def test_SQLite版はデータフォルダがなくても案件一覧を読み込む(tmp_path, monkeypatch):
+    import app_sfa
+
+    # DATA_FOLDER（相対パスの data/）は作らず、DBファイルは別の場所に置く
+    monkeypatch.chdir(tmp_path)
+    db_path = str(tmp_path / "db" / "sfa.db")
+    storage_sqlite.write_estimate(db_path, "20240401001", _見積("20240401001"))
+    monkeypatch.setattr(app_sfa, "STORAGE_BACKEND", "sqlite")
+    monkeypatch.setattr(app_sfa, "SQLITE_DB_PATH", db_path)
+
+    案件リスト, errors = app_sfa.load_all_projects()
+
+    assert not os.path.exists(app_sfa.DATA_FOLDER)
+    assert errors == []
+    assert [案件["見積No"] for 案件 in 案件リスト] == ["20240401001"]
+    assert 案件リスト[0]["納品日"] == datetime.date(2024, 5, 10)